@@ -0,0 +1,339 @@
+import os
+import pandas as pd
+import platform
+import subprocess
+import tempfile
+import time
+
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+from . import estimation, figure_1, figure_2, memo, synthetic, table_1, utils
+
+
+def get_scale_list():
+    scale_ls = [1, 10, 100]
+    return scale_ls
+
+
+def get_base_size_dict():
+    # 1x: 100 households over 6 years, 4 links each
+    size_dd = {
+        "n_households": 100,
+        "n_months": 72,
+        "n_links": 4,
+        "shock_rate": 0.5,
+    }
+    return size_dd
+
+
+def get_result_name():
+    name = "benchmark_results.csv"
+    return name
+
+
+def get_version():
+    try:
+        version = metadata.version("gsba603_replication")
+    except metadata.PackageNotFoundError:
+        version = "unknown"
+    return version
+
+
+def get_commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                cwd=Path(__file__).resolve().parent,
+                                capture_output=True,
+                                text=True,
+                                check=True)
+        commit = output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return commit
+
+
+def get_environment_dict(data_path, export_path):
+    environment_dd = {
+        "BASE_PATH": str(Path(data_path).parent),
+        "CLEAN_PATH": Path(data_path).name,
+        "FILE_PATH": "TreatHS.dta",
+        "DYADS_FILE_PATH": "dyads_es_max.dta",
+        "EXPORT_PATH": str(export_path),
+    }
+    return environment_dd
+
+
+def set_environment(environment_dd):
+    # Returns the previous values so they can be restored
+    previous_dd = {k: os.environ.get(k) for k in list(environment_dd) + ["CACHE_PATH"]}
+    os.environ.pop("CACHE_PATH", None)
+    os.environ.update(environment_dd)
+    return previous_dd
+
+
+def restore_environment(previous_dd):
+    for k, v in previous_dd.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+
+
+def time_stage(record_ls, entry, stage, func, **kwargs):
+    start = time.perf_counter()
+    output = func(**kwargs)
+    seconds = time.perf_counter() - start
+    record_ls.append({"entry": entry, "stage": stage, "seconds": seconds})
+    return output
+
+
+def fit_sample(get_design_cache, dependent_ls, kwargs_dd):
+    design_cache = get_design_cache(dependent_ls=dependent_ls, **kwargs_dd)
+    result_dd = design_cache.fit(dependent_ls=dependent_ls)
+    return design_cache, result_dd
+
+
+def set_cluster_covariance(design_cache, result_dd, clustvar):
+    # Clustered covariance on the design sample of each outcome, one or several clusterings
+    clustvar_ls = utils.get_keep_list(iter_ls=[clustvar])
+    for dv, result in result_dd.items():
+        design = design_cache.get_design(dependent_ls=[dv])
+        codes_ls = [estimation.get_cluster_codes(df=design.df, clustvar=i) for i in clustvar_ls]
+        xu, hessian_inv, k_params = estimation.get_sandwich_arrays(result=result)
+        cov = estimation.cov_cluster_multiway(xu=xu, hessian_inv=hessian_inv, codes_ls=codes_ls, k_params=k_params)
+        result.set_cov(cov=cov)
+    return result_dd
+
+
+def export_figure(module, dependent_ls, result_dd, name):
+    panel_plot = module.generate_plot(dependent_ls=dependent_ls, result_dd=result_dd)
+    utils.export_plot(name=name, panel_plot=panel_plot)
+
+
+def export_table_1(panel_ls, dependent_ls, kwargs_dd):
+    table_ls = list()
+    for panel, df, result_dd in panel_ls:
+        column_ls = [table_1.generate_column(result=result_dd[dv],
+                                             df=df,
+                                             dv=dv,
+                                             treatment=kwargs_dd["treatment"],
+                                             post=kwargs_dd["post"],
+                                             tau=kwargs_dd["tau"])
+                     for dv in dependent_ls]
+        table_ls.append(table_1.format_table(column_ls=column_ls, panel=panel))
+    table_df = pd.concat(table_ls, axis=0)
+    table_1.export_table(name="table_1_benchmark.csv", table_df=table_df)
+
+
+def benchmark_figure_1(method=None):
+    entry = "figure_1"
+    record_ls = list()
+    read_df = time_stage(record_ls=record_ls,
+                         entry=entry,
+                         stage="read",
+                         func=utils.read_data,
+                         columns=figure_1.get_required_columns())
+    df = time_stage(record_ls=record_ls, entry=entry, stage="preprocess", func=figure_1.pre_process_data, df=read_df)
+
+    dependent_ls = figure_1.get_dependent_list()
+    kwargs_dd = figure_1.construct_kwargs_dict(df=df)
+    clustvar = kwargs_dd["clustvar"]
+    kwargs_dd.update({"clustvar": None, "method": method})
+
+    design_cache, result_dd = time_stage(record_ls=record_ls,
+                                         entry=entry,
+                                         stage="fit",
+                                         func=fit_sample,
+                                         get_design_cache=figure_1.get_design_cache,
+                                         dependent_ls=dependent_ls,
+                                         kwargs_dd=kwargs_dd)
+    time_stage(record_ls=record_ls,
+               entry=entry,
+               stage="covariance",
+               func=set_cluster_covariance,
+               design_cache=design_cache,
+               result_dd=result_dd,
+               clustvar=clustvar)
+    time_stage(record_ls=record_ls,
+               entry=entry,
+               stage="export",
+               func=export_figure,
+               module=figure_1,
+               dependent_ls=dependent_ls,
+               result_dd=result_dd,
+               name="figure_1_benchmark.pdf")
+
+    record_df = pd.DataFrame(record_ls)
+    record_df["n_obs"] = df.shape[0]
+    return record_df
+
+
+def benchmark_table_1(method=None):
+    entry = "table_1"
+    record_ls = list()
+    read_df = time_stage(record_ls=record_ls,
+                         entry=entry,
+                         stage="read",
+                         func=utils.read_data,
+                         columns=table_1.get_required_columns())
+    df = time_stage(record_ls=record_ls, entry=entry, stage="preprocess", func=table_1.pre_process_data, df=read_df)
+
+    dependent_ls = table_1.get_dependent_list()
+    kwargs_dd = table_1.construct_kwargs_dict(method=method)
+    clustvar = kwargs_dd["clustvar"]
+    kwargs_dd.update({"clustvar": None})
+
+    # Panel A on first-half shocks, panel B on all shocks
+    panel_ls = list()
+    for panel, panel_df in [("a", utils.filter_first_half_shock(df=df)), ("b", df)]:
+        design_cache, result_dd = time_stage(record_ls=record_ls,
+                                             entry=entry,
+                                             stage="fit",
+                                             func=fit_sample,
+                                             get_design_cache=table_1.get_design_cache,
+                                             dependent_ls=dependent_ls,
+                                             kwargs_dd=dict(kwargs_dd, df=panel_df))
+        time_stage(record_ls=record_ls,
+                   entry=entry,
+                   stage="covariance",
+                   func=set_cluster_covariance,
+                   design_cache=design_cache,
+                   result_dd=result_dd,
+                   clustvar=clustvar)
+        panel_ls.append((panel, panel_df, result_dd))
+
+    time_stage(record_ls=record_ls,
+               entry=entry,
+               stage="export",
+               func=export_table_1,
+               panel_ls=panel_ls,
+               dependent_ls=dependent_ls,
+               kwargs_dd=kwargs_dd)
+
+    # Stages that ran once per panel are reported summed
+    record_df = pd.DataFrame(record_ls)
+    record_df = record_df.groupby(["entry", "stage"], sort=False, as_index=False)["seconds"].sum()
+    record_df["n_obs"] = df.shape[0]
+    return record_df
+
+
+def benchmark_figure_2(method=None):
+    entry = "figure_2"
+    record_ls = list()
+    dependent_ls = figure_2.get_dependent_list()
+    spec_dd = figure_2.construct_kwargs_dict(df=None, method=method)
+    column_ls = figure_2.get_required_columns(dependent_ls=dependent_ls, kwargs_dd=spec_dd)
+
+    read_df = time_stage(record_ls=record_ls,
+                         entry=entry,
+                         stage="read",
+                         func=utils.read_data,
+                         file="dyads_es_max",
+                         columns=column_ls,
+                         chunksize=figure_2.get_chunk_size())
+    df = time_stage(record_ls=record_ls, entry=entry, stage="preprocess", func=figure_2.pre_process_data, df=read_df)
+
+    kwargs_dd = figure_2.construct_kwargs_dict(df=df, method=method)
+    clustvar = kwargs_dd.pop("clustvar")
+    kwargs_dd.pop("cluster")
+
+    design_cache, result_dd = time_stage(record_ls=record_ls,
+                                         entry=entry,
+                                         stage="fit",
+                                         func=fit_sample,
+                                         get_design_cache=figure_2.get_design_cache,
+                                         dependent_ls=dependent_ls,
+                                         kwargs_dd=dict(kwargs_dd, clustvar=clustvar))
+    time_stage(record_ls=record_ls,
+               entry=entry,
+               stage="covariance",
+               func=set_cluster_covariance,
+               design_cache=design_cache,
+               result_dd=result_dd,
+               clustvar=clustvar)
+    time_stage(record_ls=record_ls,
+               entry=entry,
+               stage="export",
+               func=export_figure,
+               module=figure_2,
+               dependent_ls=dependent_ls,
+               result_dd=result_dd,
+               name="figure_2_benchmark.pdf")
+
+    record_df = pd.DataFrame(record_ls)
+    record_df["n_obs"] = df.shape[0]
+    return record_df
+
+
+def get_benchmark_list():
+    benchmark_ls = [
+        benchmark_figure_1,
+        benchmark_table_1,
+        benchmark_figure_2,
+    ]
+    return benchmark_ls
+
+
+def run_scale(scale, path, method=None, seed=0):
+    size_dd = get_base_size_dict()
+    size_dd["n_households"] = size_dd["n_households"] * scale
+
+    data_path = Path(path) / f"scale_{scale}"
+    export_path = data_path / "export"
+    export_path.mkdir(parents=True, exist_ok=True)
+    synthetic.write_synthetic_data(path=data_path, seed=seed, **size_dd)
+
+    environment_dd = get_environment_dict(data_path=data_path, export_path=export_path)
+    previous_dd = set_environment(environment_dd=environment_dd)
+    try:
+        # Every entry point starts cold: the columnar store is built by the first read of each file
+        memo.clear_memory_cache()
+        record_ls = [benchmark(method=method) for benchmark in get_benchmark_list()]
+    finally:
+        restore_environment(previous_dd=previous_dd)
+
+    record_df = pd.concat(record_ls, axis=0, ignore_index=True)
+    record_df["scale"] = scale
+    for k, v in size_dd.items():
+        record_df[k] = v
+    return record_df
+
+
+def record_results(record_df, name=None):
+    # Appended, so runs from different versions can be compared
+    if name is None:
+        name = get_result_name()
+    export_path = utils.get_export_path()
+    if export_path is None:
+        export_path = "."
+    path = Path(export_path) / name
+    record_df.to_csv(path, mode="a", header=not path.exists(), index=False)
+    return path
+
+
+def run_benchmark(scale_ls=None, method=None, seed=0, path=None):
+    if scale_ls is None:
+        scale_ls = get_scale_list()
+
+    method = estimation.get_method(method=method)
+    with tempfile.TemporaryDirectory(dir=path) as tmp_path:
+        record_ls = [run_scale(scale=scale, path=tmp_path, method=method, seed=seed) for scale in scale_ls]
+
+    record_df = pd.concat(record_ls, axis=0, ignore_index=True)
+    record_df["method"] = method
+    record_df["version"] = get_version()
+    record_df["commit"] = get_commit()
+    record_df["python"] = platform.python_version()
+    record_df["timestamp"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    return record_df
+
+
+def main(scale_ls=None, method=None):
+    if method is None:
+        method = "absorb"
+
+    record_df = run_benchmark(scale_ls=scale_ls, method=method)
+    record_results(record_df=record_df)
+    return record_df
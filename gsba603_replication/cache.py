@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+
+def get_cache_version():
+    cache_version = 1
+    return cache_version
+
+
+def get_key(*args):
+    key = hashlib.sha256(repr(args).encode()).hexdigest()
+    return key
+
+
+def get_file_hash(path):
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(block)
+    digest = file_hash.hexdigest()
+    return digest
+
+
+def get_file_stat(path):
+    stat = os.stat(path)
+    stat_dd = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    return stat_dd
+
+
+def _get_manifest_path(store_path):
+    manifest_path = Path(store_path) / "manifest.json"
+    return manifest_path
+
+
+def read_manifest(store_path):
+    manifest_path = _get_manifest_path(store_path=store_path)
+    if not manifest_path.exists():
+        return None
+
+    with open(manifest_path) as f:
+        manifest_dd = json.load(f)
+    return manifest_dd
+
+
+def write_manifest(store_path, manifest_dd):
+    manifest_path = _get_manifest_path(store_path=store_path)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest_dd, f, indent=2)
+
+
+def is_valid(store_path, source_path):
+    manifest_dd = read_manifest(store_path=store_path)
+    if manifest_dd is None:
+        return False
+    if manifest_dd["version"] != get_cache_version():
+        return False
+
+    # Cheap check first, the hash only when the file looks touched
+    stat_dd = get_file_stat(path=source_path)
+    if stat_dd == manifest_dd["stat"]:
+        return True
+    if stat_dd["size"] != manifest_dd["stat"]["size"]:
+        return False
+    if get_file_hash(path=source_path) != manifest_dd["hash"]:
+        return False
+
+    # A read-only store stays valid, the hash is just checked again next time
+    manifest_dd["stat"] = stat_dd
+    try:
+        write_manifest(store_path=store_path, manifest_dd=manifest_dd)
+    except OSError:
+        pass
+    return True
+
+
+def _write_column(store_path, i, ss):
+    column_dd = {"name": ss.name}
+    if isinstance(ss.dtype, pd.CategoricalDtype):
+        column_dd["kind"] = "category"
+        column_dd["ordered"] = bool(ss.cat.ordered)
+        np.save(Path(store_path) / f"{i}.npy", ss.cat.codes.to_numpy())
+        np.save(Path(store_path) / f"{i}_categories.npy", ss.cat.categories.to_numpy(), allow_pickle=True)
+    elif ss.dtype == object:
+        column_dd["kind"] = "object"
+        np.save(Path(store_path) / f"{i}.npy", ss.to_numpy(), allow_pickle=True)
+    else:
+        column_dd["kind"] = "numpy"
+        np.save(Path(store_path) / f"{i}.npy", ss.to_numpy())
+    return column_dd
+
+
+def _read_column(store_path, i, column_dd, mmap_mode=None):
+    # Object columns are always loaded, numeric arrays and category codes can be memory-mapped
+    kind = column_dd["kind"]
+    if kind == "category":
+        codes = np.load(Path(store_path) / f"{i}.npy", mmap_mode=mmap_mode)
+        categories = np.load(Path(store_path) / f"{i}_categories.npy", allow_pickle=True)
+        values = pd.Categorical.from_codes(codes, categories=categories, ordered=column_dd["ordered"])
+    elif kind == "object":
+        values = np.load(Path(store_path) / f"{i}.npy", allow_pickle=True)
+    else:
+        values = np.load(Path(store_path) / f"{i}.npy", mmap_mode=mmap_mode)
+    return values
+
+
+def write_frame(store_path, df, manifest_dd=None):
+    # Build next to the target and swap, so readers never see a half-written store
+    store_path = Path(store_path)
+    tmp_path = store_path.with_name(f"{store_path.name}.tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    column_ls = [_write_column(store_path=tmp_path, i=i, ss=df[name]) for i, name in enumerate(df.columns)]
+    manifest_dd = dict(manifest_dd or dict())
+    manifest_dd.update({
+        "version": get_cache_version(),
+        "n_rows": df.shape[0],
+        "columns": column_ls,
+    })
+
+    # A default index is implied by n_rows, others are kept like a column
+    if not df.index.equals(pd.RangeIndex(df.shape[0])):
+        manifest_dd["index"] = _write_column(store_path=tmp_path, i="index", ss=df.index.to_series())
+    write_manifest(store_path=tmp_path, manifest_dd=manifest_dd)
+
+    if store_path.exists():
+        shutil.rmtree(store_path)
+    os.replace(tmp_path, store_path)
+
+
+def write_store(store_path, source_path, df):
+    manifest_dd = {
+        "source": str(source_path),
+        "stat": get_file_stat(path=source_path),
+        "hash": get_file_hash(path=source_path),
+    }
+    write_frame(store_path=store_path, df=df, manifest_dd=manifest_dd)
+
+
+def _remove_tmp(store_path):
+    store_path = Path(store_path)
+    shutil.rmtree(store_path.with_name(f"{store_path.name}.tmp"), ignore_errors=True)
+
+
+def _concat_parts(part_path, i, part_dd_ls, out_path):
+    # One column at a time: numeric parts are copied into a memory-mapped file, other kinds are joined in memory
+    part_ls = [(f"{i}_{k}", part_dd) for k, part_dd in enumerate(part_dd_ls)]
+    if all(part_dd["kind"] == "numpy" for _, part_dd in part_ls):
+        value_ls = [np.load(part_path / f"{j}.npy", mmap_mode="r") for j, _ in part_ls]
+        dtype = np.result_type(*value_ls) if len(value_ls) > 0 else np.float64
+        n_rows = sum(values.shape[0] for values in value_ls)
+        values = np.lib.format.open_memmap(out_path / f"{i}.npy", mode="w+", dtype=dtype, shape=(n_rows,))
+        start = 0
+        for part in value_ls:
+            values[start:start + part.shape[0]] = part
+            start += part.shape[0]
+        values.flush()
+        del values
+        return {"name": part_dd_ls[0]["name"], "kind": "numpy"}
+
+    ss_ls = [pd.Series(_read_column(store_path=part_path, i=j, column_dd=part_dd)) for j, part_dd in part_ls]
+    ss = pd.concat(ss_ls, ignore_index=True).rename(part_dd_ls[0]["name"])
+    column_dd = _write_column(store_path=out_path, i=i, ss=ss)
+    return column_dd
+
+
+def write_store_chunked(store_path, source_path, chunk_iter):
+    # Each chunk goes to per-column part files, which are then joined column by column, so the full-width frame
+    # is never built
+    store_path = Path(store_path)
+    tmp_path = store_path.with_name(f"{store_path.name}.tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    part_path = tmp_path / "parts"
+    part_path.mkdir(parents=True)
+
+    name_ls = None
+    part_dd_ls_ls = None
+    n_rows = 0
+    for k, chunk in enumerate(chunk_iter):
+        if name_ls is None:
+            name_ls = list(chunk.columns)
+            part_dd_ls_ls = [list() for _ in name_ls]
+        for i, name in enumerate(name_ls):
+            part_dd_ls_ls[i].append(_write_column(store_path=part_path, i=f"{i}_{k}", ss=chunk[name]))
+        n_rows += chunk.shape[0]
+
+    column_ls = [_concat_parts(part_path=part_path, i=i, part_dd_ls=part_dd_ls, out_path=tmp_path)
+                 for i, part_dd_ls in enumerate(part_dd_ls_ls or list())]
+    shutil.rmtree(part_path)
+
+    manifest_dd = {
+        "source": str(source_path),
+        "stat": get_file_stat(path=source_path),
+        "hash": get_file_hash(path=source_path),
+        "version": get_cache_version(),
+        "n_rows": n_rows,
+        "columns": column_ls,
+    }
+    write_manifest(store_path=tmp_path, manifest_dd=manifest_dd)
+
+    if store_path.exists():
+        shutil.rmtree(store_path)
+    os.replace(tmp_path, store_path)
+
+
+def read_store(store_path, columns=None, mmap_mode=None):
+    manifest_dd = read_manifest(store_path=store_path)
+    column_ls = manifest_dd["columns"]
+    name_ls = [i["name"] for i in column_ls]
+    if columns is None:
+        columns = name_ls
+
+    missing_ls = [i for i in columns if i not in name_ls]
+    if len(missing_ls) > 0:
+        msg = f"columns {missing_ls} not in cached file"
+        raise Exception(msg)
+
+    position_dd = {name: i for i, name in enumerate(name_ls)}
+    data_dd = {name: _read_column(store_path=store_path,
+                                  i=position_dd[name],
+                                  column_dd=column_ls[position_dd[name]],
+                                  mmap_mode=mmap_mode)
+               for name in columns}
+
+    index = pd.RangeIndex(manifest_dd["n_rows"])
+    if "index" in manifest_dd:
+        index_dd = manifest_dd["index"]
+        index = pd.Index(_read_column(store_path=store_path, i="index", column_dd=index_dd, mmap_mode=mmap_mode),
+                         name=index_dd["name"])
+
+    # Without copy the columns stay the loaded (or mapped) arrays
+    df = pd.DataFrame(data_dd, index=index, copy=False)
+    return df
+
+
+def read_cached(source_path, store_path, read_func, columns=None, chunk_func=None):
+    # read_func(source_path, columns=...) reads the file, chunk_func(source_path) iterates over it in chunks
+    if is_valid(store_path=store_path, source_path=source_path):
+        df = read_store(store_path=store_path, columns=columns)
+        return df
+
+    if chunk_func is not None:
+        # Built chunk by chunk, so the first read holds one chunk and then only the requested columns
+        try:
+            write_store_chunked(store_path=store_path, source_path=source_path, chunk_iter=chunk_func(source_path))
+        except OSError:
+            # Read-only or shared data mount: the file is read as before, only the columnar copy is skipped
+            _remove_tmp(store_path=store_path)
+            raw_df = read_func(source_path, columns=columns)
+            return raw_df
+        df = read_store(store_path=store_path, columns=columns)
+        return df
+
+    # The full file is parsed once, later reads only load the requested columns
+    raw_df = read_func(source_path)
+    try:
+        write_store(store_path=store_path, source_path=source_path, df=raw_df)
+    except OSError:
+        _remove_tmp(store_path=store_path)
+    if columns is not None:
+        raw_df = raw_df.loc[:, columns]
+    return raw_df
@@ -0,0 +1,111 @@
+import pandas as pd
+
+from patsy import dmatrix
+
+from . import estimation, event_study, utils, wild_bootstrap
+
+
+class Design:
+    def __init__(self, df, formula, fe=None, fe_inter=None, clustvar=None, method=None):
+        method = estimation.get_method(method=method)
+
+        # Patsy evaluates the right-hand side once, every outcome is fitted against the same matrix
+        x_df = dmatrix(formula, data=df, return_type="dataframe")
+        design_info = x_df.design_info
+        if method == "ols":
+            fe_ls = list()
+        else:
+            x_df = x_df.drop(columns="Intercept")
+            fe_ls = estimation.factorize_fe(df=df, fe=fe, fe_inter=fe_inter)
+
+        self.df = df
+        self.formula = formula
+        self.method = method
+        self.x_df = x_df
+        self.design_info = design_info
+        self.name_ls = list(x_df.columns)
+        self.fe_ls = fe_ls
+        self.clustvar = clustvar
+        self.cluster_codes_ls = [estimation.get_cluster_codes(df=df, clustvar=i)
+                                 for i in utils.get_keep_list(iter_ls=[clustvar])]
+
+    @property
+    def nobs(self):
+        return self.x_df.shape[0]
+
+    def get_cluster_codes(self):
+        # One-way clustering is done inside the fit, two-way by the caller
+        if isinstance(self.clustvar, str):
+            return self.cluster_codes_ls[0]
+        return None
+
+    def fit(self, y, tol=None, max_iter=None):
+        # y is a list of outcome columns of the sample, or outcome values aligned with its rows
+        if isinstance(y, list):
+            y = self.df.loc[:, y]
+        elif isinstance(y, pd.Series):
+            y = y.to_frame()
+
+        result_dd = estimation.fit_batch(y=y,
+                                         x=self.x_df,
+                                         fe_ls=self.fe_ls,
+                                         cluster_codes=self.get_cluster_codes(),
+                                         tol=tol,
+                                         max_iter=max_iter,
+                                         method=self.method)
+        return result_dd
+
+
+class DesignCache:
+    def __init__(self, df, formula, encode_func, fe=None, fe_inter=None, clustvar=None, method=None, tol=None):
+        self.df = df
+        self.formula = formula
+        self.encode_func = encode_func
+        self.fe = fe
+        self.fe_inter = fe_inter
+        self.clustvar = clustvar
+        self.method = estimation.get_method(method=method)
+        self.tol = tol
+        self._design_dd = dict()
+
+    def get_design(self, dependent_ls):
+        # Designs are keyed by estimation sample, so outcomes with the same missingness share one
+        mask_ss = self.df.loc[:, dependent_ls].notna().all(axis=1)
+        key = mask_ss.to_numpy().tobytes()
+        if key not in self._design_dd:
+            sample_df = utils.apply_masks(df=self.df, mask_ls=[mask_ss])
+            sample_df = self.encode_func(df=sample_df)
+            self._design_dd[key] = Design(df=sample_df,
+                                          formula=self.formula,
+                                          fe=self.fe,
+                                          fe_inter=self.fe_inter,
+                                          clustvar=self.clustvar,
+                                          method=self.method)
+        design = self._design_dd[key]
+        return design
+
+    def fit(self, dependent_ls, tol=None, max_iter=None, event_term=None, n_wild=None, weight_type=None,
+            wild_seed=None):
+        # With an event term only its coefficients are kept, see event_study.EventStudyResult, n_wild adds wild
+        # cluster bootstrap intervals for them
+        if tol is None:
+            tol = self.tol
+        if n_wild:
+            wild_bootstrap.check_weight_type(weight_type=weight_type)
+
+        result_dd = dict()
+        group_ls = estimation.get_missing_groups(df=self.df, dependent_ls=dependent_ls)
+        for group_dependent_ls in group_ls:
+            design = self.get_design(dependent_ls=group_dependent_ls)
+            group_result_dd = design.fit(y=group_dependent_ls, tol=tol, max_iter=max_iter)
+            if event_term is not None:
+                group_result_dd = event_study.compact_results(design=design,
+                                                              result_dd=group_result_dd,
+                                                              event_term=event_term,
+                                                              n_wild=n_wild,
+                                                              weight_type=weight_type,
+                                                              wild_seed=wild_seed)
+            result_dd.update(group_result_dd)
+
+        result_dd = {dv: result_dd[dv] for dv in dependent_ls}
+        return result_dd
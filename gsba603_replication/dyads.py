@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+
+def get_segment_offsets(sorted_codes, n_segments):
+    # offsets[k]:offsets[k + 1] is the slice of segment k in the sorted order
+    counts = np.bincount(sorted_codes, minlength=n_segments)
+    offsets = np.zeros(n_segments + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def get_dense_codes(codes, n_levels):
+    # Drop unused levels so group counts match a factorization of the column itself, missing values stay -1
+    valid_arr = codes >= 0
+    used = np.bincount(codes[valid_arr], minlength=n_levels) > 0
+    dense_map = np.cumsum(used) - 1
+    dense_codes = np.where(valid_arr, dense_map[codes], -1).astype(np.int32)
+    return dense_codes
+
+
+class DyadPanel:
+    def __init__(self, household_codes, household_j_codes, households, month_codes, months):
+        self.household_codes = household_codes
+        self.household_j_codes = household_j_codes
+        self.households = households
+        self.month_codes = month_codes
+        self.months = months
+        self.n_obs = household_codes.shape[0]
+        self.n_households = households.shape[0]
+
+        # Rows with a missing id or id_j (code -1) are in no dyad, as groupby drops them
+        self.valid_arr = (household_codes >= 0) & (household_j_codes >= 0)
+        valid_index = np.flatnonzero(self.valid_arr)
+
+        # One int64 key per (id, id_j) pair, the panel is sorted by it once
+        dyad_key = household_codes[valid_index].astype(np.int64) * self.n_households + household_j_codes[valid_index]
+        valid_codes, self.dyad_keys = self._factorize_sorted(key=dyad_key)
+        self.n_dyads = self.dyad_keys.shape[0]
+        self.dyad_codes = np.full(self.n_obs, -1, dtype=np.int32)
+        self.dyad_codes[valid_index] = valid_codes
+
+        valid_order = np.argsort(valid_codes, kind="stable")
+        self.dyad_order = valid_index[valid_order]
+        self.dyad_offsets = get_segment_offsets(sorted_codes=valid_codes[valid_order], n_segments=self.n_dyads)
+
+    @staticmethod
+    def _factorize_sorted(key):
+        keys, codes = np.unique(key, return_inverse=True)
+        codes = codes.astype(np.int32)
+        return codes, keys
+
+    @classmethod
+    def from_frame(cls, df, id_col="id", id_j_col="id_j", month_col="month"):
+        # Both sides share one household dictionary so id and id_j codes are comparable
+        id_arr = np.asarray(df[id_col])
+        id_j_arr = np.asarray(df[id_j_col])
+        codes, households = pd.factorize(np.concatenate([id_arr, id_j_arr]), sort=True)
+        codes = codes.astype(np.int32)
+        n_obs = id_arr.shape[0]
+
+        if month_col in df.columns:
+            month_cat = pd.Categorical(df[month_col])
+            month_codes = month_cat.codes.astype(np.int32)
+            months = np.asarray(month_cat.categories)
+        else:
+            month_codes = np.zeros(n_obs, dtype=np.int32)
+            months = np.zeros(1)
+
+        panel = cls(household_codes=codes[:n_obs],
+                    household_j_codes=codes[n_obs:],
+                    households=np.asarray(households),
+                    month_codes=month_codes,
+                    months=months)
+        return panel
+
+    def _reduce(self, values, order, offsets, ufunc):
+        sorted_values = np.asarray(values)[order]
+        counts = np.diff(offsets)
+        reduced = np.zeros(counts.shape[0], dtype=sorted_values.dtype)
+        non_empty = counts > 0
+        reduced[non_empty] = ufunc.reduceat(sorted_values, offsets[:-1][non_empty])
+        return reduced
+
+    def reduce_dyad(self, values, ufunc=np.add):
+        reduced = self._reduce(values=values, order=self.dyad_order, offsets=self.dyad_offsets, ufunc=ufunc)
+        return reduced
+
+    def transform_dyad(self, values, ufunc=np.add):
+        # Broadcast the dyad reduction back to the rows, like groupby(["id", "id_j"]).transform
+        reduced = self.reduce_dyad(values=values, ufunc=ufunc)
+        if self.valid_arr.all():
+            transformed = reduced[self.dyad_codes]
+            return transformed
+
+        # Rows outside every dyad are NaN
+        transformed = np.full(self.n_obs, np.nan)
+        transformed[self.valid_arr] = reduced[self.dyad_codes[self.valid_arr]]
+        return transformed
+
+    def get_cluster_codes(self):
+        codes_1 = get_dense_codes(codes=self.household_codes, n_levels=self.n_households)
+        codes_2 = get_dense_codes(codes=self.household_j_codes, n_levels=self.n_households)
+        return codes_1, codes_2
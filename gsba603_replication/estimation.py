@@ -0,0 +1,540 @@
+import numpy as np
+import pandas as pd
+import scipy as sp
+
+from itertools import combinations
+from patsy import dmatrices
+
+from . import trace
+
+
+def get_method_list():
+    method_ls = ["ols", "absorb", "sparse"]
+    return method_ls
+
+
+def get_method(method):
+    if method is None:
+        method = "ols"
+
+    method_ls = get_method_list()
+    if method not in method_ls:
+        msg = f"method {method} not implemented"
+        raise Exception(msg)
+    return method
+
+
+class EstimationResult:
+    def __init__(self, params, normalized_cov_params, cov, exog, resid, nobs, df_resid, k_params, tss, n_iter,
+                 convergence=None):
+        self.params = params
+        self.normalized_cov_params = normalized_cov_params
+        self.exog = exog
+        self.resid = resid
+        self.nobs = nobs
+        self.df_resid = df_resid
+        self.k_params = k_params
+        self.n_iter = n_iter
+        self.convergence = convergence
+
+        self.ssr = float(resid @ resid)
+        self.rsquared = 1 - self.ssr / tss
+        self.rsquared_adj = 1 - (nobs - 1) / df_resid * (1 - self.rsquared)
+
+        self.set_cov(cov=cov)
+
+    def expand_cov(self, cov):
+        # Omitted columns get NaN rows and columns
+        name_ls = self.params.index
+        keep_ls = name_ls[self.params.notna()]
+        cov_df = pd.DataFrame(cov, index=keep_ls, columns=keep_ls)
+        cov_df = cov_df.reindex(index=name_ls, columns=name_ls)
+        return cov_df
+
+    def set_cov(self, cov):
+        self._cov_df = self.expand_cov(cov=cov)
+        self.bse = pd.Series(np.sqrt(np.diag(self._cov_df)), index=self.params.index)
+
+    def cov_params(self):
+        return self._cov_df
+
+
+def factorize_fe(df, fe, fe_inter=None):
+    if fe is None:
+        fe = list()
+    if not isinstance(fe, list):
+        fe = [fe]
+    if fe_inter is None:
+        fe_inter = list()
+
+    fe_ls = list()
+    for i in fe:
+        codes, levels = pd.factorize(df[i], sort=True)
+        fe_ls.append((codes, len(levels), None))
+
+    # Without plain FE the intercept still has to be absorbed
+    if len(fe_ls) == 0:
+        codes = np.zeros(df.shape[0], dtype=int)
+        fe_ls.append((codes, 1, None))
+
+    # Continuous-by-group slopes, i.e. i:C(j)
+    for i, j in fe_inter:
+        codes, levels = pd.factorize(df[j], sort=True)
+        slope = df[i].to_numpy(dtype=float)
+        fe_ls.append((codes, len(levels), slope))
+    return fe_ls
+
+
+def get_indicator_matrix(codes, n_levels):
+    n_obs = codes.shape[0]
+    data = np.ones(n_obs)
+    row_ind = np.arange(n_obs)
+    indicator = sp.sparse.csr_matrix((data, (row_ind, codes)), shape=(n_obs, n_levels))
+    return indicator
+
+
+def _get_projection(codes, n_levels, slope):
+    indicator = get_indicator_matrix(codes=codes, n_levels=n_levels)
+    if slope is None:
+        denominator = np.bincount(codes, minlength=n_levels)
+    else:
+        denominator = np.bincount(codes, weights=slope ** 2, minlength=n_levels)
+    # Groups without variation (e.g. a slope that is zero within a month) are left untouched
+    denominator = np.where(denominator > 0, denominator, np.inf)
+    return indicator, denominator, slope
+
+
+def _project_out(x, indicator, denominator, slope):
+    if slope is None:
+        means = (indicator.T @ x) / denominator[:, None]
+        x -= indicator @ means
+    else:
+        slopes = (indicator.T @ (slope[:, None] * x)) / denominator[:, None]
+        x -= slope[:, None] * (indicator @ slopes)
+
+
+def demean(x, fe_ls, tol=None, max_iter=None):
+    if tol is None:
+        tol = 1e-10
+    if max_iter is None:
+        max_iter = 10_000
+
+    x = np.asarray(x, dtype=float)
+    is_vector = x.ndim == 1
+    demean_x = x.reshape(x.shape[0], -1).copy()
+    scale = np.maximum(np.abs(demean_x).max(axis=0, initial=0), 1)
+
+    projection_ls = [_get_projection(codes, n_levels, slope) for codes, n_levels, slope in fe_ls]
+
+    # Alternating projections (a single FE converges after one sweep)
+    n_iter = 0
+    while n_iter < max_iter:
+        n_iter += 1
+        previous_x = demean_x.copy()
+        for indicator, denominator, slope in projection_ls:
+            _project_out(x=demean_x, indicator=indicator, denominator=denominator, slope=slope)
+
+        if len(projection_ls) < 2:
+            break
+        change = np.abs(demean_x - previous_x).max(axis=0, initial=0) / scale
+        if change.max(initial=0) < tol:
+            break
+
+    if is_vector:
+        demean_x = demean_x[:, 0]
+    return demean_x, n_iter
+
+
+def demean_weighted(x, fe_ls, weights, tol=None, max_iter=None):
+    # One weighted within transformation per column of weights: returns (n_obs, n_weights, n_columns)
+    if tol is None:
+        tol = 1e-10
+    if max_iter is None:
+        max_iter = 10_000
+
+    x = np.asarray(x, dtype=float).reshape(x.shape[0], -1)
+    n_obs, n_columns = x.shape
+    n_weights = weights.shape[1]
+    demean_x = np.repeat(x[:, None, :], n_weights, axis=1)
+    scale = np.maximum(np.abs(x).max(axis=0, initial=0), 1)
+
+    projection_ls = list()
+    for codes, n_levels, slope in fe_ls:
+        indicator = get_indicator_matrix(codes=codes, n_levels=n_levels)
+        if slope is None:
+            weight_arr = weights
+            denominator = indicator.T @ weights
+        else:
+            weight_arr = weights * slope[:, None]
+            denominator = indicator.T @ (weight_arr * slope[:, None])
+        denominator = np.where(denominator > 0, denominator, np.inf)
+        projection_ls.append((indicator, weight_arr, denominator, slope))
+
+    n_iter = 0
+    while n_iter < max_iter:
+        n_iter += 1
+        previous_x = demean_x.copy()
+        for indicator, weight_arr, denominator, slope in projection_ls:
+            numerator = indicator.T @ (weight_arr[:, :, None] * demean_x).reshape(n_obs, -1)
+            means = numerator.reshape(-1, n_weights, n_columns) / denominator[:, :, None]
+            fitted = (indicator @ means.reshape(means.shape[0], -1)).reshape(n_obs, n_weights, n_columns)
+            if slope is not None:
+                fitted *= slope[:, None, None]
+            demean_x -= fitted
+
+        if len(projection_ls) < 2:
+            break
+        change = np.abs(demean_x - previous_x).max(axis=(0, 1), initial=0) / scale
+        if change.max(initial=0) < tol:
+            break
+    return demean_x, n_iter
+
+
+def solve_weighted(x, y, weights):
+    # Weighted normal equations per replicate; x is (n_obs, n_weights, k) and y is (n_obs, n_weights, m)
+    weight_x = weights[:, :, None] * x
+    gram = np.einsum("nbi,nbj->bij", weight_x, x)
+    moment = np.einsum("nbi,nbm->bim", weight_x, y)
+    beta = np.linalg.pinv(gram, hermitian=True) @ moment
+    return beta
+
+
+def get_fe_design(fe_ls):
+    # Intercept + C(fe) with the first level as reference + fully coded i:C(j), one nonzero per row and term
+    n_obs = fe_ls[0][0].shape[0]
+    block_ls = [sp.sparse.csr_matrix(np.ones((n_obs, 1)))]
+    for codes, n_levels, slope in fe_ls:
+        indicator = get_indicator_matrix(codes=codes, n_levels=n_levels)
+        if slope is None:
+            indicator = indicator[:, 1:]
+        else:
+            indicator = indicator.multiply(slope[:, None])
+        block_ls.append(indicator)
+    fe_design = sp.sparse.hstack(block_ls, format="csr")
+    return fe_design
+
+
+def get_convergence_report(name_ls, solve_ls, tol):
+    # istop 1 and 2 are the LSMR exits within atol and btol, 7 means max_iter was reached
+    report_df = pd.DataFrame([(istop, itn, normr) for _, istop, itn, normr, *_ in solve_ls],
+                             index=name_ls,
+                             columns=["istop", "n_iter", "norm_resid"])
+    report_df["converged"] = report_df["istop"].isin([1, 2])
+    report_df["tol"] = tol
+    return report_df
+
+
+def partial_out_sparse(x, fe_ls, tol=None, max_iter=None, name_ls=None):
+    # Residuals of each column on the sparse FE design, solved by LSMR instead of alternating projections
+    if tol is None:
+        tol = 1e-10
+    if max_iter is None:
+        max_iter = 10_000
+
+    x = np.asarray(x, dtype=float).reshape(x.shape[0], -1)
+    if name_ls is None:
+        name_ls = list(range(x.shape[1]))
+
+    # Unit column norms keep LSMR from stalling on large groups
+    fe_design = get_fe_design(fe_ls=fe_ls)
+    column_norm = np.sqrt(np.asarray(fe_design.multiply(fe_design).sum(axis=0))).ravel()
+    column_norm = np.where(column_norm > 0, column_norm, 1)
+    scale_design = fe_design @ sp.sparse.diags(1 / column_norm)
+
+    solve_ls = [sp.sparse.linalg.lsmr(scale_design, x[:, i], atol=tol, btol=tol, maxiter=max_iter)
+                for i in range(x.shape[1])]
+    fitted = np.column_stack([scale_design @ solve[0] for solve in solve_ls])
+    resid_x = x - fitted
+
+    report_df = get_convergence_report(name_ls=name_ls, solve_ls=solve_ls, tol=tol)
+    n_iter = int(report_df["n_iter"].max())
+    return resid_x, n_iter, report_df
+
+
+def count_fe_columns(fe_ls):
+    # Columns patsy would build for Intercept + C(fe_1) + ... + i:C(j), the slopes being fully coded
+    if len(fe_ls) == 0:
+        return 0
+
+    n_columns = 1
+    for _, n_levels, slope in fe_ls:
+        if slope is None:
+            n_columns += n_levels - 1
+        else:
+            n_columns += n_levels
+    return n_columns
+
+
+def get_term_design(term_ls, n_obs):
+    # Fully coded indicators (times the slope for i:C(j)), the collinear columns are left to the solve
+    block_ls = [sp.sparse.csr_matrix((n_obs, 0))]
+    for codes, n_levels, slope in term_ls:
+        indicator = get_indicator_matrix(codes=codes, n_levels=n_levels)
+        if slope is not None:
+            indicator = indicator.multiply(slope[:, None])
+        block_ls.append(indicator)
+    term_design = sp.sparse.hstack(block_ls, format="csr")
+    return term_design
+
+
+def pinv_rank(x):
+    # Pseudo-inverse and rank of a design from one SVD, with the cutoffs of np.linalg.pinv and np.linalg.matrix_rank
+    u, s, vt = np.linalg.svd(x, full_matrices=False)
+    s_max = s.max(initial=0)
+    keep_arr = s > 1e-15 * s_max
+    x_pinv = (vt[keep_arr].T / s[keep_arr]) @ u[:, keep_arr].T
+    rank = int((s > s_max * max(x.shape) * np.finfo(s.dtype).eps).sum())
+    return x_pinv, rank
+
+
+def pinv_normal(gram, tol=None):
+    # Pseudo-inverse and rank of a cross-product matrix. Normal equations square the condition number, so the
+    # columns are scaled to unit diagonal first and the cutoff is on the eigenvalues
+    if tol is None:
+        tol = 1e-10
+
+    scale = np.sqrt(np.clip(np.diag(gram), 0, None))
+    scale = np.where(scale > 0, scale, 1)
+    scale_gram = gram / np.outer(scale, scale)
+    eigenvalue, eigenvector = np.linalg.eigh(scale_gram)
+    keep_arr = eigenvalue > tol * eigenvalue.max(initial=0)
+
+    scale_pinv = (eigenvector[:, keep_arr] / eigenvalue[keep_arr]) @ eigenvector[:, keep_arr].T
+    gram_pinv = scale_pinv / np.outer(scale, scale)
+    rank = int(keep_arr.sum())
+    return gram_pinv, rank
+
+
+def count_fe_rank(fe_ls):
+    if len(fe_ls) == 0:
+        return 0
+
+    # The largest FE is absorbed in closed form (a diagonal), the other terms are counted on their cross products
+    # partialled on it, a (terms, terms) matrix, so no dense block has a row per observation
+    plain_ls = [(codes, n_levels, slope) for codes, n_levels, slope in fe_ls if slope is None]
+    base_codes, n_base, _ = max(plain_ls, key=lambda i: i[1])
+    term_ls = [i for i in fe_ls if i[0] is not base_codes]
+
+    count_arr = np.bincount(base_codes, minlength=n_base)
+    rank = int((count_arr > 0).sum())
+    if len(term_ls) == 0:
+        return rank
+
+    base = get_indicator_matrix(codes=base_codes, n_levels=n_base)
+    term_design = get_term_design(term_ls=term_ls, n_obs=base_codes.shape[0])
+    base_term = (base.T @ term_design).toarray()
+    inv_count_arr = np.divide(1, count_arr, out=np.zeros(count_arr.shape), where=count_arr > 0)
+    term_term = (term_design.T @ term_design).toarray() - base_term.T @ (inv_count_arr[:, None] * base_term)
+    _, term_rank = pinv_normal(gram=term_term)
+    rank += term_rank
+    return rank
+
+
+def get_cluster_meat(xu, codes):
+    n_groups = codes.max() + 1
+    indicator = get_indicator_matrix(codes=codes, n_levels=n_groups)
+    score = indicator.T @ xu
+    meat = score.T @ score
+    return meat, n_groups
+
+
+def get_correction(n_obs, n_groups, k_params):
+    correction = n_groups / (n_groups - 1) * (n_obs - 1) / (n_obs - k_params)
+    return correction
+
+
+@trace.traced(name="covariance")
+def cov_cluster(xu, hessian_inv, codes, k_params):
+    n_obs = xu.shape[0]
+    trace.annotate(n_rows=n_obs, n_columns=xu.shape[1], n_clusterings=1)
+    meat, n_groups = get_cluster_meat(xu=xu, codes=codes)
+    cov = hessian_inv @ meat @ hessian_inv
+    cov *= get_correction(n_obs=n_obs, n_groups=n_groups, k_params=k_params)
+    return cov
+
+
+def combine_codes(codes_ls):
+    # Integer codes of the intersection of several clusterings
+    combine_codes = np.zeros(codes_ls[0].shape[0], dtype=np.int64)
+    for codes in codes_ls:
+        combine_codes = combine_codes * (codes.max() + 1) + codes
+        combine_codes, _ = pd.factorize(combine_codes)
+    return combine_codes
+
+
+@trace.traced(name="covariance")
+def cov_cluster_multiway(xu, hessian_inv, codes_ls, k_params, n_obs=None):
+    # Inclusion-exclusion over every intersection of the clusterings, one sandwich at the end. The rows of xu can
+    # also be score sums of the finest intersection, n_obs then counts the observations behind them
+    if n_obs is None:
+        n_obs = xu.shape[0]
+    trace.annotate(n_rows=n_obs, n_columns=xu.shape[1], n_clusterings=len(codes_ls))
+    meat = np.zeros((xu.shape[1], xu.shape[1]))
+    for n_ways in range(1, len(codes_ls) + 1):
+        sign = (-1) ** (n_ways + 1)
+        for subset_ls in combinations(codes_ls, n_ways):
+            codes = combine_codes(codes_ls=list(subset_ls))
+            meat_i, n_groups = get_cluster_meat(xu=xu, codes=codes)
+            meat += sign * get_correction(n_obs=n_obs, n_groups=n_groups, k_params=k_params) * meat_i
+    cov = hessian_inv @ meat @ hessian_inv
+    return cov
+
+
+def get_sandwich_arrays(result):
+    if isinstance(result, EstimationResult):
+        xu = result.exog * result.resid[:, None]
+        hessian_inv = result.normalized_cov_params
+        k_params = result.k_params
+    else:
+        # statsmodels results
+        exog = result.model.wexog
+        xu = exog * np.asarray(result.wresid)[:, None]
+        hessian_inv = np.asarray(result.normalized_cov_params)
+        k_params = exog.shape[1]
+    return xu, hessian_inv, k_params
+
+
+def partial_out(x, z, z_pinv=None):
+    if z_pinv is None:
+        z_pinv = np.linalg.pinv(z)
+    resid_x = x - z @ (z_pinv @ x)
+    return resid_x
+
+
+def solve_stacked(x, y):
+    # x is (n_obs, n_systems, k) and y is (n_obs, m): one k x k system per stacked design
+    gram = np.einsum("nbi,nbj->bij", x, x)
+    moment = np.einsum("nbi,nm->bim", x, y)
+    beta = np.linalg.pinv(gram, hermitian=True) @ moment
+    return beta
+
+
+def get_missing_groups(df, dependent_ls):
+    # Outcomes with the same missingness pattern share one estimation sample
+    group_dd = dict()
+    for dv in dependent_ls:
+        key = df[dv].isna().to_numpy().tobytes()
+        group_dd.setdefault(key, list()).append(dv)
+    group_ls = list(group_dd.values())
+    return group_ls
+
+
+@trace.traced(name="fit")
+def fit_batch(y, x, fe_ls=None, cluster_codes=None, tol=None, max_iter=None, method=None):
+    if fe_ls is None:
+        fe_ls = list()
+
+    dependent_ls = list(y.columns)
+    name_ls = list(x.columns)
+    y = y.to_numpy(dtype=float)
+    x = x.to_numpy(dtype=float)
+    n_obs, n_dependent = y.shape
+    trace.annotate(n_rows=n_obs, n_columns=x.shape[1], n_outcomes=n_dependent, n_fe=len(fe_ls), method=method)
+
+    convergence = None
+    if len(fe_ls) > 0:
+        stack = np.column_stack([y, x])
+        if method == "sparse":
+            demean_stack, n_iter, convergence = partial_out_sparse(x=stack,
+                                                                   fe_ls=fe_ls,
+                                                                   tol=tol,
+                                                                   max_iter=max_iter,
+                                                                   name_ls=dependent_ls + name_ls)
+        else:
+            demean_stack, n_iter = demean(x=stack, fe_ls=fe_ls, tol=tol, max_iter=max_iter)
+        demean_y = demean_stack[:, :n_dependent]
+        demean_x = demean_stack[:, n_dependent:]
+
+        # Columns spanned by the FE are omitted, as in reghdfe
+        x_norm = np.linalg.norm(x, axis=0)
+        demean_x_norm = np.linalg.norm(demean_x, axis=0)
+        keep_ss = demean_x_norm > 1e-8 * np.maximum(x_norm, 1)
+        demean_x = demean_x[:, keep_ss]
+    else:
+        n_iter = 0
+        demean_y = y
+        demean_x = x
+        keep_ss = np.ones(len(name_ls), dtype=bool)
+
+    # One factorization of the design for every outcome
+    pinv_x, x_rank = pinv_rank(x=demean_x)
+    beta = pinv_x @ demean_y
+    normalized_cov_params = pinv_x @ pinv_x.T
+    resid = demean_y - demean_x @ beta
+
+    rank = x_rank + count_fe_rank(fe_ls=fe_ls)
+    df_resid = n_obs - rank
+    k_params = count_fe_columns(fe_ls=fe_ls) + len(name_ls)
+
+    result_dd = dict()
+    for i, dv in enumerate(dependent_ls):
+        resid_i = resid[:, i]
+        if cluster_codes is not None:
+            xu = demean_x * resid_i[:, None]
+            cov = cov_cluster(xu=xu, hessian_inv=normalized_cov_params, codes=cluster_codes, k_params=k_params)
+        else:
+            scale = (resid_i @ resid_i) / df_resid
+            cov = normalized_cov_params * scale
+
+        params = pd.Series(np.nan, index=name_ls)
+        params[keep_ss] = beta[:, i]
+
+        y_i = y[:, i]
+        tss = ((y_i - y_i.mean()) ** 2).sum()
+        result_dd[dv] = EstimationResult(params=params,
+                                         normalized_cov_params=normalized_cov_params,
+                                         cov=cov,
+                                         exog=demean_x,
+                                         resid=resid_i,
+                                         nobs=n_obs,
+                                         df_resid=df_resid,
+                                         k_params=k_params,
+                                         tss=tss,
+                                         n_iter=n_iter,
+                                         convergence=convergence)
+    return result_dd
+
+
+def fit_absorbed(y, x, fe_ls, cluster_codes=None, tol=None, max_iter=None, method=None):
+    y_df = pd.DataFrame({"y": np.asarray(y, dtype=float)}, index=x.index)
+    result_dd = fit_batch(y=y_df,
+                          x=x,
+                          fe_ls=fe_ls,
+                          cluster_codes=cluster_codes,
+                          tol=tol,
+                          max_iter=max_iter,
+                          method=method)
+    result = result_dd["y"]
+    return result
+
+
+def cov_cluster_2way(result, codes_1, codes_2):
+    xu, hessian_inv, k_params = get_sandwich_arrays(result=result)
+    cov = cov_cluster_multiway(xu=xu, hessian_inv=hessian_inv, codes_ls=[codes_1, codes_2], k_params=k_params)
+    cov_df = result.expand_cov(cov=cov)
+    return cov_df
+
+
+def get_cluster_codes(df, clustvar):
+    if clustvar is None:
+        return None
+
+    cluster_codes, _ = pd.factorize(df[clustvar], sort=True)
+    return cluster_codes
+
+
+def fit_formula_absorbed(formula, df, fe, fe_inter=None, clustvar=None, tol=None, max_iter=None, method=None):
+    y_df, x_df = dmatrices(formula, data=df, return_type="dataframe")
+    x_df = x_df.drop(columns="Intercept")
+
+    fe_ls = factorize_fe(df=df, fe=fe, fe_inter=fe_inter)
+    cluster_codes = get_cluster_codes(df=df, clustvar=clustvar)
+
+    result = fit_absorbed(y=y_df.iloc[:, 0],
+                          x=x_df,
+                          fe_ls=fe_ls,
+                          cluster_codes=cluster_codes,
+                          tol=tol,
+                          max_iter=max_iter,
+                          method=method)
+    return result
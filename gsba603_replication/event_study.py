@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from . import estimation, utils, wild_bootstrap
+
+
+def get_event_positions(design_info, name_ls, event_term, reference=-1):
+    # Located once per design from the patsy term, instead of matching every parameter name against a regex
+    term_slice = design_info.term_name_slices[event_term]
+    column_ls = design_info.column_names[term_slice]
+    position_dd = {name: i for i, name in enumerate(name_ls)}
+    position_arr = np.array([position_dd[i] for i in column_ls], dtype=int)
+
+    # Treatment coding keeps the category order and leaves out the reference
+    term = design_info.terms[list(design_info.term_name_slices).index(event_term)]
+    category_ls = next(design_info.factor_infos[i].categories for i in term.factors
+                       if design_info.factor_infos[i].type == "categorical")
+    tau_arr = np.array([i for i in category_ls if i != reference])
+    return position_arr, tau_arr
+
+
+class EventStudyResult:
+    # Event-time coefficients of a fit, so the fitted model, its design and residuals can be released
+    __slots__ = [
+        "name_arr",
+        "tau_arr",
+        "coefficient_arr",
+        "std_error_arr",
+        "cov_arr",
+        "clustered_std_error_arr",
+        "nobs",
+        "rsquared",
+        "rsquared_adj",
+        "interval_df",
+    ]
+
+    def __init__(self, name_arr, tau_arr, coefficient_arr, std_error_arr, cov_arr, nobs, rsquared, rsquared_adj,
+                 clustered_std_error_arr=None, interval_df=None):
+        self.name_arr = name_arr
+        self.tau_arr = tau_arr
+        self.coefficient_arr = coefficient_arr
+        self.std_error_arr = std_error_arr
+        self.cov_arr = cov_arr
+        self.clustered_std_error_arr = clustered_std_error_arr
+        self.nobs = nobs
+        self.rsquared = rsquared
+        self.rsquared_adj = rsquared_adj
+        self.interval_df = interval_df
+
+    @classmethod
+    def from_result(cls, result, position_arr, tau_arr, interval_df=None):
+        name_arr = np.asarray(result.params.index)[position_arr]
+        cov_arr = np.asarray(result.cov_params(), dtype=float)[np.ix_(position_arr, position_arr)]
+
+        clustered_std_error_arr = getattr(result, "clustered_bse", None)
+        if clustered_std_error_arr is not None:
+            clustered_std_error_arr = np.asarray(clustered_std_error_arr, dtype=float)[position_arr]
+
+        event_result = cls(name_arr=name_arr,
+                           tau_arr=tau_arr,
+                           coefficient_arr=np.asarray(result.params, dtype=float)[position_arr],
+                           std_error_arr=np.asarray(result.bse, dtype=float)[position_arr],
+                           cov_arr=cov_arr,
+                           nobs=int(result.nobs),
+                           rsquared=float(result.rsquared),
+                           rsquared_adj=float(result.rsquared_adj),
+                           clustered_std_error_arr=clustered_std_error_arr,
+                           interval_df=interval_df)
+        return event_result
+
+    @property
+    def params(self):
+        return pd.Series(self.coefficient_arr, index=self.name_arr)
+
+    @property
+    def bse(self):
+        return pd.Series(self.std_error_arr, index=self.name_arr)
+
+    @property
+    def clustered_bse(self):
+        return self.clustered_std_error_arr
+
+    def cov_params(self):
+        cov_df = pd.DataFrame(self.cov_arr, index=self.name_arr, columns=self.name_arr)
+        return cov_df
+
+    def get_plot_frame(self):
+        raw_dd = {
+            "coefficient": pd.Series(self.coefficient_arr, index=self.tau_arr),
+            "std_error": pd.Series(self.std_error_arr, index=self.tau_arr),
+        }
+        concat_dd = {k: utils.append_baseline(ss=ss) for k, ss in raw_dd.items()}
+        plot_df = pd.DataFrame(concat_dd)
+        if self.interval_df is not None:
+            plot_df = utils.append_intervals(plot_df=plot_df, interval_df=self.interval_df)
+        return plot_df
+
+
+def get_wild_codes(design):
+    # Weights are drawn per cluster, or per intersection of the clusterings, e.g. the id/id_j dyad
+    if len(design.cluster_codes_ls) == 0:
+        msg = f"the wild bootstrap needs clustvar!"
+        raise Exception(msg)
+    codes = estimation.combine_codes(codes_ls=design.cluster_codes_ls)
+    return codes
+
+
+def compact_results(design, result_dd, event_term, n_wild=None, weight_type=None, wild_seed=None):
+    position_arr, tau_arr = get_event_positions(design_info=design.design_info,
+                                                name_ls=design.name_ls,
+                                                event_term=event_term)
+    if n_wild:
+        codes = get_wild_codes(design=design)
+
+    event_result_dd = dict()
+    for dv, result in result_dd.items():
+        interval_df = None
+        if n_wild:
+            interval_df = wild_bootstrap.get_bootstrap_intervals(result=result,
+                                                                 codes=codes,
+                                                                 position_arr=position_arr,
+                                                                 tau_arr=tau_arr,
+                                                                 n_replicates=n_wild,
+                                                                 weight_type=weight_type,
+                                                                 seed=wild_seed)
+        event_result_dd[dv] = EventStudyResult.from_result(result=result,
+                                                           position_arr=position_arr,
+                                                           tau_arr=tau_arr,
+                                                           interval_df=interval_df)
+    return event_result_dd
@@ -3,75 +3,82 @@ import pandas as pd
 import scipy as sp
 import statsmodels.formula.api as smf
 
-from . import utils
+from functools import partial
 
+from . import design, estimation, event_study, memo, render, result_cache, trace, utils
 
+
+@trace.traced(name="figure_1.pre_process_data")
+@memo.memoize_frame
 def pre_process_data(df, months=None):
     if months is None:
         months = 24
 
-    # Two-year analysis window
-    window_filter_df = utils.filter_window(df=df, months=months)
-
-    # Observations hit during first half but not yet treated
-    treatment_filter_df = utils.filter_first_half_shock(df=window_filter_df)
+    # Two-year analysis window, observations hit during first half but not yet treated, no-attrition filter
+    mask_ls = [
+        utils.get_window_mask(df=df, months=months),
+        utils.get_first_half_shock_mask(df=df),
+        utils.get_attrition_mask(df=df),
+    ]
+    column_ls = get_required_columns()
+    filter_df = utils.apply_masks(df=df, mask_ls=mask_ls, columns=column_ls)
 
     # Recode tau
-    recode_df = utils.recode_tau(df=treatment_filter_df, months=months)
-
-    # No-attrition filter
-    filter_df = utils.filter_attrition(df=recode_df)
+    filter_df = utils.recode_tau(df=filter_df, months=months, copy=False)
 
     # Calculations
     filter_df = utils.calculate_outcomes(df=filter_df)
     return filter_df
 
 
-def regress_diff_in_diff(df, dv, tau, treatment, fe=None, control=None, clustvar=None):
-    copy_df = df.copy()
-
+def prepare_data(df, dependent_ls, tau, treatment, fe=None, control=None, clustvar=None):
+    rename_dd = dict()
     if treatment == "Treatment":
         rename_dd = {"Treatment": "treatment"}
-        copy_df = copy_df.rename(columns=rename_dd)
-        treatment = "treatment"
 
     iter_ls = [
-        dv,
         tau,
         treatment,
         clustvar,
         fe,
         control,
     ]
-    keep_ls = list()
-    for i in iter_ls:
-        if isinstance(i, list):
-            keep_ls += i
-        else:
-            keep_ls.append(i)
-    keep_ls = list(set(keep_ls))
-    copy_df = copy_df.loc[:, keep_ls].copy()
-    copy_df = copy_df.dropna()
+    rhs_ls = utils.get_keep_list(iter_ls=iter_ls)
+    keep_ls = utils.get_keep_list(iter_ls=[dependent_ls, rhs_ls])
+
+    # Project before renaming, so only the regression columns are copied
+    copy_df = df.loc[:, keep_ls].dropna(subset=rhs_ls)
+    copy_df = copy_df.rename(columns=rename_dd)
+    treatment = rename_dd.get(treatment, treatment)
+    return copy_df, treatment
 
+
+def encode_data(df, tau, clustvar=None):
     # Handle categorical variable
-    tau_ss = copy_df[tau].copy()
+    tau_ss = df[tau].copy()
     category_ls = sorted(tau_ss.dropna().unique())
     tau_cat_ss = pd.Categorical(tau_ss, categories=category_ls, ordered=True)
     tau_cat = f"{tau}_cat"
-    copy_df[tau_cat] = tau_cat_ss
+    df[tau_cat] = tau_cat_ss
 
     if clustvar is not None:
-        copy_df[clustvar] = pd.Categorical(copy_df[clustvar], ordered=True)
+        df[clustvar] = pd.Categorical(df[clustvar], ordered=True)
+    return df
 
-    # Create formula
-    formula = f"{dv} ~ C({tau_cat}, Treatment(reference=-1))"
+
+def get_formula(tau, treatment, fe=None, control=None, method=None):
+    method = estimation.get_method(method=method)
+    tau_cat = f"{tau}_cat"
+
+    formula = f"C({tau_cat}, Treatment(reference=-1))"
     formula = f"{formula} + {treatment} + C({tau_cat}, Treatment(reference=-1)):{treatment}"
-    if isinstance(fe, list):
-        fe_formula_ls = [f"C({i})" for i in fe]
-        fe_formula = " + ".join(fe_formula_ls)
-    else:
-        fe_formula = f"C({fe})"
-    formula = f"{formula} + {fe_formula}"
+    if method == "ols":
+        if isinstance(fe, list):
+            fe_formula_ls = [f"C({i})" for i in fe]
+            fe_formula = " + ".join(fe_formula_ls)
+        else:
+            fe_formula = f"C({fe})"
+        formula = f"{formula} + {fe_formula}"
 
     if control is not None:
         if isinstance(control, list):
@@ -79,6 +86,63 @@ def regress_diff_in_diff(df, dv, tau, treatment, fe=None, control=None, clustvar
         else:
             control_formula = control
         formula = f"{formula} + {control_formula}"
+    return formula
+
+
+def get_design_cache(df, dependent_ls, tau, treatment, fe=None, control=None, clustvar=None, method=None, tol=None):
+    method = estimation.get_method(method=method)
+
+    copy_df, treatment = prepare_data(df=df,
+                                      dependent_ls=dependent_ls,
+                                      tau=tau,
+                                      treatment=treatment,
+                                      fe=fe,
+                                      control=control,
+                                      clustvar=clustvar)
+    formula = get_formula(tau=tau, treatment=treatment, fe=fe, control=control, method=method)
+    encode_func = partial(encode_data, tau=tau, clustvar=clustvar)
+    design_cache = design.DesignCache(df=copy_df,
+                                      formula=formula,
+                                      encode_func=encode_func,
+                                      fe=fe,
+                                      clustvar=clustvar,
+                                      method=method,
+                                      tol=tol)
+    return design_cache
+
+
+def regress_diff_in_diff(df, dv, tau, treatment, fe=None, control=None, clustvar=None, method=None,
+                         design_cache=None, tol=None):
+    if design_cache is not None:
+        # The design was built once for the sample, only the outcome changes
+        results = design_cache.fit(dependent_ls=[dv])[dv]
+        return results
+
+    method = estimation.get_method(method=method)
+
+    copy_df, treatment = prepare_data(df=df,
+                                      dependent_ls=[dv],
+                                      tau=tau,
+                                      treatment=treatment,
+                                      fe=fe,
+                                      control=control,
+                                      clustvar=clustvar)
+    copy_df = copy_df.dropna(subset=[dv])
+    copy_df = encode_data(df=copy_df, tau=tau, clustvar=clustvar)
+
+    # Create formula
+    rhs_formula = get_formula(tau=tau, treatment=treatment, fe=fe, control=control, method=method)
+    formula = f"{dv} ~ {rhs_formula}"
+
+    if method != "ols":
+        # FE absorbed (or solved as a sparse design) instead of C(fe) dummies
+        results = estimation.fit_formula_absorbed(formula=formula,
+                                                  df=copy_df,
+                                                  fe=fe,
+                                                  clustvar=clustvar,
+                                                  method=method,
+                                                  tol=tol)
+        return results
 
     model = smf.ols(formula, data=copy_df)
     if clustvar is not None:
@@ -91,6 +155,31 @@ def regress_diff_in_diff(df, dv, tau, treatment, fe=None, control=None, clustvar
     return results
 
 
+def regress_diff_in_diff_batch(df, dependent_ls, tau, treatment, fe=None, control=None, clustvar=None,
+                               method=None, tol=None, n_wild=None, weight_type=None, wild_seed=None):
+    # Outcomes sharing a sample are solved against one design
+    design_cache = get_design_cache(df=df,
+                                    dependent_ls=dependent_ls,
+                                    tau=tau,
+                                    treatment=treatment,
+                                    fe=fe,
+                                    control=control,
+                                    clustvar=clustvar,
+                                    method=method,
+                                    tol=tol)
+    result_dd = design_cache.fit(dependent_ls=dependent_ls,
+                                 event_term=get_event_term(),
+                                 n_wild=n_wild,
+                                 weight_type=weight_type,
+                                 wild_seed=wild_seed)
+    return result_dd
+
+
+def get_event_term():
+    event_term = "C(tau_cat, Treatment(reference=-1)):treatment"
+    return event_term
+
+
 def get_regex():
     regex_str = r"^C\(tau_cat, Treatment\(reference=-1\)\)\[T\.(.*?)\]:treatment$"
     return regex_str
@@ -157,6 +246,10 @@ def plot_from_data(ax, plot_df, dv, confidence_ls):
 
 
 def extract_values_from_result(result):
+    if isinstance(result, event_study.EventStudyResult):
+        plot_df = result.get_plot_frame()
+        return plot_df
+
     regex_str = get_regex()
 
     raw_dd = {
@@ -167,6 +260,10 @@ def extract_values_from_result(result):
     extract_dd = {k: utils.extract_relevant_values(ss=ss, regex_str=regex_str) for k, ss in raw_dd.items()}
     concat_dd = {k: utils.append_baseline(ss=ss) for k, ss in extract_dd.items()}
     plot_df = pd.DataFrame(concat_dd)
+
+    interval_df = getattr(result, "interval_df", None)
+    if interval_df is not None:
+        plot_df = utils.append_intervals(plot_df=plot_df, interval_df=interval_df)
     return plot_df
 
 
@@ -183,20 +280,32 @@ def generate_sub_plot(ax, dv, result=None, plot_df=None):
         critical_value = sp.stats.norm.ppf(interval)
         lower_label = f"lower_{int(100 * confidence)}"
         upper_label = f"upper_{int(100 * confidence)}"
+        if lower_label in plot_df.columns:
+            # Bootstrap intervals are drawn as they are
+            continue
         plot_df[lower_label] = plot_df["coefficient"] - critical_value * plot_df["std_error"]
         plot_df[upper_label] = plot_df["coefficient"] + critical_value * plot_df["std_error"]
 
     plot_from_data(ax=ax, plot_df=plot_df, dv=dv, confidence_ls=confidence_ls)
 
 
-def generate_plot(dependent_ls, result_dd):
+def get_plot_dict(dependent_ls, result_dd):
+    plot_df_dd = {dv: extract_values_from_result(result=result_dd[dv]) for dv in dependent_ls}
+    return plot_df_dd
+
+
+@trace.traced(name="figure_1.generate_plot")
+def generate_plot(dependent_ls, result_dd=None, plot_df_dd=None):
+    if plot_df_dd is None:
+        plot_df_dd = get_plot_dict(dependent_ls=dependent_ls, result_dd=result_dd)
+
     fig, axes = plt.subplots(3, 2, figsize=(14, 10))
     axes = axes.flatten()
 
     iterate_ls = zip(dependent_ls, axes)
     for dv, ax in iterate_ls:
-        result = result_dd[dv]
-        generate_sub_plot(ax=ax, dv=dv, result=result)
+        plot_df = plot_df_dd[dv].copy()
+        generate_sub_plot(ax=ax, dv=dv, plot_df=plot_df)
 
     plt.tight_layout()
     return fig
@@ -226,21 +335,41 @@ def construct_kwargs_dict(df):
     return kwargs_dd
 
 
-def generate_figure_1(months=None, name=None):
+def get_required_columns():
+    # Columns read by the filters, calculate_outcomes and the regressions, the only ones loaded from the column cache
+    dependent_ls = get_dependent_list()
+    kwargs_dd = construct_kwargs_dict(df=None)
+    spec_ls = [dependent_ls] + [kwargs_dd[i] for i in ["tau", "treatment", "clustvar", "fe", "control"]]
+    input_ls = ["treatment_subsample", "placebo_subsample", "no_attrition_food"]
+    column_ls = utils.get_required_columns(spec_ls=spec_ls, input_ls=input_ls)
+    return column_ls
+
+
+def generate_figure_1(months=None, name=None, method=None, df=None, n_wild=None, weight_type=None,
+                      wild_seed=None):
     if name is None:
         name = "figure_1.pdf"
 
-    read_df = utils.read_data()
-    df = pre_process_data(df=read_df, months=months)
+    # A preprocessed sample can be passed in when it is shared with other targets
+    if df is None:
+        read_df = utils.read_data(columns=get_required_columns())
+        df = pre_process_data(df=read_df, months=months)
 
     dependent_ls = get_dependent_list()
     kwargs_dd = construct_kwargs_dict(df=df)
 
-    result_dd = {dv: regress_diff_in_diff(dv=dv, **kwargs_dd) for dv in dependent_ls}
-    panel_plot = generate_plot(dependent_ls=dependent_ls, result_dd=result_dd)
+    result_dd = result_cache.fit_cached(fit_func=regress_diff_in_diff_batch,
+                                        dependent_ls=dependent_ls,
+                                        method=method,
+                                        n_wild=n_wild,
+                                        weight_type=weight_type,
+                                        wild_seed=wild_seed,
+                                        **kwargs_dd)
+    plot_df_dd = get_plot_dict(dependent_ls=dependent_ls, result_dd=result_dd)
 
-    utils.export_plot(name=name, panel_plot=panel_plot)
+    render.submit_plot(module_name="figure_1", func_name="generate_plot", name=name, plot_df_dd=plot_df_dd)
 
 
 def main():
     generate_figure_1()
+    render.wait()
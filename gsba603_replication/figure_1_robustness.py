@@ -1,8 +1,16 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+import re
 
-from . import figure_1, utils
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from patsy import dmatrix
+
+from . import estimation, figure_1, memo, render, shared, trace, utils
+
+# Preprocessed sample, mapped once per worker process
+_worker_df = None
 
 
 def extract_coefficient_from_result(result):
@@ -21,7 +29,7 @@ def get_subsample_coefficient(df, seed, dependent_ls, regress_kwargs_dd):
     sample_df = df.sample(frac=0.8, random_state=seed)
 
     regress_kwargs_dd.update({"df": sample_df})
-    result_dd = {dv: figure_1.regress_diff_in_diff(dv=dv, **regress_kwargs_dd) for dv in dependent_ls}
+    result_dd = figure_1.regress_diff_in_diff_batch(dependent_ls=dependent_ls, **regress_kwargs_dd)
     coef_dd = {dv: extract_coefficient_from_result(result=result) for dv, result in result_dd.items()}
     return coef_dd
 
@@ -38,11 +46,249 @@ def get_placebo_coefficient(df, seed, dependent_ls, regress_kwargs_dd):
     sample_df[treatment] = placebo_ss
 
     regress_kwargs_dd.update({"df": sample_df})
-    result_dd = {dv: figure_1.regress_diff_in_diff(dv=dv, **regress_kwargs_dd) for dv in dependent_ls}
+    result_dd = figure_1.regress_diff_in_diff_batch(dependent_ls=dependent_ls, **regress_kwargs_dd)
     coef_dd = {dv: extract_coefficient_from_result(result=result) for dv, result in result_dd.items()}
     return coef_dd
 
 
+def get_subsample_weights(seed_ls, n_obs, frac=None):
+    if frac is None:
+        frac = 0.8
+
+    # Same draw as df.sample(frac=frac, random_state=seed) in get_subsample_coefficient
+    size = round(frac * n_obs)
+    weights = np.zeros((n_obs, len(seed_ls)))
+    for i, seed in enumerate(seed_ls):
+        position_arr = np.random.RandomState(seed).choice(n_obs, size=size, replace=False)
+        weights[position_arr, i] = 1
+    return weights
+
+
+@trace.traced(name="figure_1_robustness.get_bootstrap_distribution")
+def get_bootstrap_distribution(df, seed_ls, dependent_ls, regress_kwargs_dd, frac=None, block_size=None):
+    if block_size is None:
+        block_size = 16
+
+    tau = regress_kwargs_dd["tau"]
+    fe = regress_kwargs_dd["fe"]
+    prepare_kwargs_dd = {k: v for k, v in regress_kwargs_dd.items() if k not in ["df", "method"]}
+
+    copy_df, treatment = figure_1.prepare_data(df=df, dependent_ls=dependent_ls, **prepare_kwargs_dd)
+    formula = figure_1.get_formula(tau=tau,
+                                   treatment=treatment,
+                                   fe=fe,
+                                   control=regress_kwargs_dd["control"],
+                                   method="absorb")
+    regex_str = figure_1.get_regex()
+
+    # Replicates are weight vectors over the full preprocessed sample
+    n_obs = df.shape[0]
+    position_ss = df.index.get_indexer(copy_df.index)
+
+    coef_dd = dict()
+    group_ls = estimation.get_missing_groups(df=copy_df, dependent_ls=dependent_ls)
+    for group_dependent_ls in group_ls:
+        sample_ss = copy_df[group_dependent_ls[0]].notna().to_numpy()
+        group_df = copy_df.loc[sample_ss].copy()
+        group_df = figure_1.encode_data(df=group_df, tau=tau)
+        group_position_ss = position_ss[sample_ss]
+
+        x_df = dmatrix(formula, data=group_df, return_type="dataframe").drop(columns="Intercept")
+        interaction_ls = [i for i, name in enumerate(x_df.columns) if re.match(regex_str, name)]
+        tau_ls = [int(re.match(regex_str, x_df.columns[i]).group(1)) for i in interaction_ls]
+        stack = np.column_stack([group_df[group_dependent_ls].to_numpy(dtype=float), x_df.to_numpy(dtype=float)])
+        n_dependent = len(group_dependent_ls)
+        fe_ls = estimation.factorize_fe(df=group_df, fe=fe)
+
+        beta_ls = list()
+        for block_seed_ls in get_chunk_list(seed_ls=seed_ls, chunk_size=block_size):
+            weights = get_subsample_weights(seed_ls=block_seed_ls, n_obs=n_obs, frac=frac)[group_position_ss]
+            demean_stack, _ = estimation.demean_weighted(x=stack, fe_ls=fe_ls, weights=weights)
+            beta = estimation.solve_weighted(x=demean_stack[:, :, n_dependent:],
+                                             y=demean_stack[:, :, :n_dependent],
+                                             weights=weights)
+            beta_ls.append(beta[:, interaction_ls, :])
+        beta = np.concatenate(beta_ls, axis=0)
+
+        for i, dv in enumerate(group_dependent_ls):
+            coef_df = pd.DataFrame(beta[:, :, i].T, index=tau_ls, columns=seed_ls)
+            coef_df = coef_df.apply(utils.append_baseline)
+            coef_dd[dv] = coef_df
+
+    coef_dd = {dv: coef_dd[dv] for dv in dependent_ls}
+    return coef_dd
+
+
+def get_placebo_positions(seed, n_obs):
+    # Same draw as np.random.choice(df.index, size=n_obs, replace=False) in get_placebo_coefficient
+    np.random.seed(seed)
+    position_arr = np.random.choice(n_obs, size=n_obs, replace=False)
+    return position_arr
+
+
+def _get_treatment_block(treatment_arr, tau_dummy, seed_ls, sample_ss):
+    n_obs = treatment_arr.shape[0]
+    position_ls = [get_placebo_positions(seed=seed, n_obs=n_obs) for seed in seed_ls]
+    placebo_arr = np.column_stack([treatment_arr[i] for i in position_ls])[sample_ss]
+
+    # Treatment and its tau interactions, for every permutation: (n_obs, n_permutations, 1 + n_tau)
+    block = np.concatenate([placebo_arr[:, :, None], placebo_arr[:, :, None] * tau_dummy[:, None, :]], axis=2)
+    return block
+
+
+def _solve_placebo_block(block, fe_ls, demean_z, z_pinv, resid_y):
+    n_obs, n_permutations, k_treatment = block.shape
+    flat_block = block.reshape(n_obs, n_permutations * k_treatment)
+    demean_block, _ = estimation.demean(x=flat_block, fe_ls=fe_ls)
+    resid_block = estimation.partial_out(x=demean_block, z=demean_z, z_pinv=z_pinv)
+    resid_block = resid_block.reshape(n_obs, n_permutations, k_treatment)
+
+    # Drop the treatment main effect, keep the tau x treatment coefficients
+    beta = estimation.solve_stacked(x=resid_block, y=resid_y)[:, 1:, :]
+    return beta
+
+
+@trace.traced(name="figure_1_robustness.get_placebo_distribution")
+def get_placebo_distribution(df, seed_ls, dependent_ls, regress_kwargs_dd, block_size=None):
+    if block_size is None:
+        block_size = 32
+
+    tau = regress_kwargs_dd["tau"]
+    treatment = regress_kwargs_dd["treatment"]
+    fe = regress_kwargs_dd["fe"]
+    control = regress_kwargs_dd["control"]
+    if not isinstance(control, list):
+        control = [control]
+
+    treatment_arr = df[treatment].to_numpy(dtype=float)
+    if np.isnan(treatment_arr).any():
+        msg = f"placebo permutations require {treatment} without missing values"
+        raise Exception(msg)
+
+    rhs_ls = utils.get_keep_list(iter_ls=[tau, fe, control])
+    rhs_ss = df[rhs_ls].notna().all(axis=1).to_numpy()
+
+    observed_dd = dict()
+    coef_dd = dict()
+    group_ls = estimation.get_missing_groups(df=df.loc[rhs_ss], dependent_ls=dependent_ls)
+    for group_dependent_ls in group_ls:
+        sample_ss = rhs_ss & df[group_dependent_ls[0]].notna().to_numpy()
+        sample_df = df.loc[sample_ss]
+
+        # Invariant part of the design: FE, tau dummies and controls are partialled out once
+        tau_ls = sorted(sample_df[tau].unique())
+        tau_ls = [i for i in tau_ls if i != -1]
+        tau_dummy = (sample_df[tau].to_numpy()[:, None] == np.array(tau_ls)[None, :]).astype(float)
+        z = np.column_stack([tau_dummy, sample_df[control].to_numpy(dtype=float)])
+        y = sample_df[group_dependent_ls].to_numpy(dtype=float)
+
+        fe_ls = estimation.factorize_fe(df=sample_df, fe=fe)
+        demean_stack, _ = estimation.demean(x=np.column_stack([y, z]), fe_ls=fe_ls)
+        demean_y = demean_stack[:, :y.shape[1]]
+        demean_z = demean_stack[:, y.shape[1]:]
+        z_pinv = np.linalg.pinv(demean_z)
+        resid_y = estimation.partial_out(x=demean_y, z=demean_z, z_pinv=z_pinv)
+
+        solve_dd = {
+            "fe_ls": fe_ls,
+            "demean_z": demean_z,
+            "z_pinv": z_pinv,
+            "resid_y": resid_y,
+        }
+        observed_arr = treatment_arr[sample_ss, None]
+        observed_block = np.concatenate([observed_arr[:, :, None], (observed_arr * tau_dummy)[:, None, :]], axis=2)
+        observed_beta = _solve_placebo_block(block=observed_block, **solve_dd)[0]
+
+        beta_ls = list()
+        for block_seed_ls in get_chunk_list(seed_ls=seed_ls, chunk_size=block_size):
+            block = _get_treatment_block(treatment_arr=treatment_arr,
+                                         tau_dummy=tau_dummy,
+                                         seed_ls=block_seed_ls,
+                                         sample_ss=sample_ss)
+            beta_ls.append(_solve_placebo_block(block=block, **solve_dd))
+        beta = np.concatenate(beta_ls, axis=0)
+
+        for i, dv in enumerate(group_dependent_ls):
+            observed_dd[dv] = pd.Series(observed_beta[:, i], index=tau_ls)
+            coef_dd[dv] = pd.DataFrame(beta[:, :, i].T, index=tau_ls, columns=seed_ls)
+
+    observed_dd = {dv: observed_dd[dv] for dv in dependent_ls}
+    coef_dd = {dv: coef_dd[dv] for dv in dependent_ls}
+    return observed_dd, coef_dd
+
+
+def get_permutation_stats(observed_ss, coef_df):
+    mean_ss = coef_df.T.mean()
+    mean_ss.name = "coefficient"
+    std_ss = coef_df.T.std()
+    std_ss.name = "std_error"
+
+    # Two-sided permutation p-value, counting the observed assignment
+    n_extreme_ss = coef_df.abs().ge(observed_ss.abs(), axis=0).sum(axis=1)
+    p_value_ss = (1 + n_extreme_ss) / (1 + coef_df.shape[1])
+    p_value_ss.name = "p_value"
+
+    stats_df = pd.concat([mean_ss, std_ss], axis=1)
+    stats_df = stats_df.apply(utils.append_baseline)
+    stats_df["p_value"] = p_value_ss
+    return stats_df
+
+
+def _init_worker(handle):
+    global _worker_df
+    _worker_df = shared.attach_frame(handle=handle)
+
+
+@trace.traced(name="figure_1_robustness.run_chunk")
+def _run_chunk(seed_ls, replicate_func, dependent_ls, regress_kwargs_dd):
+    coef_ls = [replicate_func(df=_worker_df,
+                              seed=seed,
+                              dependent_ls=dependent_ls,
+                              regress_kwargs_dd=regress_kwargs_dd.copy()) for seed in seed_ls]
+    return coef_ls
+
+
+def get_chunk_list(seed_ls, chunk_size):
+    chunk_ls = [seed_ls[i:i + chunk_size] for i in range(0, len(seed_ls), chunk_size)]
+    return chunk_ls
+
+
+@trace.traced(name="figure_1_robustness.run_replicates")
+def run_replicates(replicate_func, seed_ls, df, dependent_ls, regress_kwargs_dd, n_workers=None, chunk_size=None):
+    if n_workers is None:
+        n_workers = 1
+
+    # The sample travels once per worker, not once per replicate
+    regress_kwargs_dd = {k: v for k, v in regress_kwargs_dd.items() if k != "df"}
+
+    if n_workers == 1:
+        coef_ls = [replicate_func(df=df,
+                                  seed=seed,
+                                  dependent_ls=dependent_ls,
+                                  regress_kwargs_dd=regress_kwargs_dd.copy()) for seed in seed_ls]
+        return coef_ls
+
+    if chunk_size is None:
+        chunk_size = max(1, len(seed_ls) // (4 * n_workers))
+
+    chunk_ls = get_chunk_list(seed_ls=seed_ls, chunk_size=chunk_size)
+    run_func = partial(_run_chunk,
+                       replicate_func=replicate_func,
+                       dependent_ls=dependent_ls,
+                       regress_kwargs_dd=regress_kwargs_dd)
+    # Published once, workers map the columns instead of each unpickling a copy of the sample
+    handle = shared.publish_frame(df=df)
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(handle,)) as executor:
+            # map keeps the chunks in seed order
+            chunk_coef_ls = list(executor.map(run_func, chunk_ls))
+    finally:
+        shared.release_frame(handle=handle)
+
+    coef_ls = [coef_dd for chunk_coef_ls in chunk_coef_ls for coef_dd in chunk_coef_ls]
+    return coef_ls
+
+
 def get_stats(ls):
     df = pd.concat(ls, axis=1)
     mean_ss = df.T.mean()
@@ -53,25 +299,31 @@ def get_stats(ls):
     return stats_df
 
 
-def generate_robustness_plot(dependent_ls, result_dd):
+@trace.traced(name="figure_1_robustness.generate_plot")
+def generate_robustness_plot(dependent_ls, plot_df_dd):
     fig, axes = plt.subplots(3, 2, figsize=(14, 10))
     axes = axes.flatten()
 
     iterate_ls = zip(dependent_ls, axes)
     for dv, ax in iterate_ls:
-        plot_df = result_dd[dv]
+        plot_df = plot_df_dd[dv].copy()
         figure_1.generate_sub_plot(ax=ax, dv=dv, plot_df=plot_df)
 
     plt.tight_layout()
     return fig
 
 
-def run_bootstrap(n_bootstrap=None):
+@trace.traced(name="figure_1_robustness.run_bootstrap")
+def run_bootstrap(n_bootstrap=None, n_workers=None, chunk_size=None, seed_ls=None, weighted=None, block_size=None,
+                  df=None):
     if n_bootstrap is None:
         n_bootstrap = 100
+    if weighted is None:
+        weighted = False
 
-    read_df = utils.read_data()
-    df = figure_1.pre_process_data(df=read_df)
+    if df is None:
+        read_df = utils.read_data(columns=figure_1.get_required_columns())
+        df = figure_1.pre_process_data(df=read_df)
 
     dependent_ls = figure_1.get_dependent_list()
     kwargs_dd = figure_1.construct_kwargs_dict(df=df)
@@ -82,28 +334,179 @@ def run_bootstrap(n_bootstrap=None):
         "regress_kwargs_dd": kwargs_dd,
     }
 
-    seed_ls = list(range(n_bootstrap))
-    coef_ls = [get_subsample_coefficient(seed=seed, **bootstrap_dd) for seed in seed_ls]
-    coef_dd = {dv: [i[dv] for i in coef_ls] for dv in dependent_ls}
+    if seed_ls is None:
+        seed_ls = list(range(n_bootstrap))
+    if weighted:
+        # Weighted normal equations over one shared design, block_size replicates per stacked solve. chunk_size is
+        # the number of seeds per pool task and only applies to the refits
+        coef_df_dd = get_bootstrap_distribution(seed_ls=seed_ls, block_size=block_size, **bootstrap_dd)
+        coef_dd = {dv: [coef_df[seed] for seed in seed_ls] for dv, coef_df in coef_df_dd.items()}
+    else:
+        coef_ls = run_replicates(replicate_func=get_subsample_coefficient,
+                                 seed_ls=seed_ls,
+                                 n_workers=n_workers,
+                                 chunk_size=chunk_size,
+                                 **bootstrap_dd)
+        coef_dd = {dv: [i[dv] for i in coef_ls] for dv in dependent_ls}
     stats_dd = {dv: get_stats(ls) for dv, ls in coef_dd.items()}
-    panel_plot = generate_robustness_plot(dependent_ls=dependent_ls, result_dd=stats_dd)
-
     name = "figure_1_bootstrap.pdf"
-    utils.export_plot(name=name, panel_plot=panel_plot)
+    render.submit_plot(module_name="figure_1_robustness",
+                       func_name="generate_robustness_plot",
+                       name=name,
+                       plot_df_dd=stats_dd)
 
 
-def expand_window():
+@trace.traced(name="figure_1_robustness.expand_window")
+def expand_window(df=None):
     months = 36
     name = "figure_1_36months.pdf"
-    figure_1.generate_figure_1(months=months, name=name)
+    figure_1.generate_figure_1(months=months, name=name, df=df)
+
+
+def get_window_list():
+    month_ls = [12, 18, 24, 30, 36, 42, 48]
+    return month_ls
+
+
+@trace.traced(name="figure_1_robustness.pre_process_sweep_data")
+@memo.memoize_frame
+def pre_process_sweep_data(df, months=None):
+    if months is None:
+        months = max(get_window_list())
+
+    # Same filters as figure_1.pre_process_data on the widest window, tau is left in months for get_window_sample
+    mask_ls = [
+        utils.get_window_mask(df=df, months=months),
+        utils.get_first_half_shock_mask(df=df),
+        utils.get_attrition_mask(df=df),
+    ]
+    filter_df = utils.apply_masks(df=df, mask_ls=mask_ls)
+    filter_df = utils.calculate_outcomes(df=filter_df)
+    return filter_df
+
+
+def get_window_sample(df, months, step=None):
+    # Narrower windows are row subsets of the widest one, only tau is binned again
+    mask_ls = [utils.get_window_mask(df=df, months=months)]
+    window_df = utils.apply_masks(df=df, mask_ls=mask_ls)
+    window_df = utils.recode_tau(df=window_df, months=months, step=step, copy=False)
+    return window_df
+
+
+def get_window_plot_dict(df, seed, dependent_ls, regress_kwargs_dd):
+    # seed is the (months, step) window, so run_replicates can spread the windows over processes
+    months, step = seed
+    window_df = get_window_sample(df=df, months=months, step=step)
+
+    regress_kwargs_dd.update({"df": window_df})
+    result_dd = figure_1.regress_diff_in_diff_batch(dependent_ls=dependent_ls, **regress_kwargs_dd)
+
+    plot_df_dd = dict()
+    for dv, result in result_dd.items():
+        plot_df = figure_1.extract_values_from_result(result=result)
+        plot_df["months"] = months
+        plot_df["step"] = step
+        plot_df["event_month"] = plot_df.index * step
+        plot_df["nobs"] = result.nobs
+        plot_df_dd[dv] = plot_df
+    return plot_df_dd
+
+
+def plot_sweep_from_data(ax, plot_df, dv, legend=True):
+    # Color by window, line style by bin step
+    month_ls = sorted(plot_df["months"].unique())
+    step_ls = sorted(plot_df["step"].unique())
+    color_dd = dict(zip(month_ls, plt.cm.viridis(np.linspace(0, 0.9, len(month_ls)))))
+    style_dd = dict(zip(step_ls, ["-", "--", ":", "-."] * len(step_ls)))
+
+    window_df = plot_df.loc[:, ["months", "step"]].drop_duplicates()
+    for months, step in window_df.itertuples(index=False):
+        select_ss = (plot_df["months"] == months) & (plot_df["step"] == step)
+        select_df = plot_df.loc[select_ss].sort_values("event_month")
+        plot_label = f"{months} months, {step}-month bins"
+        ax.plot(select_df["event_month"],
+                select_df["coefficient"],
+                marker="o",
+                markersize=3,
+                color=color_dd[months],
+                linestyle=style_dd[step],
+                label=plot_label)
+
+    ax.axhline(0, color="maroon", linestyle="--")
+    ax.axvline(0, color="maroon", linestyle="--")
+
+    ax.set_title(figure_1.get_title(dv=dv))
+    ax.set_xlabel("Time to event (months)")
+    ax.set_ylabel(figure_1.get_y_title(dv=dv))
+    if legend:
+        ax.legend(fontsize="x-small", ncol=2)
+    ax.grid(True)
+
+
+@trace.traced(name="figure_1_robustness.generate_sweep_plot")
+def generate_sweep_plot(dependent_ls, plot_df_dd):
+    fig, axes = plt.subplots(3, 2, figsize=(14, 10))
+    axes = axes.flatten()
 
+    # Every panel has the same windows, the first one carries the legend
+    iterate_ls = zip(dependent_ls, axes)
+    for i, (dv, ax) in enumerate(iterate_ls):
+        plot_sweep_from_data(ax=ax, plot_df=plot_df_dd[dv], dv=dv, legend=i == 0)
+
+    plt.tight_layout()
+    return fig
 
-def run_placebo_test(n_bootstrap=None):
+
+@trace.traced(name="figure_1_robustness.run_window_sweep")
+def run_window_sweep(month_ls=None, step_ls=None, n_workers=None, method=None, df=None):
+    if month_ls is None:
+        month_ls = get_window_list()
+    if step_ls is None:
+        step_ls = [6]
+
+    window_ls = [(months, step) for months in month_ls for step in step_ls]
+    invalid_ls = [i for i in window_ls if i[0] % i[1] != 0]
+    if len(invalid_ls) > 0:
+        msg = f"windows {invalid_ls} are not a multiple of their step"
+        raise Exception(msg)
+
+    # Read and filtered once for the widest window, a sample passed in has to cover it
+    if df is None:
+        read_df = utils.read_data(columns=figure_1.get_required_columns())
+        df = pre_process_sweep_data(df=read_df, months=max(month_ls))
+
+    dependent_ls = figure_1.get_dependent_list()
+    kwargs_dd = figure_1.construct_kwargs_dict(df=df)
+    kwargs_dd["method"] = method
+
+    plot_ls = run_replicates(replicate_func=get_window_plot_dict,
+                             seed_ls=window_ls,
+                             df=df,
+                             dependent_ls=dependent_ls,
+                             regress_kwargs_dd=kwargs_dd,
+                             n_workers=n_workers)
+    plot_df_dd = {dv: pd.concat([i[dv] for i in plot_ls], axis=0) for dv in dependent_ls}
+
+    name = "figure_1_window_sweep.pdf"
+    render.submit_plot(module_name="figure_1_robustness",
+                       func_name="generate_sweep_plot",
+                       name=name,
+                       plot_df_dd=plot_df_dd)
+
+    sweep_df = render.get_plot_frame(plot_df_dd=plot_df_dd)
+    return sweep_df
+
+
+@trace.traced(name="figure_1_robustness.run_placebo_test")
+def run_placebo_test(n_bootstrap=None, vectorized=None, block_size=None, df=None):
     if n_bootstrap is None:
         n_bootstrap = 100
+    if vectorized is None:
+        vectorized = False
 
-    read_df = utils.read_data()
-    df = figure_1.pre_process_data(df=read_df)
+    if df is None:
+        read_df = utils.read_data(columns=figure_1.get_required_columns())
+        df = figure_1.pre_process_data(df=read_df)
 
     dependent_ls = figure_1.get_dependent_list()
     kwargs_dd = figure_1.construct_kwargs_dict(df=df)
@@ -115,20 +518,36 @@ def run_placebo_test(n_bootstrap=None):
     }
 
     seed_ls = list(range(n_bootstrap))
-    coef_ls = [get_placebo_coefficient(seed=seed, **bootstrap_dd) for seed in seed_ls]
-    coef_dd = {dv: [i[dv] for i in coef_ls] for dv in dependent_ls}
-    stats_dd = {dv: get_stats(ls) for dv, ls in coef_dd.items()}
-    panel_plot = generate_robustness_plot(dependent_ls=dependent_ls, result_dd=stats_dd)
-
+    # The vectorized engine gives the same coefficients and also exports permutation p-values
+    if vectorized:
+        observed_dd, coef_dd = get_placebo_distribution(seed_ls=seed_ls, block_size=block_size, **bootstrap_dd)
+        stats_dd = {dv: get_permutation_stats(observed_ss=observed_dd[dv], coef_df=coef_df)
+                    for dv, coef_df in coef_dd.items()}
+    else:
+        coef_ls = [get_placebo_coefficient(seed=seed, **bootstrap_dd) for seed in seed_ls]
+        coef_dd = {dv: [i[dv] for i in coef_ls] for dv in dependent_ls}
+        stats_dd = {dv: get_stats(ls) for dv, ls in coef_dd.items()}
     name = "figure_1_placebo.pdf"
-    utils.export_plot(name=name, panel_plot=panel_plot)
+    render.submit_plot(module_name="figure_1_robustness",
+                       func_name="generate_robustness_plot",
+                       name=name,
+                       plot_df_dd=stats_dd)
+
+    if vectorized:
+        p_value_df = pd.DataFrame({dv: stats_df["p_value"] for dv, stats_df in stats_dd.items()})
+        name = "figure_1_placebo_p_values.csv"
+        export_path = utils.get_export_path()
+        p_value_df.to_csv(f"{export_path}/{name}")
 
 
-def run_robustness_checks(n_bootstrap=None):
-    run_bootstrap(n_bootstrap=n_bootstrap)
+def run_robustness_checks(n_bootstrap=None, n_workers=None):
+    run_bootstrap(n_bootstrap=n_bootstrap, n_workers=n_workers)
     expand_window()
     run_placebo_test(n_bootstrap=n_bootstrap)
 
 
-def main(n_bootstrap=None):
-    run_robustness_checks(n_bootstrap=n_bootstrap)
+def main(n_bootstrap=None, n_workers=None, trace_path=None):
+    if trace_path is not None:
+        trace.enable(path=trace_path)
+    run_robustness_checks(n_bootstrap=n_bootstrap, n_workers=n_workers)
+    render.wait()
@@ -4,55 +4,53 @@ import pandas as pd
 import scipy as sp
 import statsmodels.formula.api as smf
 
-from . import utils
+from functools import partial
 
+from . import (design, dyads, estimation, event_study, memo, render, result_cache, streaming, trace, utils,
+               wild_bootstrap)
 
-def _compute_distance(x):
-    if not pd.isna(x):
-        if x != -1 and x != 0:
-            close_tot = 1 / x
-        else:
-            close_tot = 0
-    else:
-        close_tot = 0
-    return close_tot
 
+def compute_distance(ss):
+    # 1 / Tot_geo, with missing, -1 and 0 distances coded as 0
+    valid_ss = ss.notna() & (ss != -1) & (ss != 0)
+    close_tot_ss = ss.rdiv(1).where(valid_ss, 0)
+    return close_tot_ss
 
-def pre_process_data(df):
-    # Drop attritors
+
+def get_any_indicator(ss):
+    any_ss = (ss > 0).astype(int).where(ss.notna())
+    return any_ss
+
+
+def filter_attritors(df):
+    # Drop attritors, the precedence evaluates (filter_ss & no_attrition_food_j) == 1
     filter_ss = df["no_attrition_food"] == 1
     filter_ss = filter_ss & df["no_attrition_food_j"] == 1
-    attritors_df = df.loc[filter_ss].copy()
+    attritors_df = utils.apply_masks(df=df, mask_ls=[filter_ss])
+    return attritors_df
 
-    # Post_i indicator
-    post_tau_i_ss = (attritors_df["tau_i"] >= 0) & (attritors_df["tau_i"] < 12)
-    post_tau_ss = (attritors_df["tau"] > -12) & (attritors_df["tau"] < 12)
+
+def get_post_indicator(df):
+    post_tau_i_ss = (df["tau_i"] >= 0) & (df["tau_i"] < 12)
+    post_tau_ss = (df["tau"] > -12) & (df["tau"] < 12)
     post_ss = post_tau_i_ss & post_tau_ss
     post_ss = post_ss.astype(int)
-    attritors_df["post_i"] = post_ss
+    return post_ss
 
-    # Compute shocks_i
-    groupby_ls = ["id", "id_j"]
-    attritors_df["shocks_i"] = attritors_df.groupby(groupby_ls)["post_i"].transform("sum")
-    attritors_df["shocks_i"] = attritors_df["shocks_i"].apply(lambda x: 1 if x > 0 else x)
 
-    # Recode tau
-    recode_df = utils.recode_tau(df=attritors_df)
+def compute_variables(df):
+    # Row by row once shocks_i is known, so chunks can be processed on their own
+    recode_df = utils.recode_tau(df=df, copy=False)
 
     recode_df["post"] = (recode_df["tau"] > 0).astype(int)
-    recode_df["c_tot"] = recode_df["Tot_geo"].isin([0, 1])
-    recode_df["c_tot"] = recode_df["Tot_geo"].apply(lambda x: np.nan if pd.isna(x) else x)
+    recode_df["c_tot"] = recode_df["Tot_geo"]
 
     # Distance
-    recode_df["close_tot"] = recode_df["Tot_geo"].apply(_compute_distance)
+    recode_df["close_tot"] = compute_distance(ss=recode_df["Tot_geo"])
 
     # Other dummies and variables
-    recode_df["anyHLABOUT"] = (recode_df["HLABOUT"] > 0).astype(int)
-    recode_df["anyHLABOUT"] = recode_df.apply(lambda x: np.nan if pd.isna(x["HLABOUT"]) else x["anyHLABOUT"], axis=1)
-
-    recode_df["anyOUTPUTOUT"] = (recode_df["OUTPUTOUT"] > 0).astype(int)
-    recode_df["anyOUTPUTOUT"] = recode_df.apply(lambda x: np.nan if pd.isna(x["OUTPUTOUT"]) else x["anyOUTPUTOUT"],
-                                                axis=1)
+    recode_df["anyHLABOUT"] = get_any_indicator(ss=recode_df["HLABOUT"])
+    recode_df["anyOUTPUTOUT"] = get_any_indicator(ss=recode_df["OUTPUTOUT"])
 
     recode_df["OUTPUTOUT"] = recode_df["OUTPUTOUT"].add(recode_df["INPUTOUT"], fill_value=0)
     recode_df["OUTPUTIN"] = recode_df["OUTPUTIN"].add(recode_df["INPUTIN"], fill_value=0)
@@ -61,21 +59,62 @@ def pre_process_data(df):
     recode_df["HLAB"] = recode_df["HLABOUT"].add(recode_df["HLABIN"])
     recode_df["transactions"] = recode_df["OUTPUT"].add(recode_df["HLAB"])
 
-    # Filter shocks
-    shock_filter_ss = recode_df["_degree_Tot_t_j"] > 0
-    shock_filter_ss = shock_filter_ss & (~recode_df["_degree_Tot_t_j"].isna())
-    keep_df = recode_df.loc[shock_filter_ss].copy()
+    # Filter shocks, the indirect filter folded into the same mask
+    keep_ss = recode_df["_degree_Tot_t_j"] > 0
+    keep_ss = keep_ss & (recode_df["shocks_i"] == 0)
+    keep_df = utils.apply_masks(df=recode_df, mask_ls=[keep_ss])
+    return keep_df
+
+
+@trace.traced(name="figure_2.pre_process_data")
+@memo.memoize_frame
+def pre_process_data(df):
+    attritors_df = filter_attritors(df=df)
+
+    # Post_i indicator
+    post_ss = get_post_indicator(df=attritors_df)
+    attritors_df["post_i"] = post_ss
+
+    # Compute shocks_i, 1 if the dyad has any post_i month
+    panel = dyads.DyadPanel.from_frame(df=attritors_df)
+    attritors_df["shocks_i"] = panel.transform_dyad(values=post_ss.to_numpy(), ufunc=np.maximum)
 
-    indirect_filter_ss = keep_df["shocks_i"] == 0
-    keep_df = keep_df.loc[indirect_filter_ss].copy()
+    keep_df = compute_variables(df=attritors_df)
     return keep_df
 
 
-def regress_diff_in_diff(df, dv, tau, h, fe=None, fe_inter=None, control=None, clustvar=None, cluster=False):
-    copy_df = df.copy()
+def get_dyad_index(df):
+    dyad_index = pd.MultiIndex.from_frame(df[["id", "id_j"]])
+    return dyad_index
+
+
+@trace.traced(name="figure_2.scan_shocks")
+def scan_shocks(chunk_size=None):
+    # shocks_i spans every month of a dyad, so the dyads with a post_i month are collected in a first pass
+    column_ls = get_input_list()
+    shock_df_ls = [pd.DataFrame(columns=["id", "id_j"])]
+    for chunk in utils.iter_data(file="dyads_es_max", columns=column_ls, chunksize=chunk_size):
+        attritors_df = filter_attritors(df=chunk)
+        post_ss = get_post_indicator(df=attritors_df)
+        shock_df_ls.append(attritors_df.loc[post_ss == 1, ["id", "id_j"]].drop_duplicates())
+    shock_df = pd.concat(shock_df_ls, ignore_index=True).drop_duplicates()
+    shock_index = get_dyad_index(df=shock_df)
+    return shock_index
 
+
+def pre_process_chunk(df, shock_index):
+    # Same rows and variables as pre_process_data for the rows of a chunk
+    attritors_df = filter_attritors(df=df)
+    post_ss = get_post_indicator(df=attritors_df)
+    attritors_df["post_i"] = post_ss
+    attritors_df["shocks_i"] = get_dyad_index(df=attritors_df).isin(shock_index).astype(int)
+
+    keep_df = compute_variables(df=attritors_df)
+    return keep_df
+
+
+def prepare_data(df, dependent_ls, tau, h, fe=None, fe_inter=None, control=None, clustvar=None):
     iter_ls = [
-        dv,
         tau,
         h,
         clustvar,
@@ -83,40 +122,37 @@ def regress_diff_in_diff(df, dv, tau, h, fe=None, fe_inter=None, control=None, c
         fe_inter,
         control,
     ]
-    keep_ls = list()
-    for i in iter_ls:
-        if isinstance(i, list):
-            for j in i:
-                if isinstance(j, tuple):
-                    k, l = j
-                    keep_ls.append(k)
-                    keep_ls.append(l)
-                else:
-                    keep_ls.append(j)
-        else:
-            keep_ls.append(i)
-    keep_ls = list(set(keep_ls))
-    copy_df = copy_df.loc[:, keep_ls].copy()
-    copy_df = copy_df.dropna()
-
-    # Handle categorical variable
-    tau_ss = copy_df[tau].copy()
-    category_ls = sorted(tau_ss.dropna().unique())
+    rhs_ls = utils.get_keep_list(iter_ls=iter_ls)
+    keep_ls = utils.get_keep_list(iter_ls=[dependent_ls, rhs_ls])
+    copy_df = df.loc[:, keep_ls].dropna(subset=rhs_ls)
+    return copy_df
+
+
+def encode_data(df, tau, clustvar=None, category_ls=None):
+    # Handle categorical variable, chunks pass the categories of the whole sample
+    tau_ss = df[tau].copy()
+    if category_ls is None:
+        category_ls = sorted(tau_ss.dropna().unique())
     tau_cat_ss = pd.Categorical(tau_ss, categories=category_ls, ordered=True)
     tau_cat = f"{tau}_cat"
-    copy_df[tau_cat] = tau_cat_ss
+    df[tau_cat] = tau_cat_ss
 
     if clustvar is not None:
         if isinstance(clustvar, list):
             for clustvar_i in clustvar:
-                copy_df[clustvar_i] = pd.Categorical(copy_df[clustvar_i], ordered=True)
+                df[clustvar_i] = pd.Categorical(df[clustvar_i], ordered=True)
         else:
-            copy_df[clustvar] = pd.Categorical(copy_df[clustvar], ordered=True)
+            df[clustvar] = pd.Categorical(df[clustvar], ordered=True)
+    return df
 
-    # Create formula
-    formula = f"{dv} ~ C({tau_cat}, Treatment(reference=-1)):{h}"
+
+def get_formula(tau, h, fe=None, fe_inter=None, control=None, method=None):
+    method = estimation.get_method(method=method)
+    tau_cat = f"{tau}_cat"
+
+    formula = f"C({tau_cat}, Treatment(reference=-1)):{h}"
     formula = f"{formula} + C({tau_cat}, Treatment(reference=-1)) + {h}"
-    if fe is not None:
+    if fe is not None and method == "ols":
         if isinstance(fe, list):
             fe_formula_ls = [f"C({i})" for i in fe]
             fe_formula = " + ".join(fe_formula_ls)
@@ -124,7 +160,7 @@ def regress_diff_in_diff(df, dv, tau, h, fe=None, fe_inter=None, control=None, c
             fe_formula = f"C({fe})"
         formula = f"{formula} + {fe_formula}"
 
-    if fe_inter is not None:
+    if fe_inter is not None and method == "ols":
         # Assumed that i is continuous and j dummy
         fe_inter_formula_ls = [f"{i}:C({j})" for i, j in fe_inter]
         fe_inter_formula = " + ".join(fe_inter_formula_ls)
@@ -136,20 +172,206 @@ def regress_diff_in_diff(df, dv, tau, h, fe=None, fe_inter=None, control=None, c
         else:
             control_formula = control
         formula = f"{formula} + {control_formula}"
+    return formula
 
-    model = smf.ols(formula, data=copy_df)
-    results = model.fit()
 
-    if cluster:
-        cluster_1, cluster_2 = clustvar
-        cluster_1_ss = copy_df[cluster_1].copy()
-        cluster_2_ss = copy_df[cluster_2].copy()
+def set_clustered_bse(results, df, clustvar):
+    cluster_1, cluster_2 = clustvar
+    cluster_1_ss = df[cluster_1].copy()
+    cluster_2_ss = df[cluster_2].copy()
+    if isinstance(results, estimation.EstimationResult):
+        panel = dyads.DyadPanel.from_frame(df=df, id_col=cluster_1, id_j_col=cluster_2)
+        codes_1, codes_2 = panel.get_cluster_codes()
+        covariance = estimation.cov_cluster_2way(result=results, codes_1=codes_1, codes_2=codes_2)
+    else:
         covariance = utils.cov_cluster_2way(model=results, cluster1=cluster_1_ss, cluster2=cluster_2_ss)
-        results.clustered_bse = np.sqrt(np.diag(covariance))
+    results.clustered_bse = np.sqrt(np.diag(covariance))
+    return results
+
+
+def get_design_cache(df, dependent_ls, tau, h, fe=None, fe_inter=None, control=None, clustvar=None,
+                     method=None, tol=None):
+    method = estimation.get_method(method=method)
+
+    copy_df = prepare_data(df=df,
+                           dependent_ls=dependent_ls,
+                           tau=tau,
+                           h=h,
+                           fe=fe,
+                           fe_inter=fe_inter,
+                           control=control,
+                           clustvar=clustvar)
+    formula = get_formula(tau=tau, h=h, fe=fe, fe_inter=fe_inter, control=control, method=method)
+    encode_func = partial(encode_data, tau=tau, clustvar=clustvar)
+    design_cache = design.DesignCache(df=copy_df,
+                                      formula=formula,
+                                      encode_func=encode_func,
+                                      fe=fe,
+                                      fe_inter=fe_inter,
+                                      clustvar=clustvar,
+                                      method=method,
+                                      tol=tol)
+    return design_cache
+
+
+def fit_design_cache(design_cache, dependent_ls, clustvar=None, cluster=False, event_term=None, n_wild=None,
+                     weight_type=None, wild_seed=None):
+    if n_wild:
+        wild_bootstrap.check_weight_type(weight_type=weight_type)
+
+    result_dd = dict()
+    group_ls = estimation.get_missing_groups(df=design_cache.df, dependent_ls=dependent_ls)
+    for group_dependent_ls in group_ls:
+        group_design = design_cache.get_design(dependent_ls=group_dependent_ls)
+        group_result_dd = group_design.fit(y=group_dependent_ls, tol=design_cache.tol)
+        if cluster:
+            group_result_dd = {k: set_clustered_bse(results=v, df=group_design.df, clustvar=clustvar)
+                               for k, v in group_result_dd.items()}
+        if event_term is not None:
+            # The clustered errors need the full result, only the event-time block is kept afterwards
+            group_result_dd = event_study.compact_results(design=group_design,
+                                                          result_dd=group_result_dd,
+                                                          event_term=event_term,
+                                                          n_wild=n_wild,
+                                                          weight_type=weight_type,
+                                                          wild_seed=wild_seed)
+        result_dd.update(group_result_dd)
+
+    result_dd = {dv: result_dd[dv] for dv in dependent_ls}
+    return result_dd
+
+
+def regress_diff_in_diff(df, dv, tau, h, fe=None, fe_inter=None, control=None, clustvar=None, cluster=False,
+                         method=None, design_cache=None, tol=None):
+    if design_cache is not None:
+        # The design was built once for the sample, only the outcome changes
+        results = fit_design_cache(design_cache=design_cache, dependent_ls=[dv], clustvar=clustvar, cluster=cluster)
+        results = results[dv]
+        return results
+
+    method = estimation.get_method(method=method)
+
+    copy_df = prepare_data(df=df,
+                           dependent_ls=[dv],
+                           tau=tau,
+                           h=h,
+                           fe=fe,
+                           fe_inter=fe_inter,
+                           control=control,
+                           clustvar=clustvar)
+    copy_df = copy_df.dropna(subset=[dv])
+    copy_df = encode_data(df=copy_df, tau=tau, clustvar=clustvar)
+
+    # Create formula
+    rhs_formula = get_formula(tau=tau, h=h, fe=fe, fe_inter=fe_inter, control=control, method=method)
+    formula = f"{dv} ~ {rhs_formula}"
+
+    if method != "ols":
+        # Project out the FE and the heterogeneous slopes instead of building them as columns
+        results = estimation.fit_formula_absorbed(formula=formula,
+                                                  df=copy_df,
+                                                  fe=fe,
+                                                  fe_inter=fe_inter,
+                                                  method=method,
+                                                  tol=tol)
+    else:
+        model = smf.ols(formula, data=copy_df)
+        results = model.fit()
+
+    if cluster:
+        results = set_clustered_bse(results=results, df=copy_df, clustvar=clustvar)
 
     return results
 
 
+def regress_diff_in_diff_batch(df, dependent_ls, tau, h, fe=None, fe_inter=None, control=None, clustvar=None,
+                               cluster=False, method=None, tol=None, n_wild=None, weight_type=None,
+                               wild_seed=None):
+    # Outcomes sharing a sample are solved against one design
+    design_cache = get_design_cache(df=df,
+                                    dependent_ls=dependent_ls,
+                                    tau=tau,
+                                    h=h,
+                                    fe=fe,
+                                    fe_inter=fe_inter,
+                                    control=control,
+                                    clustvar=clustvar,
+                                    method=method,
+                                    tol=tol)
+    result_dd = fit_design_cache(design_cache=design_cache,
+                                 dependent_ls=dependent_ls,
+                                 clustvar=clustvar,
+                                 cluster=cluster,
+                                 event_term=get_event_term(),
+                                 n_wild=n_wild,
+                                 weight_type=weight_type,
+                                 wild_seed=wild_seed)
+    return result_dd
+
+
+def iter_dyad_chunks(shock_index, dependent_ls, tau, h, fe=None, fe_inter=None, control=None, clustvar=None,
+                     chunk_size=None):
+    column_ls = get_required_columns(dependent_ls=dependent_ls,
+                                     kwargs_dd={"tau": tau, "h": h, "clustvar": clustvar, "fe": fe,
+                                                "fe_inter": fe_inter, "control": control})
+    for chunk in utils.iter_data(file="dyads_es_max", columns=column_ls, chunksize=chunk_size):
+        keep_df = pre_process_chunk(df=chunk, shock_index=shock_index)
+        yield prepare_data(df=keep_df,
+                           dependent_ls=dependent_ls,
+                           tau=tau,
+                           h=h,
+                           fe=fe,
+                           fe_inter=fe_inter,
+                           control=control,
+                           clustvar=clustvar)
+
+
+def encode_chunk(df, level_dd, tau):
+    encode_df = encode_data(df=df, tau=tau, category_ls=list(level_dd[tau]))
+    return encode_df
+
+
+def regress_diff_in_diff_stream(dependent_ls, tau, h, fe=None, fe_inter=None, control=None, clustvar=None,
+                                cluster=False, chunk_size=None, n_wild=None, weight_type=None,
+                                wild_seed=None):
+    # Out of core: the dyad file is read in chunks of chunk_size rows and only the normal equations are kept, the
+    # FE are always absorbed
+    if chunk_size is None:
+        chunk_size = get_chunk_size()
+
+    shock_index = scan_shocks(chunk_size=chunk_size)
+    chunk_func = partial(iter_dyad_chunks,
+                         shock_index=shock_index,
+                         dependent_ls=dependent_ls,
+                         tau=tau,
+                         h=h,
+                         fe=fe,
+                         fe_inter=fe_inter,
+                         control=control,
+                         clustvar=clustvar,
+                         chunk_size=chunk_size)
+    formula = get_formula(tau=tau, h=h, fe=fe, fe_inter=fe_inter, control=control, method="absorb")
+    result_dd = streaming.fit_streaming(chunk_func=chunk_func,
+                                        formula=formula,
+                                        dependent_ls=dependent_ls,
+                                        encode_func=partial(encode_chunk, tau=tau),
+                                        level_ls=[tau],
+                                        fe=fe,
+                                        fe_inter=fe_inter,
+                                        clustvar=clustvar,
+                                        cluster=cluster,
+                                        event_term=get_event_term(),
+                                        n_wild=n_wild,
+                                        weight_type=weight_type,
+                                        wild_seed=wild_seed)
+    return result_dd
+
+
+def get_event_term():
+    event_term = "C(tau_cat, Treatment(reference=-1)):close_tot"
+    return event_term
+
+
 def get_regex():
     regex_str = r"^C\(tau_cat, Treatment\(reference=-1\)\)\[T\.(.*?)\]:close_tot$"
     return regex_str
@@ -213,7 +435,11 @@ def plot_from_data(ax, plot_df, dv, confidence_ls):
     ax.grid(True)
 
 
-def generate_sub_plot(ax, dv, result):
+def extract_values_from_result(result):
+    if isinstance(result, event_study.EventStudyResult):
+        plot_df = result.get_plot_frame()
+        return plot_df
+
     regex_str = get_regex()
 
     raw_dd = {
@@ -225,38 +451,57 @@ def generate_sub_plot(ax, dv, result):
     concat_dd = {k: utils.append_baseline(ss=ss) for k, ss in extract_dd.items()}
     plot_df = pd.DataFrame(concat_dd)
 
+    interval_df = getattr(result, "interval_df", None)
+    if interval_df is not None:
+        plot_df = utils.append_intervals(plot_df=plot_df, interval_df=interval_df)
+    return plot_df
+
+
+def generate_sub_plot(ax, dv, result=None, plot_df=None):
+    if plot_df is None:
+        if result is None:
+            msg = f"result is not defined!"
+            raise Exception(msg)
+        plot_df = extract_values_from_result(result=result)
+
     confidence_ls = utils.get_confidence_list()
     for confidence in confidence_ls:
         interval = (1 - confidence) / 2 + confidence
         critical_value = sp.stats.norm.ppf(interval)
         lower_label = f"lower_{int(100 * confidence)}"
         upper_label = f"upper_{int(100 * confidence)}"
+        if lower_label in plot_df.columns:
+            # Bootstrap intervals are drawn as they are
+            continue
         plot_df[lower_label] = plot_df["coefficient"] - critical_value * plot_df["std_error"]
         plot_df[upper_label] = plot_df["coefficient"] + critical_value * plot_df["std_error"]
 
     plot_from_data(ax=ax, plot_df=plot_df, dv=dv, confidence_ls=confidence_ls)
 
 
-def generate_plot(dependent_ls, result_dd):
+def get_plot_dict(dependent_ls, result_dd):
+    plot_df_dd = {dv: extract_values_from_result(result=result_dd[dv]) for dv in dependent_ls}
+    return plot_df_dd
+
+
+@trace.traced(name="figure_2.generate_plot")
+def generate_plot(dependent_ls, result_dd=None, plot_df_dd=None):
+    if plot_df_dd is None:
+        plot_df_dd = get_plot_dict(dependent_ls=dependent_ls, result_dd=result_dd)
+
     fig, axes = plt.subplots(3, 2, figsize=(14, 10))
     axes = axes.flatten()
 
     iterate_ls = zip(dependent_ls, axes)
     for dv, ax in iterate_ls:
-        result = result_dd[dv]
-        generate_sub_plot(ax=ax, dv=dv, result=result)
+        plot_df = plot_df_dd[dv].copy()
+        generate_sub_plot(ax=ax, dv=dv, plot_df=plot_df)
 
     plt.tight_layout()
     return fig
 
 
-def generate_figure_2(cluster=None):
-    if cluster is None:
-        cluster = False
-
-    read_df = utils.read_data(file="dyads_es_max")
-    df = pre_process_data(df=read_df)
-
+def get_dependent_list():
     dependent_ls = [
         "transactions",
         "OUTPUT",
@@ -264,6 +509,12 @@ def generate_figure_2(cluster=None):
         "tincome_w",
         "exp_w",
     ]
+    return dependent_ls
+
+
+def construct_kwargs_dict(df, cluster=None, method=None):
+    if cluster is None:
+        cluster = False
 
     kwargs_dd = {
         "df": df,
@@ -274,14 +525,109 @@ def generate_figure_2(cluster=None):
         "fe_inter": [("_degree_Tot_t", "month")],
         "control": ["Nm", "Nf", "headage", "mean_edu"],
         "cluster": cluster,
+        "method": method,
     }
+    return kwargs_dd
+
+
+def get_input_list():
+    # Raw columns read by pre_process_data
+    input_ls = [
+        "id",
+        "id_j",
+        "tau",
+        "tau_i",
+        "no_attrition_food",
+        "no_attrition_food_j",
+        "Tot_geo",
+        "HLABOUT",
+        "HLABIN",
+        "OUTPUTOUT",
+        "OUTPUTIN",
+        "INPUTOUT",
+        "INPUTIN",
+        "_degree_Tot_t_j",
+    ]
+    return input_ls
+
+
+def get_derived_list():
+    # Columns created by pre_process_data
+    derived_ls = [
+        "post_i",
+        "shocks_i",
+        "ttt",
+        "post",
+        "c_tot",
+        "close_tot",
+        "anyHLABOUT",
+        "anyOUTPUTOUT",
+        "OUTPUT",
+        "HLAB",
+        "transactions",
+    ]
+    return derived_ls
+
+
+def get_required_columns(dependent_ls, kwargs_dd):
+    spec_ls = [dependent_ls] + [kwargs_dd[i] for i in ["tau", "h", "clustvar", "fe", "fe_inter", "control"]]
+    spec_ls = utils.get_keep_list(iter_ls=spec_ls)
+
+    derived_ls = get_derived_list()
+    column_ls = get_input_list() + [i for i in spec_ls if i not in derived_ls]
+    column_ls = sorted(set(column_ls))
+    return column_ls
+
+
+def get_chunk_size():
+    chunk_size = 500_000
+    return chunk_size
+
+
+def read_dyad_data(method=None):
+    dependent_ls = get_dependent_list()
+    spec_dd = construct_kwargs_dict(df=None, method=method)
+
+    # Only the columns the specification needs, read in compacted chunks
+    column_ls = get_required_columns(dependent_ls=dependent_ls, kwargs_dd=spec_dd)
+    chunk_size = get_chunk_size()
+    read_df = utils.read_data(file="dyads_es_max", columns=column_ls, chunksize=chunk_size)
+    return read_df
+
+
+def generate_figure_2(cluster=None, method=None, df=None, n_wild=None, weight_type=None, wild_seed=None,
+                      stream=None):
+    dependent_ls = get_dependent_list()
+
+    if stream:
+        # The dyad panel is never loaded as a whole
+        kwargs_dd = construct_kwargs_dict(df=None, cluster=cluster)
+        kwargs_dd = {k: v for k, v in kwargs_dd.items() if k not in ["df", "method"]}
+        result_dd = regress_diff_in_diff_stream(dependent_ls=dependent_ls,
+                                                n_wild=n_wild,
+                                                weight_type=weight_type,
+                                                wild_seed=wild_seed,
+                                                **kwargs_dd)
+    else:
+        # A preprocessed sample can be passed in when it is shared with other targets
+        if df is None:
+            read_df = read_dyad_data(method=method)
+            df = pre_process_data(df=read_df)
+
+        kwargs_dd = construct_kwargs_dict(df=df, cluster=cluster, method=method)
 
-    result_dd = {dv: regress_diff_in_diff(dv=dv, **kwargs_dd) for dv in dependent_ls}
-    panel_plot = generate_plot(dependent_ls=dependent_ls, result_dd=result_dd)
+        result_dd = result_cache.fit_cached(fit_func=regress_diff_in_diff_batch,
+                                            dependent_ls=dependent_ls,
+                                            n_wild=n_wild,
+                                            weight_type=weight_type,
+                                            wild_seed=wild_seed,
+                                            **kwargs_dd)
+    plot_df_dd = get_plot_dict(dependent_ls=dependent_ls, result_dd=result_dd)
 
     name = "figure_2.pdf"
-    utils.export_plot(name=name, panel_plot=panel_plot)
+    render.submit_plot(module_name="figure_2", func_name="generate_plot", name=name, plot_df_dd=plot_df_dd)
 
 
 def main(cluster=None):
     generate_figure_2(cluster=cluster)
+    render.wait()
@@ -0,0 +1,89 @@
+import hashlib
+import inspect
+import os
+import pandas as pd
+
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+
+from . import cache, utils
+
+_memory_cache = OrderedDict()
+
+
+def get_memory_size():
+    memory_size = int(os.getenv("PREPROCESS_CACHE_SIZE", 8))
+    return memory_size
+
+
+def use_disk_cache():
+    disk_cache = os.getenv("PREPROCESS_DISK_CACHE", "0") == "1"
+    return disk_cache
+
+
+def get_disk_path():
+    cache_path = utils.get_cache_path()
+    disk_path = Path(cache_path) / "preprocess"
+    return disk_path
+
+
+def clear_memory_cache():
+    _memory_cache.clear()
+
+
+def _get_content_hash(df):
+    row_hash = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    content_hash = hashlib.sha256(row_hash.tobytes()).hexdigest()
+    return content_hash
+
+
+def get_frame_fingerprint(df):
+    # The full content is hashed in one O(N) pass, so frames edited or filtered after reading never share a key
+    content_hash = _get_content_hash(df=df)
+    fingerprint = cache.get_key(content_hash, df.shape, list(df.columns), [str(i) for i in df.dtypes])
+    return fingerprint
+
+
+def _get_call_key(func, args, kwargs):
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    argument_dd = dict(bound.arguments)
+    df = argument_dd.pop("df")
+
+    fingerprint = get_frame_fingerprint(df=df)
+    key = cache.get_key(func.__module__, func.__qualname__, fingerprint, sorted(argument_dd.items()))
+    return key
+
+
+def _set_memory(key, df):
+    _memory_cache[key] = df
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > get_memory_size():
+        _memory_cache.popitem(last=False)
+
+
+def memoize_frame(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = _get_call_key(func=func, args=args, kwargs=kwargs)
+
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            df = _memory_cache[key]
+        else:
+            disk_path = get_disk_path() / f"{key}.pkl"
+            if use_disk_cache() and disk_path.exists():
+                df = pd.read_pickle(disk_path)
+            else:
+                df = func(*args, **kwargs)
+                if use_disk_cache():
+                    disk_path.parent.mkdir(parents=True, exist_ok=True)
+                    df.to_pickle(disk_path)
+            _set_memory(key=key, df=df)
+
+        # Callers may add columns, but the cached frame stays as computed
+        memo_df = df.copy(deep=False)
+        return memo_df
+
+    return wrapper
@@ -0,0 +1,223 @@
+import argparse
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from . import estimation, figure_1, figure_1_robustness, figure_2, render, shared, table_1, trace, utils
+
+
+def get_treat_column_list():
+    # Every TreatHS column read by the targets built from treat_raw
+    column_ls = sorted(set(figure_1.get_required_columns()) | set(table_1.get_required_columns()))
+    return column_ls
+
+
+def get_graph(method=None, n_bootstrap=None):
+    # Every artifact with the artifacts it is computed from, "inputs" maps arguments to upstream artifacts
+    graph_dd = {
+        "treat_raw": {
+            "func": partial(utils.read_data, columns=get_treat_column_list()),
+            "inputs": dict(),
+            "target": False,
+        },
+        "dyads_raw": {
+            "func": partial(figure_2.read_dyad_data, method=method),
+            "inputs": dict(),
+            "target": False,
+        },
+        "figure_1_data": {
+            "func": figure_1.pre_process_data,
+            "inputs": {"df": "treat_raw"},
+            "target": False,
+        },
+        "figure_1_36months_data": {
+            "func": partial(figure_1.pre_process_data, months=36),
+            "inputs": {"df": "treat_raw"},
+            "target": False,
+        },
+        "figure_1_window_sweep_data": {
+            "func": figure_1_robustness.pre_process_sweep_data,
+            "inputs": {"df": "treat_raw"},
+            "target": False,
+        },
+        "table_1_data": {
+            "func": table_1.pre_process_data,
+            "inputs": {"df": "treat_raw"},
+            "target": False,
+        },
+        "figure_2_data": {
+            "func": figure_2.pre_process_data,
+            "inputs": {"df": "dyads_raw"},
+            "target": False,
+        },
+        "figure_1": {
+            "func": partial(figure_1.generate_figure_1, method=method),
+            "inputs": {"df": "figure_1_data"},
+            "target": True,
+        },
+        "table_1": {
+            "func": partial(table_1.generate_table_1, method=method),
+            "inputs": {"df": "table_1_data"},
+            "target": True,
+        },
+        "figure_1_bootstrap": {
+            "func": partial(figure_1_robustness.run_bootstrap, n_bootstrap=n_bootstrap),
+            "inputs": {"df": "figure_1_data"},
+            "target": True,
+        },
+        "figure_1_36months": {
+            "func": figure_1_robustness.expand_window,
+            "inputs": {"df": "figure_1_36months_data"},
+            "target": True,
+        },
+        "figure_1_placebo": {
+            "func": partial(figure_1_robustness.run_placebo_test, n_bootstrap=n_bootstrap),
+            "inputs": {"df": "figure_1_data"},
+            "target": True,
+        },
+        "figure_1_window_sweep": {
+            "func": partial(figure_1_robustness.run_window_sweep, method=method),
+            "inputs": {"df": "figure_1_window_sweep_data"},
+            "target": True,
+            # Estimates the full window by step grid, only built when named
+            "default": False,
+        },
+        "figure_2": {
+            "func": partial(figure_2.generate_figure_2, method=method),
+            "inputs": {"df": "figure_2_data"},
+            "target": True,
+        },
+    }
+    return graph_dd
+
+
+def get_target_list(graph_dd):
+    target_ls = [k for k, v in graph_dd.items() if v["target"]]
+    return target_ls
+
+
+def get_default_target_list(graph_dd):
+    target_ls = [k for k in get_target_list(graph_dd=graph_dd) if graph_dd[k].get("default", True)]
+    return target_ls
+
+
+def _set_level(name, graph_dd, level_dd, visiting_ls):
+    if name in level_dd:
+        return level_dd[name]
+    if name in visiting_ls:
+        msg = f"cycle in pipeline graph at {name}"
+        raise Exception(msg)
+
+    visiting_ls.append(name)
+    input_level_ls = [_set_level(name=i, graph_dd=graph_dd, level_dd=level_dd, visiting_ls=visiting_ls)
+                      for i in graph_dd[name]["inputs"].values()]
+    visiting_ls.remove(name)
+    level_dd[name] = 1 + max(input_level_ls, default=-1)
+    return level_dd[name]
+
+
+def get_level_list(graph_dd, target_ls):
+    # Artifacts needed for the targets, grouped in levels whose members only depend on earlier levels
+    missing_ls = [i for i in target_ls if i not in graph_dd]
+    if len(missing_ls) > 0:
+        msg = f"targets {missing_ls} not implemented"
+        raise Exception(msg)
+
+    level_dd = dict()
+    for target in target_ls:
+        _set_level(name=target, graph_dd=graph_dd, level_dd=level_dd, visiting_ls=list())
+
+    n_levels = 1 + max(level_dd.values(), default=-1)
+    level_ls = [[k for k, v in level_dd.items() if v == i] for i in range(n_levels)]
+    return level_ls
+
+
+def run_node(name, func, kwargs_dd, shutdown_render=False):
+    kwargs_dd = {k: shared.attach_frame(handle=v) if isinstance(v, shared.SharedFrame) else v
+                 for k, v in kwargs_dd.items()}
+    with trace.span(name=f"pipeline.{name}"):
+        output = func(**kwargs_dd)
+    # In a pipeline worker the figures are written, and its render pool stopped, before the target counts as done
+    if shutdown_render:
+        render.shutdown()
+    # Targets export their own files, figures are not kept open in long-lived workers
+    plt.close("all")
+    return output
+
+
+def run_pipeline(target_ls=None, n_workers=None, method=None, n_bootstrap=None):
+    if n_workers is None:
+        n_workers = 1
+
+    method = estimation.get_method(method=method)
+    graph_dd = get_graph(method=method, n_bootstrap=n_bootstrap)
+    if target_ls is None:
+        target_ls = get_default_target_list(graph_dd=graph_dd)
+    level_ls = get_level_list(graph_dd=graph_dd, target_ls=target_ls)
+
+    # Datasets are loaded once in this process, independent targets run concurrently
+    artifact_dd = dict()
+    handle_dd = dict()
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    try:
+        for level in level_ls:
+            future_dd = dict()
+            for name in level:
+                node_dd = graph_dd[name]
+                kwargs_dd = {k: artifact_dd[v] for k, v in node_dd["inputs"].items()}
+                if executor is not None and node_dd["target"]:
+                    # Frames are published once and mapped by every target that reads them
+                    for k, v in node_dd["inputs"].items():
+                        if isinstance(artifact_dd[v], pd.DataFrame):
+                            if v not in handle_dd:
+                                handle_dd[v] = shared.publish_frame(df=artifact_dd[v])
+                            kwargs_dd[k] = handle_dd[v]
+                    future = executor.submit(run_node,
+                                             name=name,
+                                             func=node_dd["func"],
+                                             kwargs_dd=kwargs_dd,
+                                             shutdown_render=True)
+                    future_dd[future] = name
+                else:
+                    artifact_dd[name] = run_node(name=name, func=node_dd["func"], kwargs_dd=kwargs_dd)
+
+            for future in as_completed(future_dd):
+                artifact_dd[future_dd[future]] = future.result()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        # Figures of targets built in this process render while the next ones are estimated
+        render.shutdown()
+        for handle in handle_dd.values():
+            shared.release_frame(handle=handle)
+
+    return target_ls
+
+
+def get_parser():
+    graph_dd = get_graph()
+    default_ls = get_default_target_list(graph_dd=graph_dd)
+    opt_in_ls = [i for i in get_target_list(graph_dd=graph_dd) if i not in default_ls]
+
+    parser = argparse.ArgumentParser(description="Build the replication figures and tables.")
+    parser.add_argument("targets", nargs="*", default=list(),
+                        help=f"artifacts to build, by default {', '.join(default_ls)}; only when named: "
+                             f"{', '.join(opt_in_ls)}")
+    parser.add_argument("--workers", type=int, default=None, help="targets built concurrently")
+    parser.add_argument("--method", choices=estimation.get_method_list(), default=None, help="fixed effect estimator")
+    parser.add_argument("--n-bootstrap", type=int, default=None, help="bootstrap and placebo replicates")
+    parser.add_argument("--trace", default=None, help="JSON lines file for stage timings")
+    return parser
+
+
+def main(argv=None):
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    if args.trace is not None:
+        trace.enable(path=args.trace)
+
+    target_ls = args.targets if len(args.targets) > 0 else None
+    run_pipeline(target_ls=target_ls, n_workers=args.workers, method=args.method, n_bootstrap=args.n_bootstrap)
@@ -0,0 +1,117 @@
+import importlib
+import matplotlib
+import os
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from . import trace, utils
+
+# Render pool, started on the first figure and reused by the following ones
+_executor = None
+_executor_pid = None
+_future_ls = list()
+
+
+def get_render_workers():
+    # 0 renders in the calling process
+    render_workers = int(os.getenv("RENDER_WORKERS", "1"))
+    return render_workers
+
+
+def get_plot_data_path(name):
+    export_path = utils.get_export_path()
+    path = Path(export_path) / f"{Path(name).stem}_plot_data.csv"
+    return path
+
+
+def get_plot_frame(plot_df_dd):
+    # One row per outcome and event time, panels keep the order of the dict
+    plot_data_df = pd.concat(plot_df_dd, axis=0, names=["dv", "tau"])
+    plot_data_df = plot_data_df.reset_index()
+    return plot_data_df
+
+
+def get_plot_dict(plot_data_df):
+    dependent_ls = list(pd.unique(plot_data_df["dv"]))
+    plot_df_dd = dict()
+    for dv in dependent_ls:
+        plot_df = plot_data_df.loc[plot_data_df["dv"] == dv].drop(columns="dv")
+        plot_df = plot_df.set_index("tau")
+        plot_df.index.name = None
+        plot_df_dd[dv] = plot_df
+    return plot_df_dd
+
+
+def write_plot_data(name, plot_data_df):
+    path = get_plot_data_path(name=name)
+    plot_data_df.to_csv(path, index=False)
+    return path
+
+
+def read_plot_data(name):
+    path = get_plot_data_path(name=name)
+    plot_data_df = pd.read_csv(path)
+    return plot_data_df
+
+
+def _init_worker():
+    # Headless backend, workers never need a display
+    matplotlib.use("Agg")
+
+
+@trace.traced(name="render.render_plot")
+def render_plot(module_name, func_name, name):
+    # Only reads the persisted panels, so a figure can be restyled and rendered again without estimating
+    module = importlib.import_module(f"{__package__}.{module_name}")
+    plot_func = getattr(module, func_name)
+
+    plot_data_df = read_plot_data(name=name)
+    plot_df_dd = get_plot_dict(plot_data_df=plot_data_df)
+    panel_plot = plot_func(dependent_ls=list(plot_df_dd), plot_df_dd=plot_df_dd)
+    utils.export_plot(name=name, panel_plot=panel_plot)
+    return name
+
+
+def get_executor():
+    global _executor, _executor_pid
+    # A forked process does not own the pool it inherited
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ProcessPoolExecutor(max_workers=get_render_workers(), initializer=_init_worker)
+        _executor_pid = os.getpid()
+        _future_ls.clear()
+    return _executor
+
+
+def submit_plot(module_name, func_name, name, plot_df_dd):
+    plot_data_df = get_plot_frame(plot_df_dd=plot_df_dd)
+    write_plot_data(name=name, plot_data_df=plot_data_df)
+
+    if get_render_workers() == 0:
+        render_plot(module_name=module_name, func_name=func_name, name=name)
+        return None
+
+    # Estimation goes on while the PDF is written
+    future = get_executor().submit(render_plot, module_name=module_name, func_name=func_name, name=name)
+    _future_ls.append(future)
+    return future
+
+
+def wait():
+    # Raises the first rendering error, if any
+    name_ls = [future.result() for future in _future_ls]
+    _future_ls.clear()
+    return name_ls
+
+
+def shutdown():
+    global _executor
+    try:
+        name_ls = wait()
+    finally:
+        _future_ls.clear()
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown()
+        _executor = None
+    return name_ls
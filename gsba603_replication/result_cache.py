@@ -0,0 +1,158 @@
+import json
+import numpy as np
+import os
+import pandas as pd
+
+from pathlib import Path
+
+from . import cache, memo, utils
+
+
+def get_estimator_version():
+    # Bump when estimates change for the same data and specification
+    estimator_version = 1
+    return estimator_version
+
+
+def use_result_cache():
+    result_cache = os.getenv("RESULT_CACHE", "0") == "1"
+    return result_cache
+
+
+def get_result_path():
+    cache_path = utils.get_cache_path()
+    result_path = Path(cache_path) / "results"
+    return result_path
+
+
+class CachedResult:
+    def __init__(self, params, bse, nobs, rsquared, rsquared_adj, clustered_bse=None, interval_df=None):
+        self.params = params
+        self.bse = bse
+        self.nobs = nobs
+        self.rsquared = rsquared
+        self.rsquared_adj = rsquared_adj
+        self.clustered_bse = clustered_bse
+        self.interval_df = interval_df
+
+    @classmethod
+    def from_result(cls, result):
+        clustered_bse = getattr(result, "clustered_bse", None)
+        if clustered_bse is not None:
+            clustered_bse = np.asarray(clustered_bse, dtype=float)
+
+        cached_result = cls(params=pd.Series(result.params, dtype=float),
+                            bse=pd.Series(result.bse, dtype=float),
+                            nobs=int(result.nobs),
+                            rsquared=float(result.rsquared),
+                            rsquared_adj=float(result.rsquared_adj),
+                            clustered_bse=clustered_bse,
+                            interval_df=getattr(result, "interval_df", None))
+        return cached_result
+
+    def to_dict(self):
+        # NaN for omitted columns is kept as null
+        result_dd = {
+            "index": list(self.params.index),
+            "params": [None if np.isnan(i) else i for i in self.params],
+            "bse": [None if np.isnan(i) else i for i in self.bse],
+            "nobs": self.nobs,
+            "rsquared": self.rsquared,
+            "rsquared_adj": self.rsquared_adj,
+            "clustered_bse": None,
+            "interval": None,
+        }
+        if self.clustered_bse is not None:
+            result_dd["clustered_bse"] = [None if np.isnan(i) else i for i in self.clustered_bse]
+        if self.interval_df is not None:
+            result_dd["interval"] = {
+                "index": self.interval_df.index.tolist(),
+                "columns": list(self.interval_df.columns),
+                "data": [[None if np.isnan(j) else j for j in i] for i in self.interval_df.to_numpy().tolist()],
+            }
+        return result_dd
+
+    @classmethod
+    def from_dict(cls, result_dd):
+        index = result_dd["index"]
+        clustered_bse = result_dd["clustered_bse"]
+        if clustered_bse is not None:
+            clustered_bse = np.array(clustered_bse, dtype=float)
+        interval_df = None
+        if result_dd.get("interval") is not None:
+            interval_df = pd.DataFrame(result_dd["interval"]["data"],
+                                       index=result_dd["interval"]["index"],
+                                       columns=result_dd["interval"]["columns"],
+                                       dtype=float)
+
+        cached_result = cls(params=pd.Series(result_dd["params"], index=index, dtype=float),
+                            bse=pd.Series(result_dd["bse"], index=index, dtype=float),
+                            nobs=result_dd["nobs"],
+                            rsquared=result_dd["rsquared"],
+                            rsquared_adj=result_dd["rsquared_adj"],
+                            clustered_bse=clustered_bse,
+                            interval_df=interval_df)
+        return cached_result
+
+
+def get_data_fingerprint(df):
+    # The estimation sample is hashed in full, whatever preprocessing produced it
+    fingerprint = memo.get_frame_fingerprint(df=df)
+    return fingerprint
+
+
+def get_result_key(fit_func, fingerprint, dv, spec_dd):
+    spec_ls = sorted((k, repr(v)) for k, v in spec_dd.items())
+    key = cache.get_key(fit_func.__module__,
+                        fit_func.__qualname__,
+                        get_estimator_version(),
+                        fingerprint,
+                        dv,
+                        spec_ls)
+    return key
+
+
+def read_result(key):
+    path = get_result_path() / f"{key}.json"
+    if not path.exists():
+        return None
+
+    with open(path) as f:
+        result_dd = json.load(f)
+    cached_result = CachedResult.from_dict(result_dd=result_dd)
+    return cached_result
+
+
+def write_result(key, result):
+    result_path = get_result_path()
+    result_path.mkdir(parents=True, exist_ok=True)
+
+    # Written next to the target and swapped, so a failed run never leaves a truncated entry
+    path = result_path / f"{key}.json"
+    tmp_path = result_path / f"{key}.json.tmp"
+    cached_result = CachedResult.from_result(result=result)
+    with open(tmp_path, "w") as f:
+        json.dump(cached_result.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def fit_cached(fit_func, df, dependent_ls, **kwargs):
+    # Only outcomes whose data, specification or estimator changed are estimated again
+    if not use_result_cache():
+        result_dd = fit_func(df=df, dependent_ls=dependent_ls, **kwargs)
+        return result_dd
+
+    fingerprint = get_data_fingerprint(df=df)
+    key_dd = {dv: get_result_key(fit_func=fit_func, fingerprint=fingerprint, dv=dv, spec_dd=kwargs)
+              for dv in dependent_ls}
+    result_dd = {dv: read_result(key=key) for dv, key in key_dd.items()}
+
+    missing_ls = [dv for dv, result in result_dd.items() if result is None]
+    if len(missing_ls) > 0:
+        fit_result_dd = fit_func(df=df, dependent_ls=missing_ls, **kwargs)
+        for dv, result in fit_result_dd.items():
+            write_result(key=key_dd[dv], result=result)
+        result_dd.update(fit_result_dd)
+
+    result_dd = {dv: result_dd[dv] for dv in dependent_ls}
+    return result_dd
@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+import uuid
+
+from pathlib import Path
+
+from . import cache, utils
+
+
+class SharedFrame:
+    # Picklable handle of a published frame, it travels to the workers instead of the frame
+    def __init__(self, store_path, attrs_dd, df=None):
+        self.store_path = None if store_path is None else str(store_path)
+        self.attrs_dd = attrs_dd
+        # Only set when no directory could be written, the frame is then pickled with the handle
+        self.df = df
+
+
+def get_shared_path():
+    shared_path = Path(utils.get_cache_path()) / "shared"
+    return shared_path
+
+
+def _write_shared(store_path, df):
+    try:
+        cache.write_frame(store_path=store_path, df=df)
+    except OSError:
+        # Nothing half-written is left behind
+        shutil.rmtree(store_path.with_name(f"{store_path.name}.tmp"), ignore_errors=True)
+        shutil.rmtree(store_path, ignore_errors=True)
+        return False
+    return True
+
+
+def publish_frame(df):
+    # Written once as one .npy file per column, next to the columnar copies of the source files
+    attrs_dd = dict(df.attrs)
+    store_path = get_shared_path() / uuid.uuid4().hex
+    if _write_shared(store_path=store_path, df=df):
+        return SharedFrame(store_path=store_path, attrs_dd=attrs_dd)
+
+    # The cache directory cannot be written (e.g. a read-only data mount), a temporary directory is used instead
+    try:
+        store_path = Path(tempfile.mkdtemp(prefix="gsba603_shared_"))
+    except OSError:
+        store_path = None
+    if store_path is not None and _write_shared(store_path=store_path, df=df):
+        return SharedFrame(store_path=store_path, attrs_dd=attrs_dd)
+
+    handle = SharedFrame(store_path=None, attrs_dd=attrs_dd, df=df)
+    return handle
+
+
+def attach_frame(handle):
+    if handle.store_path is None:
+        # Unpickled in a worker it is already a private copy, in the publishing process it is copied here
+        df = handle.df.copy()
+        df.attrs.update(handle.attrs_dd)
+        return df
+
+    # Copy-on-write mapping: workers share the pages of the file, a worker that writes gets its own copy
+    df = cache.read_store(store_path=handle.store_path, mmap_mode="c")
+    df.attrs.update(handle.attrs_dd)
+    return df
+
+
+def release_frame(handle):
+    if handle.store_path is None:
+        return
+    shutil.rmtree(handle.store_path, ignore_errors=True)
@@ -0,0 +1,444 @@
+import numpy as np
+import pandas as pd
+
+from patsy import build_design_matrices, dmatrix
+
+from . import estimation, event_study, trace, utils, wild_bootstrap
+
+
+def get_cluster_list(clustvar):
+    if clustvar is None:
+        return list()
+    if isinstance(clustvar, list):
+        return clustvar
+    return [clustvar]
+
+
+def get_fe_list(fe):
+    if fe is None:
+        return list()
+    if isinstance(fe, list):
+        return fe
+    return [fe]
+
+
+def get_level_list(fe, fe_inter=None):
+    # Columns whose levels index the FE arrays
+    group_ls = [j for _, j in fe_inter] if fe_inter is not None else list()
+    level_ls = utils.get_keep_list(iter_ls=[get_fe_list(fe=fe), group_ls])
+    return level_ls
+
+
+def get_stream_groups(differ_arr, dependent_ls):
+    # Outcomes whose masks never differed share one estimation sample, as in estimation.get_missing_groups
+    group_ls = list()
+    assigned_ls = list()
+    for i, dv in enumerate(dependent_ls):
+        if dv in assigned_ls:
+            continue
+        group = [dependent_ls[j] for j in range(i, len(dependent_ls)) if not differ_arr[i, j]]
+        assigned_ls += group
+        group_ls.append(group)
+    return group_ls
+
+
+class StreamSample:
+    # Levels of the whole sample, so FE and cluster codes of every chunk index the same arrays
+    def __init__(self, level_dd, cluster_df, group_ls, n_obs):
+        self.level_dd = level_dd
+        self.cluster_ls = list(cluster_df.columns)
+        self.cluster_index = pd.MultiIndex.from_frame(cluster_df) if len(self.cluster_ls) > 0 else None
+        self.cluster_codes_ls = [pd.factorize(cluster_df[i], sort=True)[0] for i in self.cluster_ls]
+        self.group_ls = group_ls
+        self.n_obs = n_obs
+
+    def get_codes(self, df, column):
+        codes = self.level_dd[column].get_indexer(df[column])
+        if (codes < 0).any():
+            msg = f"values of {column} were not in the first pass"
+            raise Exception(msg)
+        return codes
+
+    def get_cluster_codes(self, df):
+        # Codes of the finest intersection of the clusterings, i.e. rows of the cluster table
+        codes = self.cluster_index.get_indexer(pd.MultiIndex.from_frame(df[self.cluster_ls]))
+        return codes
+
+    def factorize_fe(self, df, fe, fe_inter=None):
+        # Same terms as estimation.factorize_fe
+        fe_ls = [(self.get_codes(df=df, column=i), len(self.level_dd[i]), None) for i in get_fe_list(fe=fe)]
+        if len(fe_ls) == 0:
+            fe_ls.append((np.zeros(df.shape[0], dtype=int), 1, None))
+
+        for i, j in fe_inter or list():
+            slope = df[i].to_numpy(dtype=float)
+            fe_ls.append((self.get_codes(df=df, column=j), len(self.level_dd[j]), slope))
+        return fe_ls
+
+
+@trace.traced(name="streaming.scan_sample")
+def scan_sample(chunk_func, dependent_ls, level_ls, clustvar=None):
+    # First pass: the levels, the cluster table (one row per observed combination) and the outcome groups
+    cluster_ls = get_cluster_list(clustvar=clustvar)
+    n_dependent = len(dependent_ls)
+    differ_arr = np.zeros((n_dependent, n_dependent), dtype=bool)
+    level_value_dd = {i: list() for i in level_ls}
+    cluster_df_ls = [pd.DataFrame(columns=cluster_ls)]
+    n_obs = 0
+
+    for chunk in chunk_func():
+        n_obs += chunk.shape[0]
+        for i in level_ls:
+            level_value_dd[i].append(pd.unique(chunk[i]))
+        if len(cluster_ls) > 0:
+            cluster_df_ls.append(chunk[cluster_ls].drop_duplicates())
+        mask_arr = chunk[dependent_ls].notna().to_numpy()
+        differ_arr |= (mask_arr[:, :, None] != mask_arr[:, None, :]).any(axis=0)
+
+    level_dd = {i: pd.Index(np.sort(pd.unique(np.concatenate(value_ls)))) for i, value_ls in level_value_dd.items()}
+    cluster_df = pd.concat(cluster_df_ls, ignore_index=True).drop_duplicates()
+    cluster_df = cluster_df.sort_values(cluster_ls, ignore_index=True)
+    trace.annotate(n_rows=n_obs, n_clusters=cluster_df.shape[0])
+
+    sample = StreamSample(level_dd=level_dd,
+                          cluster_df=cluster_df,
+                          group_ls=get_stream_groups(differ_arr=differ_arr, dependent_ls=dependent_ls),
+                          n_obs=n_obs)
+    return sample
+
+
+class NormalEquations:
+    # Cross products of one outcome group, z being the regressors followed by the outcomes. The first FE (id in
+    # the dyad panel) is absorbed in closed form, the other FE terms are kept as sparse columns, so the arrays grow
+    # with levels and columns but not with rows
+    def __init__(self, fe_ls, n_columns):
+        n_absorb = fe_ls[0][1]
+        n_term = sum(n_levels for _, n_levels, _ in fe_ls[1:])
+        self.is_slope_ls = [slope is not None for _, _, slope in fe_ls[1:]]
+
+        self.n_obs = 0
+        self.count_arr = np.zeros(n_absorb)
+        self.term_count_ls = [np.zeros(n_levels) for _, n_levels, _ in fe_ls[1:]]
+        self.absorb_term = np.zeros((n_absorb, n_term))
+        self.absorb_z = np.zeros((n_absorb, n_columns))
+        self.term_term = np.zeros((n_term, n_term))
+        self.term_z = np.zeros((n_term, n_columns))
+        self.z_z = np.zeros((n_columns, n_columns))
+
+    def add(self, fe_ls, z):
+        (absorb_codes, n_absorb, _), term_ls = fe_ls[0], fe_ls[1:]
+        absorb = estimation.get_indicator_matrix(codes=absorb_codes, n_levels=n_absorb)
+        term_design = estimation.get_term_design(term_ls=term_ls, n_obs=z.shape[0])
+
+        self.n_obs += z.shape[0]
+        self.count_arr += np.bincount(absorb_codes, minlength=n_absorb)
+        for count_arr, (codes, n_levels, _) in zip(self.term_count_ls, term_ls):
+            count_arr += np.bincount(codes, minlength=n_levels)
+        self.absorb_term += (absorb.T @ term_design).toarray()
+        self.absorb_z += absorb.T @ z
+        self.term_term += (term_design.T @ term_design).toarray()
+        self.term_z += term_design.T @ z
+        self.z_z += z.T @ z
+
+    def count_fe_columns(self):
+        # Levels present in the sample, as factorize_fe would find them
+        fe_ls = [(None, int((self.count_arr > 0).sum()), None)]
+        fe_ls += [(None, int((count_arr > 0).sum()), True if is_slope else None)
+                  for count_arr, is_slope in zip(self.term_count_ls, self.is_slope_ls)]
+        n_columns = estimation.count_fe_columns(fe_ls=fe_ls)
+        return n_columns
+
+    def solve(self, n_x):
+        # Frisch-Waugh on the blocks: the absorbed FE is a diagonal, then the other terms are partialled out
+        inv_count_arr = np.divide(1, self.count_arr, out=np.zeros(self.count_arr.shape), where=self.count_arr > 0)
+        term_term = self.term_term - self.absorb_term.T @ (inv_count_arr[:, None] * self.absorb_term)
+        term_z = self.term_z - self.absorb_term.T @ (inv_count_arr[:, None] * self.absorb_z)
+        z_z = self.z_z - self.absorb_z.T @ (inv_count_arr[:, None] * self.absorb_z)
+
+        term_pinv, term_rank = estimation.pinv_normal(gram=term_term)
+        self.term_coefficient = term_pinv @ term_z
+        self.absorb_coefficient = inv_count_arr[:, None] * (self.absorb_z - self.absorb_term @ self.term_coefficient)
+        demean_z_z = z_z - term_z.T @ self.term_coefficient
+
+        # Columns spanned by the FE are omitted, the cancellation in the cross products limits the cutoff to about
+        # the square root of the one in estimation.fit_batch
+        x_x = demean_z_z[:n_x, :n_x]
+        keep_arr = np.diag(x_x) > 1e-10 * np.maximum(np.diag(self.z_z)[:n_x], 1)
+        self.keep_arr = keep_arr
+        self.normalized_cov_params, x_rank = estimation.pinv_normal(gram=x_x[np.ix_(keep_arr, keep_arr)])
+
+        x_y = demean_z_z[:n_x, n_x:][keep_arr]
+        self.beta = self.normalized_cov_params @ x_y
+        self.ssr_arr = np.diag(demean_z_z[n_x:, n_x:]) - (self.beta * x_y).sum(axis=0)
+
+        # Every row has one level of the absorbed FE, so its block sums up to the column totals
+        y_sum_arr = self.absorb_z[:, n_x:].sum(axis=0)
+        self.tss_arr = np.diag(self.z_z[n_x:, n_x:]) - y_sum_arr ** 2 / self.n_obs
+
+        rank = x_rank + int((self.count_arr > 0).sum()) + term_rank
+        self.df_resid = self.n_obs - rank
+        self.k_params = self.count_fe_columns() + n_x
+
+    def get_score(self, fe_ls, z, n_x):
+        # Rows of x'u of the demeaned regressors, one block of columns per outcome
+        (absorb_codes, _, _), term_ls = fe_ls[0], fe_ls[1:]
+        term_design = estimation.get_term_design(term_ls=term_ls, n_obs=z.shape[0])
+        demean_z = z - self.absorb_coefficient[absorb_codes] - term_design @ self.term_coefficient
+
+        demean_x = demean_z[:, :n_x][:, self.keep_arr]
+        resid = demean_z[:, n_x:] - demean_x @ self.beta
+        xu = (demean_x[:, None, :] * resid[:, :, None]).reshape(z.shape[0], -1)
+        return xu
+
+
+def expand_cov(params, cov):
+    # Omitted columns get NaN rows and columns
+    name_ls = params.index
+    keep_ls = name_ls[params.notna()]
+    cov_df = pd.DataFrame(cov, index=keep_ls, columns=keep_ls)
+    cov_df = cov_df.reindex(index=name_ls, columns=name_ls)
+    return cov_df
+
+
+class StreamResult:
+    # The statistics of estimation.EstimationResult, without the per-row arrays a streamed fit never holds
+    def __init__(self, params, normalized_cov_params, cov, nobs, df_resid, k_params, ssr, tss, clustered_bse=None):
+        self.params = params
+        self.normalized_cov_params = normalized_cov_params
+        self.nobs = nobs
+        self.df_resid = df_resid
+        self.k_params = k_params
+        self.n_iter = 0
+        self.convergence = None
+        self.clustered_bse = clustered_bse
+
+        self.ssr = float(ssr)
+        self.rsquared = 1 - self.ssr / tss
+        self.rsquared_adj = 1 - (nobs - 1) / df_resid * (1 - self.rsquared)
+
+        self._cov_df = expand_cov(params=params, cov=cov)
+        self.bse = pd.Series(np.sqrt(np.diag(self._cov_df)), index=params.index)
+
+    def cov_params(self):
+        return self._cov_df
+
+
+def get_design_info(chunk_func, formula, encode_func, level_dd):
+    # Built on the first rows, the categories come from the levels of the whole sample
+    for chunk in chunk_func():
+        if chunk.shape[0] > 0:
+            chunk = encode_func(df=chunk, level_dd=level_dd)
+            design_info = dmatrix(formula, data=chunk).design_info
+            return design_info
+
+    msg = f"no observations to estimate"
+    raise Exception(msg)
+
+
+def iter_design_chunks(chunk_func, design_info, encode_func, level_dd):
+    for chunk in chunk_func():
+        if chunk.shape[0] == 0:
+            continue
+        chunk = encode_func(df=chunk, level_dd=level_dd)
+        x_df = build_design_matrices([design_info], chunk, NA_action="raise", return_type="dataframe")[0]
+        x_df = x_df.drop(columns="Intercept", errors="ignore")
+        yield chunk, x_df.to_numpy(dtype=float)
+
+
+def iter_group_chunks(chunk_func, design_info, encode_func, sample, fe, fe_inter=None):
+    # Per chunk and outcome group: the group's rows, its FE codes and z = [x, y]
+    for chunk, x_arr in iter_design_chunks(chunk_func=chunk_func,
+                                           design_info=design_info,
+                                           encode_func=encode_func,
+                                           level_dd=sample.level_dd):
+        for i, group in enumerate(sample.group_ls):
+            mask_arr = chunk[group].notna().all(axis=1).to_numpy()
+            if not mask_arr.any():
+                continue
+            group_df = chunk.loc[mask_arr]
+            z = np.column_stack([x_arr[mask_arr], group_df[group].to_numpy(dtype=float)])
+            fe_ls = sample.factorize_fe(df=group_df, fe=fe, fe_inter=fe_inter)
+            yield i, group_df, fe_ls, z
+
+
+@trace.traced(name="streaming.accumulate_equations")
+def accumulate_equations(chunk_func, design_info, encode_func, sample, fe, fe_inter=None):
+    equation_ls = [None for _ in sample.group_ls]
+    for i, _, fe_ls, z in iter_group_chunks(chunk_func=chunk_func,
+                                            design_info=design_info,
+                                            encode_func=encode_func,
+                                            sample=sample,
+                                            fe=fe,
+                                            fe_inter=fe_inter):
+        if equation_ls[i] is None:
+            equation_ls[i] = NormalEquations(fe_ls=fe_ls, n_columns=z.shape[1])
+        equation_ls[i].add(fe_ls=fe_ls, z=z)
+    trace.annotate(n_rows=sample.n_obs, n_outcomes=sum(len(i) for i in sample.group_ls))
+    return equation_ls
+
+
+@trace.traced(name="streaming.accumulate_scores")
+def accumulate_scores(chunk_func, design_info, encode_func, sample, equation_ls, fe, fe_inter=None):
+    # Second pass: x'u summed by cell of the finest intersection of the clusterings, the sandwich of every
+    # clustering (and the wild bootstrap) only needs these sums
+    n_x = len(design_info.column_names) - int("Intercept" in design_info.column_names)
+    n_clusters = sample.cluster_index.shape[0]
+    score_ls = [np.zeros((n_clusters, int(equation.keep_arr.sum()) * len(group)))
+                for equation, group in zip(equation_ls, sample.group_ls)]
+    count_ls = [np.zeros(n_clusters) for _ in sample.group_ls]
+
+    for i, group_df, fe_ls, z in iter_group_chunks(chunk_func=chunk_func,
+                                                   design_info=design_info,
+                                                   encode_func=encode_func,
+                                                   sample=sample,
+                                                   fe=fe,
+                                                   fe_inter=fe_inter):
+        xu = equation_ls[i].get_score(fe_ls=fe_ls, z=z, n_x=n_x)
+        codes = sample.get_cluster_codes(df=group_df)
+        indicator = estimation.get_indicator_matrix(codes=codes, n_levels=n_clusters)
+        score_ls[i] += indicator.T @ xu
+        count_ls[i] += np.bincount(codes, minlength=n_clusters)
+    trace.annotate(n_rows=sample.n_obs, n_clusters=n_clusters)
+    return score_ls, count_ls
+
+
+def get_group_results(equation, group, name_ls, sample, clustvar=None, cluster=False, score=None, count_arr=None):
+    n_keep = int(equation.keep_arr.sum())
+    if score is not None:
+        present_arr = count_arr > 0
+        score = score[present_arr].reshape(-1, len(group), n_keep)
+        codes_ls = [i[present_arr] for i in sample.cluster_codes_ls]
+
+    result_dd = dict()
+    score_dd = dict()
+    for i, dv in enumerate(group):
+        params = pd.Series(np.nan, index=name_ls)
+        params[equation.keep_arr] = equation.beta[:, i]
+
+        cluster_cov = None
+        if score is not None:
+            score_dd[dv] = score[:, i]
+            cluster_cov = estimation.cov_cluster_multiway(xu=score[:, i],
+                                                          hessian_inv=equation.normalized_cov_params,
+                                                          codes_ls=codes_ls,
+                                                          k_params=equation.k_params,
+                                                          n_obs=equation.n_obs)
+
+        # One-way clustering is the fit's covariance, two-way is added as clustered_bse, as in figure_2
+        clustered_bse = None
+        if isinstance(clustvar, str):
+            cov = cluster_cov
+        else:
+            cov = equation.normalized_cov_params * equation.ssr_arr[i] / equation.df_resid
+            if cluster and cluster_cov is not None:
+                clustered_bse = np.sqrt(np.diag(expand_cov(params=params, cov=cluster_cov)))
+
+        result_dd[dv] = StreamResult(params=params,
+                                     normalized_cov_params=equation.normalized_cov_params,
+                                     cov=cov,
+                                     nobs=equation.n_obs,
+                                     df_resid=equation.df_resid,
+                                     k_params=equation.k_params,
+                                     ssr=equation.ssr_arr[i],
+                                     tss=equation.tss_arr[i],
+                                     clustered_bse=clustered_bse)
+    return result_dd, score_dd
+
+
+def compact_stream_results(result_dd, score_dd, equation, design_info, name_ls, event_term, n_wild=None,
+                           weight_type=None, wild_seed=None):
+    # As event_study.compact_results, the wild weights are drawn per cell of the finest clustering
+    position_arr, tau_arr = event_study.get_event_positions(design_info=design_info,
+                                                            name_ls=name_ls,
+                                                            event_term=event_term)
+    event_result_dd = dict()
+    for dv, result in result_dd.items():
+        interval_df = None
+        if n_wild:
+            projection = wild_bootstrap.project_cluster_score(cluster_score=score_dd[dv],
+                                                              hessian_inv=equation.normalized_cov_params,
+                                                              keep_arr=equation.keep_arr,
+                                                              position_arr=position_arr)
+            coefficient_arr = np.asarray(result.params, dtype=float)[position_arr]
+            interval_df = wild_bootstrap.get_projection_intervals(projection=projection,
+                                                                  coefficient_arr=coefficient_arr,
+                                                                  tau_arr=tau_arr,
+                                                                  n_replicates=n_wild,
+                                                                  weight_type=weight_type,
+                                                                  seed=wild_seed)
+        event_result_dd[dv] = event_study.EventStudyResult.from_result(result=result,
+                                                                       position_arr=position_arr,
+                                                                       tau_arr=tau_arr,
+                                                                       interval_df=interval_df)
+    return event_result_dd
+
+
+@trace.traced(name="streaming.fit_streaming")
+def fit_streaming(chunk_func, formula, dependent_ls, encode_func, level_ls=None, fe=None, fe_inter=None,
+                  clustvar=None, cluster=False, event_term=None, n_wild=None, weight_type=None,
+                  wild_seed=None):
+    # chunk_func returns a fresh iterator over prepared chunks (complete right-hand side) on every call. The rows
+    # are read two or three times and never held together: memory is bounded by a chunk, the cross products of the
+    # FE and regressors, and one score row per cluster cell
+    if level_ls is None:
+        level_ls = list()
+    if n_wild and len(get_cluster_list(clustvar=clustvar)) == 0:
+        msg = f"the wild bootstrap needs clustvar!"
+        raise Exception(msg)
+    if n_wild:
+        wild_bootstrap.check_weight_type(weight_type=weight_type)
+
+    sample = scan_sample(chunk_func=chunk_func,
+                         dependent_ls=dependent_ls,
+                         level_ls=get_level_list(fe=fe, fe_inter=fe_inter) + level_ls,
+                         clustvar=clustvar)
+    design_info = get_design_info(chunk_func=chunk_func,
+                                  formula=formula,
+                                  encode_func=encode_func,
+                                  level_dd=sample.level_dd)
+    name_ls = [i for i in design_info.column_names if i != "Intercept"]
+
+    equation_ls = accumulate_equations(chunk_func=chunk_func,
+                                       design_info=design_info,
+                                       encode_func=encode_func,
+                                       sample=sample,
+                                       fe=fe,
+                                       fe_inter=fe_inter)
+    for equation in equation_ls:
+        equation.solve(n_x=len(name_ls))
+
+    score_ls = [None for _ in sample.group_ls]
+    count_ls = [None for _ in sample.group_ls]
+    if isinstance(clustvar, str) or (cluster and clustvar is not None) or n_wild:
+        score_ls, count_ls = accumulate_scores(chunk_func=chunk_func,
+                                               design_info=design_info,
+                                               encode_func=encode_func,
+                                               sample=sample,
+                                               equation_ls=equation_ls,
+                                               fe=fe,
+                                               fe_inter=fe_inter)
+
+    result_dd = dict()
+    for equation, group, score, count_arr in zip(equation_ls, sample.group_ls, score_ls, count_ls):
+        group_result_dd, score_dd = get_group_results(equation=equation,
+                                                      group=group,
+                                                      name_ls=name_ls,
+                                                      sample=sample,
+                                                      clustvar=clustvar,
+                                                      cluster=cluster,
+                                                      score=score,
+                                                      count_arr=count_arr)
+        if event_term is not None:
+            group_result_dd = compact_stream_results(result_dd=group_result_dd,
+                                                     score_dd=score_dd,
+                                                     equation=equation,
+                                                     design_info=design_info,
+                                                     name_ls=name_ls,
+                                                     event_term=event_term,
+                                                     n_wild=n_wild,
+                                                     weight_type=weight_type,
+                                                     wild_seed=wild_seed)
+        result_dd.update(group_result_dd)
+
+    result_dd = {dv: result_dd[dv] for dv in dependent_ls}
+    return result_dd
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+
+def get_outcome_list():
+    outcome_ls = [
+        "exp_nf",
+        "tot_hhspend",
+        "food_w",
+        "costs_ag_w",
+        "costs_livs_w",
+        "costs_fs_w",
+        "costs_nfbiz_w",
+        "AgREV_w",
+        "LREV_w",
+        "FSREV_w",
+        "BREV_w",
+        "hours_hired",
+        "hours_hhlab",
+    ]
+    return outcome_ls
+
+
+def get_control_list():
+    control_ls = ["Nm", "Nf", "headage", "mean_edu"]
+    return control_ls
+
+
+def get_transaction_list():
+    transaction_ls = ["HLABOUT", "HLABIN", "OUTPUTOUT", "OUTPUTIN", "INPUTOUT", "INPUTIN"]
+    return transaction_ls
+
+
+def generate_treat_data(n_households=100, n_months=72, shock_rate=0.5, missing_rate=0.03, seed=0):
+    # Household-month panel with the TreatHS columns used by figure 1 and table 1
+    rng = np.random.default_rng(seed)
+    n_obs = n_households * n_months
+
+    id_arr = np.repeat(np.arange(1, n_households + 1) * 7.0, n_months)
+    month_arr = np.tile(np.arange(n_months) + 500.0, n_households)
+    shock_arr = rng.integers(12, n_months - 12, n_households)
+    treated_arr = rng.random(n_households) < shock_rate
+    tau_arr = month_arr - 500 - np.repeat(shock_arr, n_months)
+
+    df = pd.DataFrame({
+        "id": id_arr,
+        "month": month_arr,
+        "tau": tau_arr,
+        "Treatment": np.repeat(treated_arr.astype(float), n_months),
+    })
+    df["treatment_subsample"] = np.repeat((shock_arr < n_months / 2).astype(float), n_months)
+    df["placebo_subsample"] = np.repeat(rng.integers(1, 3, n_households).astype(float), n_months)
+    df["no_attrition_food"] = np.repeat((rng.random(n_households) < 0.9).astype(float), n_months)
+
+    for control in get_control_list():
+        df[control] = rng.normal(size=n_obs) + np.repeat(rng.normal(size=n_households), n_months)
+
+    post_treat_ss = df["Treatment"] * (df["tau"] >= 0)
+    for outcome in get_outcome_list():
+        values = rng.gamma(2, 100, n_obs) + 50 * post_treat_ss.to_numpy()
+        values[rng.random(n_obs) < missing_rate] = np.nan
+        df[outcome] = values
+    df["n_symptom"] = rng.poisson(0.3, n_obs).astype(float)
+    return df
+
+
+def generate_dyad_data(treat_df, n_links=4, missing_rate=0.02, seed=0, months=24):
+    # Dyad-month panel with the dyads_es_max columns used by figure 2, tau is the shock timing of j
+    rng = np.random.default_rng(seed)
+    n_months = int(treat_df["month"].nunique())
+    n_households = treat_df.shape[0] // n_months
+
+    pair_i_arr = np.repeat(np.arange(n_households), n_links)
+    pair_j_arr = (pair_i_arr + rng.integers(1, n_households, pair_i_arr.shape[0])) % n_households
+    n_pairs = pair_i_arr.shape[0]
+
+    month_arr = np.tile(np.arange(n_months), n_pairs)
+    i_df = treat_df.iloc[np.repeat(pair_i_arr, n_months) * n_months + month_arr].reset_index(drop=True)
+    j_df = treat_df.iloc[np.repeat(pair_j_arr, n_months) * n_months + month_arr].reset_index(drop=True)
+    n_obs = i_df.shape[0]
+
+    df = pd.DataFrame({
+        "id": i_df["id"],
+        "id_j": j_df["id"].to_numpy(),
+        "month": i_df["month"],
+        "tau": j_df["tau"].to_numpy(),
+        "tau_i": i_df["tau"],
+        "no_attrition_food": i_df["no_attrition_food"],
+        "no_attrition_food_j": j_df["no_attrition_food"].to_numpy(),
+    })
+    for control in get_control_list():
+        df[control] = i_df[control]
+
+    # Distance is a dyad attribute
+    distance_arr = rng.choice([-1, 0, 1, 2, 3, 4], n_pairs).astype(float)
+    distance_arr[rng.random(n_pairs) < 0.1] = np.nan
+    df["Tot_geo"] = np.repeat(distance_arr, n_months)
+
+    for transaction in get_transaction_list():
+        values = rng.poisson(1.0, n_obs).astype(float)
+        values[rng.random(n_obs) < missing_rate] = np.nan
+        df[transaction] = values
+    df["tincome_w"] = rng.normal(1000, 100, n_obs)
+    df["exp_w"] = rng.normal(800, 100, n_obs)
+
+    df["_degree_Tot_t"] = rng.integers(0, 5, n_obs).astype(float)
+    degree_j_arr = rng.integers(0, 4, n_obs).astype(float)
+    degree_j_arr[rng.random(n_obs) < 0.05] = np.nan
+    df["_degree_Tot_t_j"] = degree_j_arr
+
+    # The event-study file only covers the analysis window of j
+    window_ss = (df["tau"] >= -months) & (df["tau"] < months)
+    df = df.loc[window_ss].reset_index(drop=True)
+    return df
+
+
+def write_synthetic_data(path, n_households=100, n_months=72, n_links=4, shock_rate=0.5, seed=0):
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    treat_df = generate_treat_data(n_households=n_households, n_months=n_months, shock_rate=shock_rate, seed=seed)
+    dyad_df = generate_dyad_data(treat_df=treat_df, n_links=n_links, seed=seed)
+
+    treat_path = path / "TreatHS.dta"
+    dyad_path = path / "dyads_es_max.dta"
+    treat_df.to_stata(treat_path, write_index=False)
+    dyad_df.to_stata(dyad_path, write_index=False)
+    return treat_path, dyad_path
@@ -1,7 +1,9 @@
 import pandas as pd
 import statsmodels.formula.api as smf
 
-from . import utils
+from functools import partial
+
+from . import design, estimation, memo, result_cache, trace, utils
 
 
 def generate_post_treatment(df, tau):
@@ -9,12 +11,16 @@ def generate_post_treatment(df, tau):
     return df
 
 
+@trace.traced(name="table_1.pre_process_data")
+@memo.memoize_frame
 def pre_process_data(df, tau="tau"):
-    # Two-year analysis window
-    window_filter_df = utils.filter_window(df=df, months=24)
-
-    # No-attrition filter
-    filter_df = utils.filter_attrition(df=window_filter_df)
+    # Two-year analysis window and no-attrition filter
+    mask_ls = [
+        utils.get_window_mask(df=df, months=24),
+        utils.get_attrition_mask(df=df),
+    ]
+    column_ls = get_required_columns()
+    filter_df = utils.apply_masks(df=df, mask_ls=mask_ls, columns=column_ls)
 
     # Calculations
     filter_df = utils.calculate_outcomes(df=filter_df)
@@ -25,16 +31,12 @@ def pre_process_data(df, tau="tau"):
     return filter_df
 
 
-def regress_diff_in_diff(df, dv, tau, treatment, post, fe=None, control=None, clustvar=None):
-    copy_df = df.copy()
-
+def prepare_data(df, dependent_ls, tau, treatment, post, fe=None, control=None, clustvar=None):
+    rename_dd = dict()
     if treatment == "Treatment":
         rename_dd = {"Treatment": "treatment"}
-        copy_df = copy_df.rename(columns=rename_dd)
-        treatment = "treatment"
 
     iter_ls = [
-        dv,
         tau,
         treatment,
         post,
@@ -42,40 +44,54 @@ def regress_diff_in_diff(df, dv, tau, treatment, post, fe=None, control=None, cl
         fe,
         control,
     ]
-    keep_ls = list()
-    for i in iter_ls:
-        if isinstance(i, list):
-            keep_ls += i
-        else:
-            keep_ls.append(i)
-    keep_ls = list(set(keep_ls))
-    copy_df = copy_df.loc[:, keep_ls].copy()
-    copy_df = copy_df.dropna()
+    rhs_ls = utils.get_keep_list(iter_ls=iter_ls)
+    keep_ls = utils.get_keep_list(iter_ls=[dependent_ls, rhs_ls])
+
+    # Project before renaming, so only the regression columns are copied
+    copy_df = df.loc[:, keep_ls].dropna(subset=rhs_ls)
+    copy_df = copy_df.rename(columns=rename_dd)
+    treatment = rename_dd.get(treatment, treatment)
+    return copy_df, treatment
 
+
+def encode_data(df, tau, clustvar=None):
     # Handle categorical variable
-    tau_ss = copy_df[tau].copy()
+    tau_ss = df[tau].copy()
     category_ls = sorted(tau_ss.dropna().unique())
     tau_cat_ss = pd.Categorical(tau_ss, categories=category_ls, ordered=True)
     tau_cat = f"{tau}_cat"
-    copy_df[tau_cat] = tau_cat_ss
+    df[tau_cat] = tau_cat_ss
 
     if clustvar is not None:
-        copy_df[clustvar] = pd.Categorical(copy_df[clustvar], ordered=True)
+        df[clustvar] = pd.Categorical(df[clustvar], ordered=True)
+    return df
 
-    # Create formula
-    formula = f"{dv} ~ {post}:{treatment} + {treatment} + {post}"
+
+def get_fe_list(fe, tau):
+    tau_cat = f"{tau}_cat"
     if isinstance(fe, list):
         fe = fe.copy()
         if tau in fe:
             fe.remove(tau)
             fe.append(tau_cat)
-        fe_formula_ls = [f"C({i})" for i in fe]
-        fe_formula = " + ".join(fe_formula_ls)
     else:
         if fe == tau:
             fe = tau_cat
-        fe_formula = f"C({fe})"
-    formula = f"{formula} + {fe_formula}"
+    return fe
+
+
+def get_formula(tau, treatment, post, fe=None, control=None, method=None):
+    method = estimation.get_method(method=method)
+
+    formula = f"{post}:{treatment} + {treatment} + {post}"
+    if method == "ols":
+        fe = get_fe_list(fe=fe, tau=tau)
+        if isinstance(fe, list):
+            fe_formula_ls = [f"C({i})" for i in fe]
+            fe_formula = " + ".join(fe_formula_ls)
+        else:
+            fe_formula = f"C({fe})"
+        formula = f"{formula} + {fe_formula}"
 
     if control is not None:
         if isinstance(control, list):
@@ -83,6 +99,67 @@ def regress_diff_in_diff(df, dv, tau, treatment, post, fe=None, control=None, cl
         else:
             control_formula = control
         formula = f"{formula} + {control_formula}"
+    return formula
+
+
+def get_design_cache(df, dependent_ls, tau, treatment, post, fe=None, control=None, clustvar=None,
+                     method=None, tol=None):
+    method = estimation.get_method(method=method)
+
+    copy_df, treatment = prepare_data(df=df,
+                                      dependent_ls=dependent_ls,
+                                      tau=tau,
+                                      treatment=treatment,
+                                      post=post,
+                                      fe=fe,
+                                      control=control,
+                                      clustvar=clustvar)
+    formula = get_formula(tau=tau, treatment=treatment, post=post, fe=fe, control=control, method=method)
+    fe = get_fe_list(fe=fe, tau=tau)
+    encode_func = partial(encode_data, tau=tau, clustvar=clustvar)
+    design_cache = design.DesignCache(df=copy_df,
+                                      formula=formula,
+                                      encode_func=encode_func,
+                                      fe=fe,
+                                      clustvar=clustvar,
+                                      method=method,
+                                      tol=tol)
+    return design_cache
+
+
+def regress_diff_in_diff(df, dv, tau, treatment, post, fe=None, control=None, clustvar=None, method=None,
+                         design_cache=None, tol=None):
+    if design_cache is not None:
+        # The design was built once for the sample, only the outcome changes
+        results = design_cache.fit(dependent_ls=[dv])[dv]
+        return results
+
+    method = estimation.get_method(method=method)
+
+    copy_df, treatment = prepare_data(df=df,
+                                      dependent_ls=[dv],
+                                      tau=tau,
+                                      treatment=treatment,
+                                      post=post,
+                                      fe=fe,
+                                      control=control,
+                                      clustvar=clustvar)
+    copy_df = copy_df.dropna(subset=[dv])
+    copy_df = encode_data(df=copy_df, tau=tau, clustvar=clustvar)
+
+    # Create formula
+    rhs_formula = get_formula(tau=tau, treatment=treatment, post=post, fe=fe, control=control, method=method)
+    formula = f"{dv} ~ {rhs_formula}"
+
+    if method != "ols":
+        fe = get_fe_list(fe=fe, tau=tau)
+        results = estimation.fit_formula_absorbed(formula=formula,
+                                                  df=copy_df,
+                                                  fe=fe,
+                                                  clustvar=clustvar,
+                                                  method=method,
+                                                  tol=tol)
+        return results
 
     model = smf.ols(formula, data=copy_df)
     if clustvar is not None:
@@ -95,6 +172,23 @@ def regress_diff_in_diff(df, dv, tau, treatment, post, fe=None, control=None, cl
     return results
 
 
+def regress_diff_in_diff_batch(df, dependent_ls, tau, treatment, post, fe=None, control=None, clustvar=None,
+                               method=None, tol=None):
+    # Outcomes sharing a sample are solved against one design
+    design_cache = get_design_cache(df=df,
+                                    dependent_ls=dependent_ls,
+                                    tau=tau,
+                                    treatment=treatment,
+                                    post=post,
+                                    fe=fe,
+                                    control=control,
+                                    clustvar=clustvar,
+                                    method=method,
+                                    tol=tol)
+    result_dd = design_cache.fit(dependent_ls=dependent_ls)
+    return result_dd
+
+
 def get_post_treat(post, treatment):
     if treatment == "Treatment":
         treatment = "treatment"
@@ -153,17 +247,21 @@ def get_rename_row_dict():
     return dd
 
 
-def get_regression_result(df, dv, tau, treatment, post, fe=None, control=None, clustvar=None):
-    result = regress_diff_in_diff(df=df,
-                                  dv=dv,
-                                  tau=tau,
-                                  treatment=treatment,
-                                  post=post,
-                                  fe=fe,
-                                  control=control,
-                                  clustvar=clustvar)
-    col_ss = generate_column(result=result, df=df, dv=dv, treatment=treatment, post=post, tau=tau)
-    return col_ss
+def get_regression_columns(df, dependent_ls, tau, treatment, post, fe=None, control=None, clustvar=None,
+                           method=None):
+    result_dd = result_cache.fit_cached(fit_func=regress_diff_in_diff_batch,
+                                        df=df,
+                                        dependent_ls=dependent_ls,
+                                        tau=tau,
+                                        treatment=treatment,
+                                        post=post,
+                                        fe=fe,
+                                        control=control,
+                                        clustvar=clustvar,
+                                        method=method)
+    column_ls = [generate_column(result=result, df=df, dv=dv, treatment=treatment, post=post, tau=tau)
+                 for dv, result in result_dd.items()]
+    return column_ls
 
 
 def get_panel_text(panel):
@@ -195,10 +293,7 @@ def export_table(name, table_df):
     table_df.to_csv(path)
 
 
-def generate_table_1():
-    read_df = utils.read_data()
-    df = pre_process_data(df=read_df)
-
+def get_dependent_list():
     dependent_ls = [
         "a_symptom",
         "tot_hhspend",
@@ -209,7 +304,10 @@ def generate_table_1():
         "hours_hhlab",
         "REVnw_w",
     ]
+    return dependent_ls
 
+
+def construct_kwargs_dict(method=None):
     kwargs_dd = {
         "tau": "tau",
         "treatment": "Treatment",
@@ -217,15 +315,37 @@ def generate_table_1():
         "clustvar": "id",
         "fe": ["id", "month", "tau"],
         "control": ["Nm", "Nf", "headage", "mean_edu"],
+        "method": method,
     }
+    return kwargs_dd
+
+
+def get_required_columns():
+    # post is created by pre_process_data, the subsample columns are read by filter_first_half_shock for panel A
+    dependent_ls = get_dependent_list()
+    kwargs_dd = construct_kwargs_dict()
+    spec_ls = [dependent_ls] + [kwargs_dd[i] for i in ["tau", "treatment", "clustvar", "fe", "control"]]
+    input_ls = ["treatment_subsample", "placebo_subsample", "no_attrition_food"]
+    column_ls = utils.get_required_columns(spec_ls=spec_ls, input_ls=input_ls)
+    return column_ls
+
+
+def generate_table_1(method=None, df=None):
+    # A preprocessed sample can be passed in when it is shared with other targets
+    if df is None:
+        read_df = utils.read_data(columns=get_required_columns())
+        df = pre_process_data(df=read_df)
+
+    dependent_ls = get_dependent_list()
+    kwargs_dd = construct_kwargs_dict(method=method)
 
     # Panel A
     first_half_df = utils.filter_first_half_shock(df=df)
-    column_a_ls = [get_regression_result(dv=dv, df=first_half_df, **kwargs_dd) for dv in dependent_ls]
+    column_a_ls = get_regression_columns(df=first_half_df, dependent_ls=dependent_ls, **kwargs_dd)
     panel_a_df = format_table(column_ls=column_a_ls, panel="a")
 
     # Panel B
-    column_b_ls = [get_regression_result(dv=dv, df=df, **kwargs_dd) for dv in dependent_ls]
+    column_b_ls = get_regression_columns(df=df, dependent_ls=dependent_ls, **kwargs_dd)
     panel_b_df = format_table(column_ls=column_b_ls, panel="b")
 
     concat_ls = [panel_a_df, panel_b_df]
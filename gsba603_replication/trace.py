@@ -0,0 +1,168 @@
+import itertools
+import json
+import os
+import pandas as pd
+import time
+
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_trace_path = os.getenv("TRACE_PATH")
+_span_counter = itertools.count()
+_span_stack = list()
+
+
+def enable(path):
+    # Also exported, so worker processes started afterwards trace to the same file
+    global _trace_path
+    _trace_path = str(path)
+    os.environ["TRACE_PATH"] = _trace_path
+
+
+def disable():
+    global _trace_path
+    _trace_path = None
+    os.environ.pop("TRACE_PATH", None)
+
+
+def is_enabled():
+    return _trace_path is not None
+
+
+def get_peak_rss():
+    # Process high-water mark in MB, ru_maxrss is in KB on Linux
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak_rss
+
+
+def get_shape_dict(obj):
+    shape = getattr(obj, "shape", None)
+    if shape is None:
+        return dict()
+
+    shape_dd = {"n_rows": int(shape[0])}
+    if len(shape) > 1:
+        shape_dd["n_columns"] = int(shape[1])
+    return shape_dd
+
+
+def write_record(record_dd):
+    # One JSON object per line, appends from several processes do not interleave within a line
+    with open(_trace_path, "a") as f:
+        f.write(json.dumps(record_dd, default=str) + "\n")
+
+
+class Span:
+    def __init__(self, name, attr_dd):
+        self.name = name
+        self.attr_dd = attr_dd
+        self.span_id = f"{os.getpid()}-{next(_span_counter)}"
+        self.parent_id = None
+
+    def set(self, **kwargs):
+        self.attr_dd.update(kwargs)
+
+    def set_shape(self, obj):
+        # Sizes annotated inside the span take precedence over the shape of the output
+        for k, v in get_shape_dict(obj=obj).items():
+            self.attr_dd.setdefault(k, v)
+
+    def __enter__(self):
+        if len(_span_stack) > 0:
+            self.parent_id = _span_stack[-1].span_id
+        _span_stack.append(self)
+        self.start = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.start_peak_rss = get_peak_rss()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.start_wall
+        cpu_time = time.process_time() - self.start_cpu
+        process_peak_rss = get_peak_rss()
+        _span_stack.pop()
+
+        # ru_maxrss never decreases, so a span is charged only for raising it above the peak at entry
+        peak_rss_growth = None
+        if process_peak_rss is not None:
+            peak_rss_growth = process_peak_rss - self.start_peak_rss
+
+        record_dd = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "pid": os.getpid(),
+            "start": self.start,
+            "wall_time": wall_time,
+            "cpu_time": cpu_time,
+            "peak_rss_growth_mb": peak_rss_growth,
+            "process_peak_rss_mb": process_peak_rss,
+            "error": None if exc_type is None else exc_type.__name__,
+        }
+        record_dd.update(self.attr_dd)
+        write_record(record_dd=record_dd)
+        return False
+
+
+class NullSpan:
+    def set(self, **kwargs):
+        pass
+
+    def set_shape(self, obj):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_span = NullSpan()
+
+
+def span(name, **kwargs):
+    # Disabled tracing costs one check and returns a shared no-op span
+    if not is_enabled():
+        return _null_span
+    return Span(name=name, attr_dd=kwargs)
+
+
+def annotate(**kwargs):
+    # Adds attributes to the innermost open span, e.g. sizes only known inside the traced function
+    if not is_enabled() or len(_span_stack) == 0:
+        return
+    _span_stack[-1].set(**kwargs)
+
+
+def traced(name=None):
+    def decorator(func):
+        span_name = name if name is not None else f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+
+            with span(name=span_name) as stage_span:
+                output = func(*args, **kwargs)
+                stage_span.set_shape(obj=output)
+            return output
+
+        return wrapper
+
+    return decorator
+
+
+def read_trace(path=None):
+    if path is None:
+        path = _trace_path
+    trace_df = pd.read_json(path, lines=True)
+    return trace_df
@@ -1,8 +1,11 @@
+import matplotlib.pyplot as plt
+import numpy as np
 import os
 import pandas as pd
 import re
 
-from statsmodels.stats.sandwich_covariance import cov_cluster
+from functools import partial
+from . import cache, estimation, trace
 
 
 def calculate_outcomes(df):
@@ -25,19 +28,84 @@ def calculate_outcomes(df):
     return df
 
 
-def filter_attrition(df):
+def get_outcome_input_list():
+    # Raw columns read by calculate_outcomes
+    input_ls = [
+        "exp_nf",
+        "tot_hhspend",
+        "food_w",
+        "costs_ag_w",
+        "costs_livs_w",
+        "costs_fs_w",
+        "costs_nfbiz_w",
+        "AgREV_w",
+        "LREV_w",
+        "FSREV_w",
+        "BREV_w",
+        "n_symptom",
+    ]
+    return input_ls
+
+
+def get_outcome_list():
+    # Columns created by calculate_outcomes
+    outcome_ls = [
+        "exp_nf_w",
+        "tot_exp_w",
+        "totcons_w",
+        "costs_nw_w",
+        "REVnw_w",
+        "a_symptom",
+    ]
+    return outcome_ls
+
+
+def get_required_columns(spec_ls, input_ls=None):
+    # Columns of the specification that are read rather than created, together with the extra inputs
+    if input_ls is None:
+        input_ls = list()
+    spec_ls = get_keep_list(iter_ls=spec_ls)
+    outcome_ls = get_outcome_list()
+    column_ls = get_outcome_input_list() + input_ls + [i for i in spec_ls if i not in outcome_ls]
+    column_ls = sorted(set(column_ls))
+    return column_ls
+
+
+def get_attrition_mask(df):
     attrition_filter_ss = df["no_attrition_food"] == 1
+    return attrition_filter_ss
+
+
+def get_window_mask(df, months=24):
+    window_filter_ss = df["tau"] >= -months
+    window_filter_ss = window_filter_ss & (df["tau"] < months)
+    return window_filter_ss
+
+
+def filter_attrition(df):
+    attrition_filter_ss = get_attrition_mask(df=df)
     filter_df = df.loc[attrition_filter_ss].copy()
     return filter_df
 
 
 def filter_window(df, months=24):
-    window_filter_ss = df["tau"] >= -months
-    window_filter_ss = window_filter_ss & (df["tau"] < months)
+    window_filter_ss = get_window_mask(df=df, months=months)
     window_filter_df = df.loc[window_filter_ss].copy()
     return window_filter_df
 
 
+def apply_masks(df, mask_ls, columns=None):
+    # Masks are combined first, so the selected rows (and columns) are materialized once
+    keep_ss = pd.Series(True, index=df.index)
+    for mask_ss in mask_ls:
+        keep_ss = keep_ss & mask_ss
+
+    if columns is None:
+        columns = df.columns
+    filter_df = df.loc[keep_ss, columns]
+    return filter_df
+
+
 def _get_base_path():
     base_path = os.getenv("BASE_PATH")
     return base_path
@@ -58,6 +126,20 @@ def _get_dyads_file_path():
     return file_path
 
 
+def _get_cache_path():
+    cache_path = os.getenv("CACHE_PATH")
+    return cache_path
+
+
+def get_cache_path():
+    cache_path = _get_cache_path()
+    if cache_path is None:
+        base_path = _get_base_path()
+        clean_path = _get_clean_data_path()
+        cache_path = f"{base_path}/{clean_path}/.cache"
+    return cache_path
+
+
 def get_export_path():
     export_path = os.getenv("EXPORT_PATH")
     return export_path
@@ -79,7 +161,37 @@ def get_dyads_file_path():
     return path
 
 
-def read_data(file="TreatHS"):
+def compact_dtypes(df):
+    # Integer-valued float columns without missing values fit in int32
+    for column in df.columns:
+        ss = df[column]
+        if ss.dtype != np.float64 or ss.isna().any():
+            continue
+        values = ss.to_numpy()
+        is_integer = (np.mod(values, 1) == 0).all()
+        is_small = np.abs(values).max(initial=0) < np.iinfo(np.int32).max
+        if is_integer and is_small:
+            df[column] = values.astype(np.int32)
+    return df
+
+
+def iter_stata_chunks(path, columns=None, chunksize=None):
+    with pd.read_stata(path, columns=columns, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield compact_dtypes(df=chunk)
+
+
+def read_stata_chunked(path, columns=None, chunksize=None):
+    if chunksize is None:
+        raw_df = pd.read_stata(path, columns=columns)
+        return raw_df
+
+    chunk_ls = list(iter_stata_chunks(path=path, columns=columns, chunksize=chunksize))
+    raw_df = pd.concat(chunk_ls, ignore_index=True)
+    return raw_df
+
+
+def get_data_path(file):
     if file == "TreatHS":
         path = get_treat_file_path()
     elif file == "dyads_es_max":
@@ -87,24 +199,80 @@ def read_data(file="TreatHS"):
     else:
         msg = f"file {file} not implemented"
         raise Exception(msg)
-    raw_df = pd.read_stata(path)
+    return path
+
+
+def iter_data(file="TreatHS", columns=None, chunksize=None, use_cache=None):
+    # Only one chunk of rows is materialized at a time: slices of the memory-mapped columnar copy when it is
+    # current, otherwise chunks parsed from the Stata file
+    if use_cache is None:
+        use_cache = True
+    if chunksize is None:
+        chunksize = 500_000
+
+    path = get_data_path(file=file)
+    store_path = f"{get_cache_path()}/{file}_compact"
+    if use_cache and cache.is_valid(store_path=store_path, source_path=path):
+        store_df = cache.read_store(store_path=store_path, columns=columns, mmap_mode="r")
+        for start in range(0, store_df.shape[0], chunksize):
+            yield store_df.iloc[start:start + chunksize].copy()
+        return
+
+    yield from iter_stata_chunks(path=path, columns=columns, chunksize=chunksize)
+
+
+@trace.traced(name="read_data")
+def read_data(file="TreatHS", columns=None, use_cache=None, chunksize=None):
+    if use_cache is None:
+        use_cache = True
+
+    path = get_data_path(file=file)
+
+    if not use_cache:
+        raw_df = read_stata_chunked(path=path, columns=columns, chunksize=chunksize)
+    else:
+        # Chunked reads compact dtypes, so they are kept in their own store
+        cache_path = get_cache_path()
+        if chunksize is None:
+            store_path = f"{cache_path}/{file}"
+        else:
+            store_path = f"{cache_path}/{file}_compact"
+        read_func = partial(read_stata_chunked, chunksize=chunksize)
+        chunk_func = None
+        if chunksize is not None:
+            chunk_func = partial(iter_stata_chunks, chunksize=chunksize)
+        raw_df = cache.read_cached(source_path=path,
+                                   store_path=store_path,
+                                   read_func=read_func,
+                                   columns=columns,
+                                   chunk_func=chunk_func)
     return raw_df
 
 
-def filter_first_half_shock(df):
+def get_first_half_shock_mask(df):
     treatment_filter_ss = df["treatment_subsample"] == 1
     treatment_filter_ss = treatment_filter_ss | (df["placebo_subsample"] == 2)
+    return treatment_filter_ss
+
+
+def filter_first_half_shock(df):
+    treatment_filter_ss = get_first_half_shock_mask(df=df)
     treatment_filter_df = df.loc[treatment_filter_ss].copy()
     return treatment_filter_df
 
 
-def recode_tau(df, months=None):
+def recode_tau(df, months=None, copy=True, step=None):
     if months is None:
         months = 24
+    if step is None:
+        step = 6
+    if months % step != 0:
+        msg = f"window of {months} months is not a multiple of the {step} month step"
+        raise Exception(msg)
 
-    recode_df = df.copy()
+    # Frames that were just materialized by apply_masks can be recoded in place
+    recode_df = df.copy() if copy else df
 
-    step = 6
     distance = int(months / step)
     bins = int(2 * distance + 1)
     bin_ls = [months - i * step for i in range(bins)]
@@ -120,11 +288,31 @@ def recode_tau(df, months=None):
     return recode_df
 
 
+def cov_cluster_multiway(model, cluster_ls):
+    xu, hessian_inv, k_params = estimation.get_sandwich_arrays(result=model)
+    codes_ls = [pd.factorize(np.asarray(i))[0] for i in cluster_ls]
+    cov = estimation.cov_cluster_multiway(xu=xu, hessian_inv=hessian_inv, codes_ls=codes_ls, k_params=k_params)
+    return cov
+
+
 def cov_cluster_2way(model, cluster1, cluster2):
-    cov1 = cov_cluster(model, cluster1)
-    cov2 = cov_cluster(model, cluster2)
-    cov12 = cov_cluster(model, [f"{i}_{j}" for i, j in zip(cluster1, cluster2)])  # intersection
-    return cov1 + cov2 - cov12
+    cov = cov_cluster_multiway(model=model, cluster_ls=[cluster1, cluster2])
+    return cov
+
+
+def get_keep_list(iter_ls):
+    keep_ls = list()
+    for i in iter_ls:
+        if isinstance(i, list):
+            for j in i:
+                if isinstance(j, tuple):
+                    keep_ls += list(j)
+                else:
+                    keep_ls.append(j)
+        elif i is not None:
+            keep_ls.append(i)
+    keep_ls = list(set(keep_ls))
+    return keep_ls
 
 
 def extract_relevant_values(ss, regex_str):
@@ -149,6 +337,15 @@ def get_append_series():
     return ss
 
 
+def append_intervals(plot_df, interval_df):
+    # Bounds of the baseline period are zero like its coefficient
+    baseline_index = get_append_series().index
+    interval_df = interval_df.reindex(plot_df.index)
+    interval_df.loc[baseline_index] = 0
+    concat_df = pd.concat([plot_df, interval_df], axis=1)
+    return concat_df
+
+
 def get_confidence_list():
     confidence_ls = [0.95, 0.9]
     return confidence_ls
@@ -163,7 +360,10 @@ def get_confidence_color(confidence):
     return color
 
 
+@trace.traced(name="export_plot")
 def export_plot(name, panel_plot):
     export_path = get_export_path()
     path = f"{export_path}/{name}"
     panel_plot.savefig(path)
+    # Closed once written, open figures would accumulate across runs
+    plt.close(panel_plot)
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from . import estimation, trace, utils
+
+
+def get_weight_type_list():
+    weight_type_ls = ["rademacher", "webb"]
+    return weight_type_ls
+
+
+def check_weight_type(weight_type):
+    # Called before the fit, an unknown weight type would otherwise only fail once the residuals are there
+    if weight_type is not None and weight_type not in get_weight_type_list():
+        msg = f"weight type {weight_type} not implemented, use one of {get_weight_type_list()}"
+        raise Exception(msg)
+
+
+def get_weights(rng, n_clusters, n_replicates, weight_type=None):
+    if weight_type is None:
+        weight_type = "rademacher"
+
+    if weight_type == "rademacher":
+        value_arr = np.array([-1.0, 1.0])
+    elif weight_type == "webb":
+        # Six-point distribution, more distinct replicates than Rademacher when clusters are few
+        value_arr = np.sqrt(np.array([0.5, 1.0, 1.5]))
+        value_arr = np.concatenate([-value_arr, value_arr])
+    else:
+        msg = f"weight type {weight_type} not implemented"
+        raise Exception(msg)
+
+    weights = rng.choice(value_arr, size=(n_clusters, n_replicates))
+    return weights
+
+
+def project_cluster_score(cluster_score, hessian_inv, keep_arr, position_arr):
+    # Each bootstrap coefficient is the fitted one plus this (n_coefficients, n_clusters) matrix times the weights
+    n_clusters = cluster_score.shape[0]
+    projection = hessian_inv @ cluster_score.T
+
+    # Omitted columns are not in the sandwich arrays, their bounds stay NaN
+    keep_position_arr = np.cumsum(keep_arr) - 1
+    event_projection = np.full((len(position_arr), n_clusters), np.nan)
+    event_keep_arr = keep_arr[position_arr]
+    event_projection[event_keep_arr] = projection[keep_position_arr[position_arr[event_keep_arr]]]
+    return event_projection
+
+
+def get_cluster_projection(result, codes, position_arr):
+    xu, hessian_inv, _ = estimation.get_sandwich_arrays(result=result)
+    n_clusters = int(codes.max()) + 1
+    indicator = estimation.get_indicator_matrix(codes=codes, n_levels=n_clusters)
+    cluster_score = np.asarray(indicator.T @ xu)
+
+    keep_arr = np.asarray(pd.Series(result.params).notna())
+    event_projection = project_cluster_score(cluster_score=cluster_score,
+                                             hessian_inv=hessian_inv,
+                                             keep_arr=keep_arr,
+                                             position_arr=position_arr)
+    return event_projection
+
+
+@trace.traced(name="wild_bootstrap.get_bootstrap_deviations")
+def get_bootstrap_deviations(projection, n_replicates, weight_type=None, seed=None, block_size=None):
+    # Replicates are drawn in blocks, so the weights never exceed about 10M entries
+    n_clusters = projection.shape[1]
+    if block_size is None:
+        block_size = max(1, 10_000_000 // n_clusters)
+    trace.annotate(n_rows=n_clusters, n_replicates=n_replicates, weight_type=weight_type)
+
+    rng = np.random.default_rng(seed)
+    deviation_ls = list()
+    for start in range(0, n_replicates, block_size):
+        n_block = min(block_size, n_replicates - start)
+        weights = get_weights(rng=rng, n_clusters=n_clusters, n_replicates=n_block, weight_type=weight_type)
+        deviation_ls.append(projection @ weights)
+    deviation_arr = np.concatenate(deviation_ls, axis=1)
+    return deviation_arr
+
+
+def get_interval_frame(coefficient_arr, deviation_arr, tau_arr):
+    # Percentile intervals of the bootstrap coefficients, in the columns generate_sub_plot draws
+    interval_dd = dict()
+    for confidence in utils.get_confidence_list():
+        alpha = 1 - confidence
+        interval_dd[f"lower_{int(100 * confidence)}"] = coefficient_arr + np.quantile(deviation_arr, alpha / 2, axis=1)
+        interval_dd[f"upper_{int(100 * confidence)}"] = coefficient_arr + np.quantile(deviation_arr, 1 - alpha / 2,
+                                                                                      axis=1)
+    interval_df = pd.DataFrame(interval_dd, index=tau_arr)
+    return interval_df
+
+
+def get_projection_intervals(projection, coefficient_arr, tau_arr, n_replicates, weight_type=None, seed=None):
+    if seed is None:
+        seed = 0
+
+    deviation_arr = get_bootstrap_deviations(projection=projection,
+                                             n_replicates=n_replicates,
+                                             weight_type=weight_type,
+                                             seed=seed)
+    interval_df = get_interval_frame(coefficient_arr=coefficient_arr, deviation_arr=deviation_arr, tau_arr=tau_arr)
+    return interval_df
+
+
+def get_bootstrap_intervals(result, codes, position_arr, tau_arr, n_replicates, weight_type=None, seed=None):
+    # Reuses the residuals of the fit, B replicates cost one product with the weights instead of B fits
+    projection = get_cluster_projection(result=result, codes=codes, position_arr=position_arr)
+    coefficient_arr = np.asarray(result.params, dtype=float)[position_arr]
+    interval_df = get_projection_intervals(projection=projection,
+                                           coefficient_arr=coefficient_arr,
+                                           tau_arr=tau_arr,
+                                           n_replicates=n_replicates,
+                                           weight_type=weight_type,
+                                           seed=seed)
+    return interval_df
@@ -13,5 +13,10 @@ setup(
     author="Mario Morales and Vidhi Shah",
     author_email="mario@moralesalfaro.cl",
     url="https://github.com/marioles/methods",
-    packages=find_packages(exclude=("tests", "docs"))
+    packages=find_packages(exclude=("tests", "docs")),
+    entry_points={
+        "console_scripts": [
+            "gsba603-replication=gsba603_replication.pipeline:main",
+        ],
+    },
 )
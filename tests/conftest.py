@@ -0,0 +1,27 @@
+import pytest
+
+from gsba603_replication import synthetic
+
+
+@pytest.fixture(scope="session")
+def synthetic_path(tmp_path_factory):
+    # Written once per session, small enough for every estimator to run in a few seconds
+    path = tmp_path_factory.mktemp("synthetic")
+    synthetic.write_synthetic_data(path=path / "clean", n_households=40, n_months=72, n_links=3, seed=1)
+    return path
+
+
+@pytest.fixture
+def synthetic_env(synthetic_path, tmp_path, monkeypatch):
+    # The column cache and the exports are per test, the Stata files are shared
+    monkeypatch.setenv("BASE_PATH", str(synthetic_path))
+    monkeypatch.setenv("CLEAN_PATH", "clean")
+    monkeypatch.setenv("FILE_PATH", "TreatHS.dta")
+    monkeypatch.setenv("DYADS_FILE_PATH", "dyads_es_max.dta")
+    monkeypatch.setenv("CACHE_PATH", str(tmp_path / "cache"))
+    monkeypatch.setenv("EXPORT_PATH", str(tmp_path / "export"))
+    monkeypatch.setenv("RENDER_WORKERS", "0")
+    monkeypatch.delenv("RESULT_CACHE", raising=False)
+    monkeypatch.delenv("PREPROCESS_DISK_CACHE", raising=False)
+    (tmp_path / "export").mkdir()
+    return tmp_path
@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+import pytest
+
+from gsba603_replication import cache
+
+
+class CountingReader:
+    def __init__(self):
+        self.n_reads = 0
+
+    def read(self, path, columns=None):
+        self.n_reads += 1
+        return pd.read_csv(path, usecols=columns)
+
+    def iter_chunks(self, path):
+        self.n_reads += 1
+        with pd.read_csv(path, chunksize=2) as reader:
+            yield from reader
+
+
+def write_source(path, value_ls):
+    df = pd.DataFrame({"id": range(len(value_ls)), "value": value_ls})
+    df.to_csv(path, index=False)
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_read_cached_invalidation(tmp_path, chunked):
+    source_path = tmp_path / "source.csv"
+    store_path = tmp_path / "store"
+    reader = CountingReader()
+    chunk_func = reader.iter_chunks if chunked else None
+
+    def read():
+        return cache.read_cached(source_path=source_path,
+                                 store_path=store_path,
+                                 read_func=reader.read,
+                                 columns=["value"],
+                                 chunk_func=chunk_func)
+
+    write_source(path=source_path, value_ls=[1, 2, 3, 4, 5])
+    assert read()["value"].tolist() == [1, 2, 3, 4, 5]
+    assert reader.n_reads == 1
+
+    # Unchanged file, served from the store
+    assert read()["value"].tolist() == [1, 2, 3, 4, 5]
+    assert reader.n_reads == 1
+
+    # Touched but identical, the hash keeps the store and the new stat is recorded
+    stat = os.stat(source_path)
+    os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert read()["value"].tolist() == [1, 2, 3, 4, 5]
+    assert reader.n_reads == 1
+    assert cache.read_manifest(store_path=store_path)["stat"] == cache.get_file_stat(path=source_path)
+
+    # Same size, different content: the hash is checked again and no longer matches
+    write_source(path=source_path, value_ls=[1, 2, 3, 4, 6])
+    os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+    assert read()["value"].tolist() == [1, 2, 3, 4, 6]
+    assert reader.n_reads == 2
+
+    # Different size
+    write_source(path=source_path, value_ls=[1, 2, 3, 4, 6, 70])
+    assert read()["value"].tolist() == [1, 2, 3, 4, 6, 70]
+    assert reader.n_reads == 3
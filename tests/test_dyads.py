@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from gsba603_replication import dyads
+
+
+def get_dyad_frame(n_obs=500, seed=0):
+    rng = np.random.default_rng(seed)
+    # Sparse, unsorted ids, some of them only ever on one side of a dyad
+    id_arr = rng.choice([3, 8, 11, 40, 41, 97], size=n_obs)
+    id_j_arr = rng.choice([8, 11, 12, 40, 200], size=n_obs)
+    df = pd.DataFrame({
+        "id": id_arr,
+        "id_j": id_j_arr,
+        "month": rng.integers(0, 6, n_obs),
+        "value": rng.normal(size=n_obs),
+        "post": rng.integers(0, 2, n_obs),
+    })
+    return df
+
+
+def test_reduce_dyad_matches_groupby():
+    df = get_dyad_frame()
+    panel = dyads.DyadPanel.from_frame(df=df)
+    reduced = panel.reduce_dyad(values=df["value"].to_numpy())
+
+    # Dyads are ordered by the sorted (id, id_j) pair, as groupby does
+    group_ss = df.groupby(["id", "id_j"])["value"].sum()
+    np.testing.assert_allclose(reduced, group_ss.to_numpy())
+    assert panel.n_dyads == group_ss.shape[0]
+
+
+def test_transform_dyad_matches_groupby():
+    df = get_dyad_frame()
+    panel = dyads.DyadPanel.from_frame(df=df)
+    max_arr = panel.transform_dyad(values=df["post"].to_numpy(), ufunc=np.maximum)
+    sum_arr = panel.transform_dyad(values=df["value"].to_numpy())
+
+    group = df.groupby(["id", "id_j"])
+    np.testing.assert_array_equal(max_arr, group["post"].transform("max").to_numpy())
+    np.testing.assert_allclose(sum_arr, group["value"].transform("sum").to_numpy())
+
+
+def test_cluster_codes_match_factorize():
+    df = get_dyad_frame()
+    panel = dyads.DyadPanel.from_frame(df=df)
+    codes_1, codes_2 = panel.get_cluster_codes()
+    np.testing.assert_array_equal(codes_1, pd.factorize(df["id"], sort=True)[0])
+    np.testing.assert_array_equal(codes_2, pd.factorize(df["id_j"], sort=True)[0])
+
+
+def test_missing_ids_are_dropped():
+    df = get_dyad_frame()
+    df["id"] = df["id"].astype(float)
+    df["id_j"] = df["id_j"].astype(float)
+    df.loc[df.index[::17], "id"] = np.nan
+    df.loc[df.index[5::23], "id_j"] = np.nan
+    panel = dyads.DyadPanel.from_frame(df=df)
+
+    # groupby leaves rows with a missing key out of every group, transform gives them NaN
+    group = df.groupby(["id", "id_j"])
+    np.testing.assert_allclose(panel.reduce_dyad(values=df["value"].to_numpy()), group["value"].sum().to_numpy())
+    np.testing.assert_allclose(panel.transform_dyad(values=df["value"].to_numpy()),
+                               group["value"].transform("sum").to_numpy())
+
+    codes_1, codes_2 = panel.get_cluster_codes()
+    np.testing.assert_array_equal(codes_1, pd.factorize(df["id"], sort=True)[0])
+    np.testing.assert_array_equal(codes_2, pd.factorize(df["id_j"], sort=True)[0])
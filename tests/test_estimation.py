@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as smf
+
+from gsba603_replication import estimation
+
+
+def get_panel(n_households=40, n_months=12, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "id": np.repeat(np.arange(n_households), n_months),
+        "month": np.tile(np.arange(n_months), n_households),
+    })
+    df["tau"] = df["month"] - np.repeat(rng.integers(0, n_months, n_households), n_months)
+    df["degree"] = rng.poisson(2, df.shape[0]).astype(float)
+    df["x"] = rng.normal(size=df.shape[0])
+    df["y"] = df["x"] + rng.normal(size=df.shape[0])
+
+    # Unbalanced, and two households only seen in the first months (a separate component with month)
+    keep_ss = rng.random(df.shape[0]) < 0.8
+    keep_ss &= ~(df["id"].isin([0, 1]) & (df["month"] > 2))
+    return df.loc[keep_ss].reset_index(drop=True)
+
+
+def get_dense_rank(fe_ls):
+    column_ls = [np.ones((fe_ls[0][0].shape[0], 1))]
+    for codes, n_levels, slope in fe_ls:
+        columns = estimation.get_indicator_matrix(codes=codes, n_levels=n_levels).toarray()
+        if slope is not None:
+            columns = columns * slope[:, None]
+        column_ls.append(columns)
+    rank = np.linalg.matrix_rank(np.column_stack(column_ls))
+    return rank
+
+
+def test_count_fe_rank_matches_dense_design():
+    df = get_panel()
+    spec_ls = [
+        (["id"], None),
+        (["id", "month"], None),
+        (["id", "month", "tau"], None),
+        (["id", "month"], [("degree", "month")]),
+        (None, [("degree", "month")]),
+    ]
+    for fe, fe_inter in spec_ls:
+        fe_ls = estimation.factorize_fe(df=df, fe=fe, fe_inter=fe_inter)
+        assert estimation.count_fe_rank(fe_ls=fe_ls) == get_dense_rank(fe_ls=fe_ls)
+
+
+def test_absorbed_df_resid_matches_dummies():
+    df = get_panel()
+    for method in ["absorb", "sparse"]:
+        result = estimation.fit_formula_absorbed(formula="y ~ x",
+                                                 df=df,
+                                                 fe=["id", "month"],
+                                                 fe_inter=[("degree", "month")],
+                                                 method=method)
+        dummy_result = smf.ols("y ~ x + C(id) + C(month) + degree:C(month)", data=df).fit()
+        assert result.df_resid == dummy_result.df_resid
+        np.testing.assert_allclose(result.params["x"], dummy_result.params["x"], rtol=1e-8)
+
+
+def test_pinv_rank_matches_numpy():
+    rng = np.random.default_rng(2)
+    x = rng.normal(size=(60, 4))
+    # A collinear column, as when a dummy is spanned by the others
+    x = np.column_stack([x, x[:, 0] + x[:, 1]])
+    x_pinv, rank = estimation.pinv_rank(x=x)
+    np.testing.assert_allclose(x_pinv, np.linalg.pinv(x), atol=1e-12)
+    assert rank == np.linalg.matrix_rank(x)
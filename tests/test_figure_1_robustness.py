@@ -0,0 +1,58 @@
+import numpy as np
+
+from gsba603_replication import figure_1, figure_1_robustness, utils
+
+
+def get_sample():
+    read_df = utils.read_data(columns=figure_1.get_required_columns())
+    df = figure_1.pre_process_data(df=read_df)
+    return df
+
+
+def test_placebo_distribution_matches_loop(synthetic_env):
+    df = get_sample()
+    dependent_ls = figure_1.get_dependent_list()
+    seed_ls = [0, 1, 5, 6]
+
+    # A block smaller than the number of seeds, so more than one block is solved
+    _, coef_dd = figure_1_robustness.get_placebo_distribution(df=df,
+                                                              seed_ls=seed_ls,
+                                                              dependent_ls=dependent_ls,
+                                                              regress_kwargs_dd=figure_1.construct_kwargs_dict(df=df),
+                                                              block_size=3)
+    for seed in seed_ls:
+        loop_dd = figure_1_robustness.get_placebo_coefficient(df=df,
+                                                              seed=seed,
+                                                              dependent_ls=dependent_ls,
+                                                              regress_kwargs_dd=figure_1.construct_kwargs_dict(df=df))
+        for dv in dependent_ls:
+            # The loop also carries the reference period as a zero baseline
+            coef_ss = coef_dd[dv][seed]
+            np.testing.assert_allclose(coef_ss, loop_dd[dv].loc[coef_ss.index], rtol=1e-7, atol=1e-9)
+
+
+def test_placebo_default_exports(synthetic_env):
+    # The default is the loop of refits, the p-values are only exported by the vectorized engine
+    df = get_sample()
+    export_path = synthetic_env / "export"
+    figure_1_robustness.run_placebo_test(n_bootstrap=2, df=df)
+    assert (export_path / "figure_1_placebo.pdf").exists()
+    assert not (export_path / "figure_1_placebo_p_values.csv").exists()
+
+    figure_1_robustness.run_placebo_test(n_bootstrap=2, vectorized=True, df=df)
+    assert (export_path / "figure_1_placebo_p_values.csv").exists()
+
+
+def test_bootstrap_distribution_block_size(synthetic_env):
+    # block_size only sets how many replicates are stacked per solve
+    df = get_sample()
+    dependent_ls = ["tot_hhspend", "a_symptom"]
+    seed_ls = list(range(5))
+    coef_ls = [figure_1_robustness.get_bootstrap_distribution(df=df,
+                                                              seed_ls=seed_ls,
+                                                              dependent_ls=dependent_ls,
+                                                              regress_kwargs_dd=figure_1.construct_kwargs_dict(df=df),
+                                                              block_size=block_size)
+               for block_size in [2, 16]]
+    for dv in dependent_ls:
+        np.testing.assert_allclose(coef_ls[0][dv], coef_ls[1][dv], rtol=1e-9, atol=1e-12)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from gsba603_replication import figure_2
+
+
+def _compute_distance(x):
+    # Row-wise reference, as figure_2 computed close_tot before vectorizing
+    if not pd.isna(x):
+        if x != -1 and x != 0:
+            close_tot = 1 / x
+        else:
+            close_tot = 0
+    else:
+        close_tot = 0
+    return close_tot
+
+
+def test_filter_attritors_keeps_precedence():
+    df = pd.DataFrame({
+        "no_attrition_food": [1, 1, 0, 1, 1, np.nan],
+        "no_attrition_food_j": [1, 3, 1, 0, 2, 1],
+    })
+    filter_df = figure_2.filter_attritors(df=df)
+
+    # Evaluated as (filter_ss & no_attrition_food_j) == 1, so j == 3 is kept and j == 2 is not
+    filter_ss = df["no_attrition_food"] == 1
+    expected_df = df.loc[(filter_ss & df["no_attrition_food_j"]) == 1]
+    pd.testing.assert_frame_equal(filter_df, expected_df)
+    assert filter_df.index.tolist() == [0, 1]
+
+
+def test_compute_distance_matches_row_wise():
+    ss = pd.Series([np.nan, -1, 0, 1, 2.5, -3, 0.2, np.nan, 40], name="Tot_geo")
+    close_tot_ss = figure_2.compute_distance(ss=ss)
+    expected_ss = ss.apply(_compute_distance)
+    pd.testing.assert_series_equal(close_tot_ss, expected_ss)
+
+
+def test_get_any_indicator_matches_row_wise():
+    df = pd.DataFrame({"HLABOUT": [np.nan, 0, 3, -1, 0.5, np.nan, 0]})
+    any_ss = figure_2.get_any_indicator(ss=df["HLABOUT"])
+
+    df["anyHLABOUT"] = (df["HLABOUT"] > 0).astype(int)
+    expected_ss = df.apply(lambda x: np.nan if pd.isna(x["HLABOUT"]) else x["anyHLABOUT"], axis=1)
+    pd.testing.assert_series_equal(any_ss, expected_ss, check_names=False, check_dtype=False)
+    assert any_ss.isna().tolist() == df["HLABOUT"].isna().tolist()
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from gsba603_replication import memo
+
+_call_ls = list()
+
+
+@memo.memoize_frame
+def add_total(df):
+    _call_ls.append(df.shape)
+    total_df = df.copy()
+    total_df["total"] = total_df["a"] + total_df["b"]
+    return total_df
+
+
+def get_frame(n_rows=100):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"a": rng.normal(size=n_rows), "b": rng.normal(size=n_rows)})
+    return df
+
+
+def test_equal_content_is_served_from_memo():
+    memo.clear_memory_cache()
+    _call_ls.clear()
+    df = get_frame()
+    add_total(df=df)
+
+    # A separate frame with the same content, index, columns and dtypes has the same key
+    add_total(df=get_frame())
+    assert len(_call_ls) == 1
+
+
+def test_edited_frame_is_not_served_from_memo():
+    memo.clear_memory_cache()
+    df = get_frame()
+    add_total(df=df)
+
+    # Every value is hashed, so a single edit anywhere changes the key
+    edit_df = df.copy()
+    edit_df.loc[10, "a"] += 1
+    total_df = add_total(df=edit_df)
+    assert total_df.loc[10, "total"] == edit_df.loc[10, "a"] + edit_df.loc[10, "b"]
+
+
+def test_frame_key_covers_shape_index_columns_and_dtypes():
+    df = get_frame()
+    fingerprint = memo.get_frame_fingerprint(df=df)
+    assert memo.get_frame_fingerprint(df=df.copy()) == fingerprint
+
+    variant_ls = [
+        df.iloc[:-1],
+        df.set_axis(df.index + 1, axis=0),
+        df.rename(columns={"b": "c"}),
+        df.astype({"b": "float32"}),
+    ]
+    for variant_df in variant_ls:
+        assert memo.get_frame_fingerprint(df=variant_df) != fingerprint
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from gsba603_replication import pipeline
+
+
+def test_run_pipeline_serial(synthetic_env):
+    target_ls = pipeline.run_pipeline(n_workers=1, method="absorb", n_bootstrap=3)
+    assert target_ls == pipeline.get_default_target_list(graph_dd=pipeline.get_graph())
+    assert "figure_1_window_sweep" not in target_ls
+
+    export_path = synthetic_env / "export"
+    name_ls = [
+        "figure_1.pdf",
+        "figure_1_plot_data.csv",
+        "figure_1_bootstrap.pdf",
+        "figure_1_36months.pdf",
+        "figure_1_placebo.pdf",
+        "figure_2.pdf",
+        "figure_2_plot_data.csv",
+        "table_1.csv",
+    ]
+    missing_ls = [i for i in name_ls if not (export_path / i).exists()]
+    assert missing_ls == list()
+    assert not (export_path / "figure_1_window_sweep.pdf").exists()
+
+    table_df = pd.read_csv(export_path / "table_1.csv", index_col=[0, 1])
+    assert table_df.notna().any().all()
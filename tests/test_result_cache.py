@@ -0,0 +1,52 @@
+import numpy as np
+
+from gsba603_replication import figure_1, result_cache, utils
+
+_fit_ls = list()
+
+
+def count_fit(df, dependent_ls, **kwargs):
+    # Module level, so the key has a stable module and name
+    _fit_ls.append(list(dependent_ls))
+    return figure_1.regress_diff_in_diff_batch(df=df, dependent_ls=dependent_ls, **kwargs)
+
+
+def fit(df, dependent_ls, **kwargs):
+    _fit_ls.clear()
+    result_dd = result_cache.fit_cached(fit_func=count_fit, df=df, dependent_ls=dependent_ls, **kwargs)
+    return result_dd, list(_fit_ls)
+
+
+def test_fit_cached_hits_and_misses(synthetic_env, monkeypatch):
+    monkeypatch.setenv("RESULT_CACHE", "1")
+    df = figure_1.pre_process_data(df=utils.read_data(columns=figure_1.get_required_columns()))
+    kwargs_dd = figure_1.construct_kwargs_dict(df=df)
+    kwargs_dd.pop("df")
+    dependent_ls = ["tot_hhspend", "a_symptom"]
+
+    miss_dd, fit_ls = fit(df=df, dependent_ls=dependent_ls, method="absorb", **kwargs_dd)
+    assert fit_ls == [dependent_ls]
+
+    # Same data and specification, read back without fitting
+    hit_dd, fit_ls = fit(df=df, dependent_ls=dependent_ls, method="absorb", **kwargs_dd)
+    assert fit_ls == list()
+    for dv in dependent_ls:
+        np.testing.assert_allclose(hit_dd[dv].params, miss_dd[dv].params)
+        np.testing.assert_allclose(hit_dd[dv].bse, miss_dd[dv].bse)
+        assert hit_dd[dv].nobs == miss_dd[dv].nobs
+
+    # Only the outcome not seen before is fitted
+    _, fit_ls = fit(df=df, dependent_ls=dependent_ls + ["hours_hired"], method="absorb", **kwargs_dd)
+    assert fit_ls == [["hours_hired"]]
+
+    # A different specification is a miss
+    spec_dd = dict(kwargs_dd, control=["Nm", "Nf"])
+    _, fit_ls = fit(df=df, dependent_ls=dependent_ls, method="absorb", **spec_dd)
+    assert fit_ls == [dependent_ls]
+
+    # So is a change to a single value of the sample
+    edit_df = df.copy()
+    edit_df.iloc[5, edit_df.columns.get_loc("tot_hhspend")] += 1
+    edit_dd, fit_ls = fit(df=edit_df, dependent_ls=dependent_ls, method="absorb", **kwargs_dd)
+    assert fit_ls == [dependent_ls]
+    assert not np.allclose(edit_dd["tot_hhspend"].params, miss_dd["tot_hhspend"].params)
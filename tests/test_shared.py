@@ -0,0 +1,94 @@
+import os
+import stat
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gsba603_replication import figure_1_robustness, shared
+
+
+def get_frame(n_rows=50):
+    df = pd.DataFrame({
+        "id": np.arange(n_rows) % 7,
+        "x": np.linspace(0, 1, n_rows),
+        "label": [f"h{i % 3}" for i in range(n_rows)],
+    })
+    df.attrs["source"] = "test"
+    return df
+
+
+def to_memory(df):
+    # Mapped columns are np.memmap, the constructor copies them into plain arrays
+    memory_df = pd.DataFrame(dict(df.items()), index=df.index, copy=True)
+    memory_df.attrs.update(df.attrs)
+    return memory_df
+
+
+def sum_replicate(df, seed, dependent_ls, regress_kwargs_dd):
+    # Module level, so the pool can pickle it
+    return df["x"].sum() + seed
+
+
+@pytest.fixture
+def read_only_cache(tmp_path, monkeypatch):
+    cache_path = tmp_path / "cache"
+    cache_path.mkdir()
+    cache_path.chmod(stat.S_IRUSR | stat.S_IXUSR)
+    if os.geteuid() == 0:
+        # Permission bits do not stop root, a path below a regular file cannot be created by anyone
+        blocked_path = tmp_path / "blocked"
+        blocked_path.write_text("")
+        cache_path = blocked_path / "cache"
+    monkeypatch.setenv("CACHE_PATH", str(cache_path))
+    yield cache_path
+    (tmp_path / "cache").chmod(stat.S_IRWXU)
+
+
+def test_run_replicates_with_read_only_cache(read_only_cache):
+    df = get_frame()
+    seed_ls = list(range(6))
+    coef_ls = figure_1_robustness.run_replicates(replicate_func=sum_replicate,
+                                                 seed_ls=seed_ls,
+                                                 df=df,
+                                                 dependent_ls=list(),
+                                                 regress_kwargs_dd=dict(),
+                                                 n_workers=2)
+    assert coef_ls == pytest.approx([df["x"].sum() + seed for seed in seed_ls])
+
+
+def test_publish_frame_without_writable_directory(read_only_cache, monkeypatch):
+    def fail_mkdtemp(*args, **kwargs):
+        raise OSError("no temporary directory")
+
+    monkeypatch.setattr(tempfile, "mkdtemp", fail_mkdtemp)
+    df = get_frame()
+    handle = shared.publish_frame(df=df)
+    assert handle.store_path is None
+
+    attach_df = shared.attach_frame(handle=handle)
+    pd.testing.assert_frame_equal(attach_df, df)
+    assert attach_df.attrs == df.attrs
+    shared.release_frame(handle=handle)
+
+
+def test_publish_attach_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_PATH", str(tmp_path / "cache"))
+    df = get_frame()
+    df["category"] = pd.Categorical(df["label"], ordered=True)
+    df.index = pd.Index(np.arange(df.shape[0]) * 3, name="row")
+
+    handle = shared.publish_frame(df=df)
+    assert handle.store_path.startswith(str(tmp_path / "cache"))
+    attach_df = shared.attach_frame(handle=handle)
+    pd.testing.assert_frame_equal(to_memory(df=attach_df), df)
+    assert attach_df.attrs == df.attrs
+
+    # Copy-on-write, a worker writing to its frame leaves the published columns unchanged
+    attach_df.loc[attach_df.index[0], "x"] = -1.0
+    assert attach_df["x"].iloc[0] == -1.0
+    pd.testing.assert_frame_equal(to_memory(df=shared.attach_frame(handle=handle)), df)
+
+    shared.release_frame(handle=handle)
+    assert not os.path.exists(handle.store_path)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from gsba603_replication import figure_2
+
+
+def test_fit_streaming_matches_absorb(synthetic_env):
+    dependent_ls = figure_2.get_dependent_list()
+    kwargs_dd = figure_2.construct_kwargs_dict(df=None, cluster=True)
+    kwargs_dd = {k: v for k, v in kwargs_dd.items() if k not in ["df", "method"]}
+
+    df = figure_2.pre_process_data(df=figure_2.read_dyad_data(method="absorb"))
+    absorb_dd = figure_2.regress_diff_in_diff_batch(df=df, dependent_ls=dependent_ls, method="absorb", **kwargs_dd)
+    # Small chunks, so dyads and FE levels are split across them
+    stream_dd = figure_2.regress_diff_in_diff_stream(dependent_ls=dependent_ls, chunk_size=401, **kwargs_dd)
+
+    for dv in dependent_ls:
+        absorb_result = absorb_dd[dv]
+        stream_result = stream_dd[dv]
+        assert stream_result.nobs == absorb_result.nobs
+        np.testing.assert_array_equal(stream_result.name_arr, absorb_result.name_arr)
+        np.testing.assert_allclose(stream_result.coefficient_arr, absorb_result.coefficient_arr, rtol=1e-7, atol=1e-9)
+        np.testing.assert_allclose(stream_result.std_error_arr, absorb_result.std_error_arr, rtol=1e-7)
+        # Two-way clustered by id and id_j
+        np.testing.assert_allclose(stream_result.clustered_std_error_arr,
+                                   absorb_result.clustered_std_error_arr,
+                                   rtol=1e-7)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from gsba603_replication import trace
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    trace.enable(path=path)
+    yield path
+    trace.disable()
+
+
+@pytest.mark.skipif(trace.resource is None, reason="resource is not available")
+def test_peak_rss_growth_is_relative_to_span_entry(trace_path):
+    with trace.span(name="allocate"):
+        arr = np.ones(200 * 1024 * 1024 // 8)
+        arr.sum()
+    del arr
+
+    # Stays below the peak reached by the first span, so it raises nothing
+    with trace.span(name="idle"):
+        np.ones(1024).sum()
+
+    trace_df = trace.read_trace(path=trace_path).set_index("name")
+    assert trace_df.loc["allocate", "peak_rss_growth_mb"] > 100
+    assert trace_df.loc["idle", "peak_rss_growth_mb"] == 0
+    assert trace_df.loc["idle", "process_peak_rss_mb"] >= trace_df.loc["allocate", "process_peak_rss_mb"]
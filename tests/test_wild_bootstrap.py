@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from gsba603_replication import design, event_study, figure_1, utils, wild_bootstrap
+
+
+def get_refit_intervals(design, dv, n_replicates, weight_type, seed):
+    # Brute force: y* = fitted + weight of the cluster * residual, refitted once per replicate
+    result = design.fit(y=[dv])[dv]
+    position_arr, tau_arr = event_study.get_event_positions(design_info=design.design_info,
+                                                            name_ls=design.name_ls,
+                                                            event_term=figure_1.get_event_term())
+    coefficient_arr = np.asarray(result.params, dtype=float)[position_arr]
+
+    # Same draw as wild_bootstrap.get_bootstrap_deviations, one block
+    codes = event_study.get_wild_codes(design=design)
+    rng = np.random.default_rng(seed)
+    weights = wild_bootstrap.get_weights(rng=rng,
+                                         n_clusters=int(codes.max()) + 1,
+                                         n_replicates=n_replicates,
+                                         weight_type=weight_type)
+
+    y_arr = design.df[dv].to_numpy(dtype=float)
+    fitted_arr = y_arr - result.resid
+    deviation_ls = list()
+    for i in range(n_replicates):
+        y_ss = pd.Series(fitted_arr + weights[codes, i] * result.resid, index=design.df.index, name=dv)
+        replicate = design.fit(y=y_ss)[dv]
+        deviation_ls.append(np.asarray(replicate.params, dtype=float)[position_arr] - coefficient_arr)
+    deviation_arr = np.column_stack(deviation_ls)
+    interval_df = wild_bootstrap.get_interval_frame(coefficient_arr=coefficient_arr,
+                                                    deviation_arr=deviation_arr,
+                                                    tau_arr=tau_arr)
+    return interval_df
+
+
+def test_wild_intervals_match_refits(synthetic_env):
+    read_df = utils.read_data(columns=figure_1.get_required_columns())
+    df = figure_1.pre_process_data(df=read_df)
+    kwargs_dd = figure_1.construct_kwargs_dict(df=df)
+    dv = "tot_hhspend"
+    n_replicates = 7
+
+    for weight_type in wild_bootstrap.get_weight_type_list():
+        result_dd = figure_1.regress_diff_in_diff_batch(dependent_ls=[dv],
+                                                        method="ols",
+                                                        n_wild=n_replicates,
+                                                        weight_type=weight_type,
+                                                        **kwargs_dd)
+        design_cache = figure_1.get_design_cache(dependent_ls=[dv], method="ols", **kwargs_dd)
+        design = design_cache.get_design(dependent_ls=[dv])
+        refit_df = get_refit_intervals(design=design, dv=dv, n_replicates=n_replicates, weight_type=weight_type,
+                                       seed=0)
+        pd.testing.assert_frame_equal(result_dd[dv].interval_df, refit_df, rtol=1e-8)
+
+
+def test_wild_seed_sets_the_draw(synthetic_env):
+    read_df = utils.read_data(columns=figure_1.get_required_columns())
+    df = figure_1.pre_process_data(df=read_df)
+    kwargs_dd = figure_1.construct_kwargs_dict(df=df)
+    dv = "tot_hhspend"
+
+    interval_ls = [figure_1.regress_diff_in_diff_batch(dependent_ls=[dv], n_wild=9, wild_seed=wild_seed,
+                                                       **kwargs_dd)[dv].interval_df
+                   for wild_seed in [3, 3, 4]]
+    pd.testing.assert_frame_equal(interval_ls[0], interval_ls[1])
+    assert not interval_ls[0].equals(interval_ls[2])
+
+
+def test_unknown_weight_type_raises_before_the_fit(synthetic_env, monkeypatch):
+    read_df = utils.read_data(columns=figure_1.get_required_columns())
+    df = figure_1.pre_process_data(df=read_df)
+
+    def fail_fit(*args, **kwargs):
+        raise AssertionError("fitted with an unknown weight type")
+
+    monkeypatch.setattr(design.Design, "fit", fail_fit)
+    with pytest.raises(Exception, match="weight type mammen not implemented"):
+        figure_1.regress_diff_in_diff_batch(dependent_ls=["tot_hhspend"], n_wild=9, weight_type="mammen",
+                                            **figure_1.construct_kwargs_dict(df=df))